@@ -0,0 +1,332 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from day_index import ZERO_DATE, days_since_zero_date
+from model_bundle import collect_models, open_bundle, pack_records, record_indices
+from sine_model import evaluate_sinusoids_per_model, history_length
+from weather_store import VALUE_COLUMNS, build_store, open_city
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSETS_DIR = os.path.dirname(BASE_DIR)
+
+DEFAULT_HORIZONS = (1, 2, 3, 7, 14, 30)
+
+
+class ModelSet:
+    """
+    Records of one set of models (a bundle file or a Keras + info directory) /
+    Записи одного набора моделей (файл пакета или директория Keras + информация)
+    """
+
+    def __init__(self, label, records) -> None:
+        self.label = label
+        self.records = records
+
+    @classmethod
+    def load(cls, label, source, info_dir=None):
+        """
+        source is a bundle file or a directory of .keras models; info_dir
+        defaults to the matching model_info directory /
+        source - файл пакета или директория моделей .keras; info_dir по
+        умолчанию - соответствующая директория model_info
+        """
+        if os.path.isfile(source):
+            bundle = open_bundle(source)
+            records = bundle.records.copy()
+            bundle.close()
+            return cls(label, records)
+        if info_dir is None:
+            info_dir = source.rstrip('/').replace('model_keras', 'model_info', 1)
+        return cls(label, pack_records(collect_models(source, info_dir)))
+
+    def keys(self):
+        return {(record['city'].decode('utf-8'), record['parameter'].decode('utf-8'))
+                for record in self.records}
+
+
+def load_observations(store_dir, cities, parameters):
+    """
+    Daily values on one calendar grid (C, P, D) from the weather store, NaN where
+    missing; returns (first_day, values) /
+    Дневные значения на общей календарной сетке (C, P, D) из хранилища погоды,
+    NaN где нет данных; возвращает (first_day, values)
+    """
+    city_stores = [open_city(store_dir, city) for city in cities]
+    days = [city_store.days for city_store in city_stores if len(city_store)]
+    first_day = min(int(city_days[0]) for city_days in days)
+    last_day = max(int(city_days[-1]) for city_days in days)
+
+    values = np.full((len(cities), len(parameters), last_day - first_day + 1), np.nan, dtype=np.float32)
+    for c, city_store in enumerate(city_stores):
+        for p, parameter in enumerate(parameters):
+            if parameter in city_store.meta['columns']:
+                values[c, p, np.asarray(city_store.days) - first_day] = city_store.column(parameter)
+    return first_day, values
+
+
+def history_end_days(denoised_length, first_day, observations):
+    """
+    Last training day of models without a stored end date: the day of row
+    history_length(denoised_length) in the observed history /
+    Последний день обучения моделей без сохраненной даты окончания: день строки
+    history_length(denoised_length) в наблюдаемой истории
+    """
+    counts = np.vectorize(history_length, otypes=[np.int64])(denoised_length)
+    observed = np.cumsum(np.isfinite(observations), axis=-1)
+    # First grid position where the running count reaches the history length /
+    # Первая позиция сетки, где накопленное число строк достигает длины истории
+    position = np.argmax(observed >= counts[..., None], axis=-1)
+    reached = observed[..., -1] >= counts
+    return np.where(reached, first_day + position, first_day + observed.shape[-1] - 1)
+
+
+def origin_days(first_day, observations, start=None, end=None, step=1):
+    """
+    Rolling forecast origins between start and end (dates), by default over
+    the whole history; the last origin leaves room for one observed target /
+    Скользящие точки прогноза между start и end (даты), по умолчанию по всей
+    истории; последняя точка оставляет место для одного наблюдаемого дня
+    """
+    last_day = first_day + observations.shape[-1] - 1
+    start_day = first_day if start is None else days_since_zero_date(start)
+    end_day = last_day - 1 if end is None else min(days_since_zero_date(end), last_day - 1)
+    return np.arange(start_day, end_day + 1, step, dtype=np.int64)
+
+
+def error_metrics(predictions, targets):
+    """
+    MAE, RMSE, bias and count over origins (axis -2), ignoring missing targets /
+    MAE, RMSE, смещение и число точек по точкам прогноза (ось -2) без пропусков
+    """
+    errors = predictions - targets
+    valid = np.isfinite(errors)
+    count = valid.sum(axis=-2)
+    errors = np.where(valid, errors, 0.0)
+
+    def mean(values):
+        total = values.sum(axis=-2)
+        return np.divide(total, count, out=np.full(total.shape, np.nan), where=count > 0)
+
+    return {
+        'mae': mean(np.abs(errors)),
+        'rmse': np.sqrt(mean(np.square(errors))),
+        'bias': mean(errors),
+        'count': count
+    }
+
+
+def backtest(model_set, cities, parameters, first_day, observations, origins, horizons):
+    """
+    Evaluate every model of a set at every (origin, horizon) in one broadcasted
+    pass. A model maps a calendar day to its input like the enhanced model:
+    day - last training day + denoised_length /
+    Вычислить все модели набора во всех (точка, горизонт) за один проход с
+    broadcast. Модель переводит календарный день во вход как улучшенная модель:
+    день - последний день обучения + denoised_length
+
+    Returns metrics arrays (C, P, H); NaN where a model is missing /
+    Возвращает массивы метрик (C, P, H); NaN, где модели нет
+    """
+    records = model_set.records
+    indices = record_indices(records, cities, parameters)
+    safe = np.maximum(indices, 0)
+    missing = indices < 0
+
+    denoised_length = records['denoised_length'][safe].astype(np.int64)
+    end_day = records['data_end_day'][safe].astype(np.int64)
+    unknown = end_day < 0
+    if unknown.any():
+        end_day = np.where(unknown, history_end_days(denoised_length, first_day, observations), end_day)
+
+    # Target days (O, H) -> model inputs (C, P, O * H) / Целевые дни (O, H) -> входы моделей (C, P, O * H)
+    horizons = np.asarray(horizons, dtype=np.int64)
+    target_days = origins[:, None] + horizons[None, :]
+    inputs = target_days.reshape(-1) - end_day[..., None] + denoised_length[..., None]
+
+    values = evaluate_sinusoids_per_model(records['coefficients'][safe], inputs)
+    values = values * records['std_dev'][safe][..., None].astype(np.float32) \
+        + records['mean'][safe][..., None].astype(np.float32)
+    predictions = values.reshape(indices.shape + target_days.shape)
+
+    positions = target_days - first_day
+    inside = (positions >= 0) & (positions < observations.shape[-1])
+    targets = np.where(inside, observations[..., np.clip(positions, 0, observations.shape[-1] - 1)], np.nan)
+
+    metrics = error_metrics(predictions, targets)
+    for name in ('mae', 'rmse', 'bias'):
+        metrics[name][missing] = np.nan
+    metrics['count'][missing] = 0
+    return metrics
+
+
+def compare_model_sets(model_sets, store_dir, horizons=DEFAULT_HORIZONS, start=None, end=None,
+                       step=1, cities=None, parameters=None):
+    """
+    Backtest several model sets side by side on the same origins and horizons /
+    Сравнить несколько наборов моделей на одних и тех же точках и горизонтах
+
+    Returns a report dict with per city/parameter/horizon metrics of each set /
+    Возвращает отчет с метриками по городам/параметрам/горизонтам каждого набора
+    """
+    keys = set().union(*(model_set.keys() for model_set in model_sets))
+    stored = set(os.listdir(store_dir))
+    if cities is None:
+        cities = sorted({city for city, _ in keys if city in stored})
+    if parameters is None:
+        parameters = [column for column in VALUE_COLUMNS if any(parameter == column for _, parameter in keys)]
+
+    first_day, observations = load_observations(store_dir, cities, parameters)
+    origins = origin_days(first_day, observations, start, end, step)
+
+    start_time = time.perf_counter()
+    metrics = {model_set.label: backtest(model_set, cities, parameters, first_day, observations,
+                                         origins, horizons)
+               for model_set in model_sets}
+    seconds = time.perf_counter() - start_time
+
+    return {
+        'cities': cities,
+        'parameters': parameters,
+        'horizons': list(horizons),
+        'origins': {'first': str(ZERO_DATE + int(origins[0])), 'last': str(ZERO_DATE + int(origins[-1])),
+                    'count': len(origins), 'step': step} if len(origins) else {'count': 0},
+        'seconds': seconds,
+        'metrics': metrics
+    }
+
+
+def overall_mae(report, label):
+    """
+    MAE of a set over every city, parameter and horizon it covers /
+    MAE набора по всем городам, параметрам и горизонтам, которые он покрывает
+    """
+    metrics = report['metrics'][label]
+    valid = metrics['count'] > 0
+    return float(np.sum(metrics['mae'][valid] * metrics['count'][valid]) / max(metrics['count'][valid].sum(), 1))
+
+
+def regressions(report, baseline, candidate, tolerance=0.0):
+    """
+    (city, parameter, horizon, baseline MAE, candidate MAE) where the candidate
+    is worse than the baseline by more than tolerance (relative) /
+    (город, параметр, горизонт, MAE базы, MAE кандидата), где кандидат хуже
+    базы больше чем на tolerance (относительно)
+    """
+    base = report['metrics'][baseline]['mae']
+    new = report['metrics'][candidate]['mae']
+    worse = np.isfinite(base) & np.isfinite(new) & (new > base * (1.0 + tolerance))
+    return [(report['cities'][c], report['parameters'][p], report['horizons'][h],
+             float(base[c, p, h]), float(new[c, p, h]))
+            for c, p, h in zip(*np.nonzero(worse))]
+
+
+def report_rows(report):
+    """Flat rows for JSON / Плоские строки для JSON"""
+    rows = []
+    for label, metrics in report['metrics'].items():
+        for c, city in enumerate(report['cities']):
+            for p, parameter in enumerate(report['parameters']):
+                for h, horizon in enumerate(report['horizons']):
+                    if metrics['count'][c, p, h] == 0:
+                        continue
+                    rows.append({
+                        'models': label,
+                        'city': city,
+                        'parameter': parameter,
+                        'horizon': horizon,
+                        'mae': float(metrics['mae'][c, p, h]),
+                        'rmse': float(metrics['rmse'][c, p, h]),
+                        'bias': float(metrics['bias'][c, p, h]),
+                        'count': int(metrics['count'][c, p, h])
+                    })
+    return rows
+
+
+def print_report(report):
+    labels = list(report['metrics'])
+    print(f"Backtest of {len(labels)} model sets over {report['origins']['count']} origins "
+          f"and horizons {report['horizons']} in {report['seconds'] * 1000:.1f} ms")
+
+    # MAE averaged over horizons per city and parameter / MAE по горизонтам для города и параметра
+    print(f"{'city':<20} {'parameter':<16} " + ' '.join(f"{label:>12}" for label in labels))
+    for c, city in enumerate(report['cities']):
+        for p, parameter in enumerate(report['parameters']):
+            values = [np.nanmean(report['metrics'][label]['mae'][c, p])
+                      if np.isfinite(report['metrics'][label]['mae'][c, p]).any() else np.nan
+                      for label in labels]
+            if np.isfinite(values).any():
+                print(f"{city:<20} {parameter:<16} " + ' '.join(f"{value:>12.3f}" for value in values))
+
+    # MAE per horizon over all models of a set / MAE по горизонтам для всего набора
+    print(f"{'horizon':<37} " + ' '.join(f"{label:>12}" for label in labels))
+    for h, horizon in enumerate(report['horizons']):
+        values = []
+        for label in labels:
+            metrics = report['metrics'][label]
+            count = metrics['count'][..., h]
+            values.append(np.sum(np.where(count > 0, metrics['mae'][..., h], 0.0) * count) / max(count.sum(), 1))
+        print(f"{horizon:<37} " + ' '.join(f"{value:>12.3f}" for value in values))
+    print(f"{'overall':<37} " + ' '.join(f"{overall_mae(report, label):>12.3f}" for label in labels))
+
+
+def main(argv=None):
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Walk-forward backtest of model sets / "
+                                                 "Скользящий бэктест наборов моделей")
+    parser.add_argument('--models', action='append', metavar='LABEL=PATH[:INFO_DIR]',
+                        help="bundle file or Keras directory, repeatable / файл пакета или директория Keras")
+    parser.add_argument('--data-dir', default=os.path.join(ASSETS_DIR, 'or_cities'))
+    parser.add_argument('--store-dir', default=os.path.join(ASSETS_DIR, 'weather_store'))
+    parser.add_argument('--horizons', default=','.join(map(str, DEFAULT_HORIZONS)),
+                        help="comma-separated days ahead / дни вперед через запятую")
+    parser.add_argument('--start', help="first origin date / первая дата прогноза")
+    parser.add_argument('--end', help="last origin date / последняя дата прогноза")
+    parser.add_argument('--step', type=int, default=1, help="days between origins / дней между точками")
+    parser.add_argument('--city', action='append', help="only these cities / только эти города")
+    parser.add_argument('--output', help="JSON report path / путь JSON отчета")
+    parser.add_argument('--baseline', help="label to gate against / метка для сравнения")
+    parser.add_argument('--candidate', help="label that must not regress / метка без ухудшения")
+    parser.add_argument('--tolerance', type=float, default=0.05,
+                        help="allowed relative MAE increase / допустимый относительный рост MAE")
+    args = parser.parse_args(argv)
+
+    specs = args.models or [
+        f"base={os.path.join(BASE_DIR, 'model_keras')}:{os.path.join(BASE_DIR, 'model_info')}",
+        f"fine_tuned={os.path.join(BASE_DIR, 'model_keras_updated')}:{os.path.join(BASE_DIR, 'model_info_updated')}"
+    ]
+    model_sets = []
+    for spec in specs:
+        label, _, source = spec.partition('=')
+        source, _, info_dir = source.partition(':')
+        model_sets.append(ModelSet.load(label, source, info_dir or None))
+
+    build_store(args.data_dir, args.store_dir)
+    horizons = [int(horizon) for horizon in args.horizons.split(',')]
+    report = compare_model_sets(model_sets, args.store_dir, horizons, args.start, args.end,
+                                args.step, args.city)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                **{name: value for name, value in report.items() if name != 'metrics'},
+                'overall_mae': {label: overall_mae(report, label) for label in report['metrics']},
+                'rows': report_rows(report)
+            }, f, indent=2)
+        print(f"Saved backtest report at {args.output}")
+
+    if args.baseline and args.candidate:
+        worse = regressions(report, args.baseline, args.candidate, args.tolerance)
+        for city, parameter, horizon, base_mae, new_mae in worse:
+            print(f"Regression {city} - {parameter} h={horizon}: MAE {base_mae:.3f} -> {new_mae:.3f}")
+        if worse:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from sine_model import NUMBER_OF_SINUSES, read_keras_coefficients, unpack_coefficients
+
+
+def pad_batch(xs, ys):
+    """
+    Stack ragged per-model series into padded (M, N) arrays plus a mask /
+    Собрать ряды разной длины в дополненные массивы (M, N) и маску
+    """
+    number_of_models = len(xs)
+    length = max(len(x) for x in xs)
+    X = np.zeros((number_of_models, length), dtype=np.float32)
+    Y = np.zeros((number_of_models, length), dtype=np.float32)
+    mask = np.zeros((number_of_models, length), dtype=bool)
+    for i, (x, y) in enumerate(zip(xs, ys)):
+        X[i, :len(x)] = np.ravel(x)
+        Y[i, :len(y)] = np.ravel(y)
+        mask[i, :len(x)] = True
+    return X, Y, mask
+
+
+def split_validation(mask, validation_split):
+    """
+    Keras-style split: the last fraction of each model's samples is validation /
+    Разбиение как в Keras: последняя доля выборки каждой модели - валидация
+    """
+    counts = mask.sum(axis=1)
+    split_at = (counts * (1.0 - validation_split)).astype(int)
+    positions = np.arange(mask.shape[1])[None, :]
+    train_mask = mask & (positions < split_at[:, None])
+    val_mask = mask & (positions >= split_at[:, None])
+    return train_mask, val_mask
+
+
+class BatchedSinTrainer:
+    """
+    M independent SinLayer models trained together as one (M, K, 3) kernel /
+    M независимых моделей SinLayer, обучаемых вместе как одно ядро (M, K, 3)
+
+    Adam is applied per model with its own step counter and hyperparameters,
+    so every model follows the same trajectory it would have alone and frozen
+    (early-stopped) models are left untouched /
+    Adam применяется к каждой модели со своим счетчиком шагов и
+    гиперпараметрами, поэтому каждая модель обучается так же, как отдельно, а
+    остановленные модели не изменяются
+    """
+
+    def __init__(self, number_of_models, number_of_sinuses=NUMBER_OF_SINUSES,
+                 learning_rate=0.0005, beta_1=0.9, beta_2=0.999, epsilon=1e-7) -> None:
+        self.number_of_models = number_of_models
+        self.number_of_sinuses = number_of_sinuses
+        self.epsilon = epsilon
+
+        M, K = number_of_models, number_of_sinuses
+        self.kernel = tf.Variable(tf.zeros((M, K, 3)), name="kernel")
+        self.bias = tf.Variable(tf.zeros((M,)), name="bias")
+
+        # Per-model Adam state and hyperparameters / Состояние Adam и гиперпараметры по моделям
+        self.m_kernel = tf.Variable(tf.zeros((M, K, 3)), trainable=False)
+        self.v_kernel = tf.Variable(tf.zeros((M, K, 3)), trainable=False)
+        self.m_bias = tf.Variable(tf.zeros((M,)), trainable=False)
+        self.v_bias = tf.Variable(tf.zeros((M,)), trainable=False)
+        self.steps = tf.Variable(tf.zeros((M,)), trainable=False)
+        self.learning_rate = tf.Variable(tf.zeros((M,)), trainable=False)
+        self.beta_1 = tf.Variable(tf.zeros((M,)), trainable=False)
+        self.beta_2 = tf.Variable(tf.zeros((M,)), trainable=False)
+        self.set_hyperparameters(learning_rate, beta_1, beta_2)
+
+    def set_hyperparameters(self, learning_rate=None, beta_1=None, beta_2=None):
+        """Scalars or (M,) vectors / Скаляры или векторы (M,)"""
+        M = self.number_of_models
+        for variable, value in ((self.learning_rate, learning_rate),
+                                (self.beta_1, beta_1),
+                                (self.beta_2, beta_2)):
+            if value is not None:
+                variable.assign(np.broadcast_to(np.asarray(value, dtype=np.float32), (M,)))
+
+    def reset(self, kernels, biases):
+        """
+        Load new starting weights and clear optimizer state /
+        Загрузить новые начальные веса и сбросить состояние оптимизатора
+        """
+        self.kernel.assign(np.asarray(kernels, dtype=np.float32))
+        self.bias.assign(np.asarray(biases, dtype=np.float32))
+        for slot in (self.m_kernel, self.v_kernel, self.m_bias, self.v_bias, self.steps):
+            slot.assign(tf.zeros_like(slot))
+
+    def get_weights(self):
+        return self.kernel.numpy(), self.bias.numpy()
+
+    @staticmethod
+    def _forward(kernel, bias, x):
+        # (M, B, 1) x (M, 1, K) -> (M, B, K) -> (M, B)
+        amplitudes = kernel[:, None, :, 0]
+        frequencies = kernel[:, None, :, 1]
+        phases = kernel[:, None, :, 2]
+        harmonics = amplitudes * tf.sin(x[:, :, None] * frequencies + phases)
+        return tf.reduce_sum(harmonics, axis=-1) + bias[:, None]
+
+    @staticmethod
+    def _masked_losses(pred, y, mask):
+        count = tf.maximum(tf.reduce_sum(mask, axis=1), 1.0)
+        error = (pred - y) * mask
+        mse = tf.reduce_sum(tf.square(error), axis=1) / count
+        mae = tf.reduce_sum(tf.abs(error), axis=1) / count
+        return mse, mae
+
+    @tf.function
+    def _train_step(self, x, y, mask, active):
+        with tf.GradientTape() as tape:
+            pred = self._forward(self.kernel, self.bias, x)
+            mse, _ = self._masked_losses(pred, y, mask)
+            # Sum of per-model losses keeps the gradients independent /
+            # Сумма потерь моделей сохраняет градиенты независимыми
+            total = tf.reduce_sum(mse)
+        grad_kernel, grad_bias = tape.gradient(total, [self.kernel, self.bias])
+
+        step_mask = active * tf.cast(tf.reduce_sum(mask, axis=1) > 0, tf.float32)
+        steps = self.steps + step_mask
+        self.steps.assign(steps)
+
+        b1, b2 = self.beta_1, self.beta_2
+        safe_steps = tf.maximum(steps, 1.0)
+        alpha = self.learning_rate * tf.sqrt(1.0 - tf.pow(b2, safe_steps)) / (1.0 - tf.pow(b1, safe_steps))
+
+        def adam(variable, grad, m, v, expand):
+            on = tf.reshape(step_mask, expand)
+            beta_1 = tf.reshape(b1, expand)
+            beta_2 = tf.reshape(b2, expand)
+            new_m = beta_1 * m + (1.0 - beta_1) * grad
+            new_v = beta_2 * v + (1.0 - beta_2) * tf.square(grad)
+            m.assign(on * new_m + (1.0 - on) * m)
+            v.assign(on * new_v + (1.0 - on) * v)
+            variable.assign_sub(on * tf.reshape(alpha, expand) * m / (tf.sqrt(v) + self.epsilon))
+
+        adam(self.kernel, grad_kernel, self.m_kernel, self.v_kernel, (-1, 1, 1))
+        adam(self.bias, grad_bias, self.m_bias, self.v_bias, (-1,))
+        return mse
+
+    @tf.function
+    def _evaluate(self, x, y, mask):
+        pred = self._forward(self.kernel, self.bias, x)
+        return self._masked_losses(pred, y, mask)
+
+    def evaluate(self, X, Y, mask):
+        """Per-model (mse, mae) on padded data / (mse, mae) по моделям"""
+        mse, mae = self._evaluate(tf.constant(X, tf.float32), tf.constant(Y, tf.float32),
+                                  tf.constant(mask, tf.float32))
+        return mse.numpy(), mae.numpy()
+
+    def predict(self, x):
+        """Predictions (M, N) for padded inputs (M, N) / Прогнозы (M, N)"""
+        return self._forward(self.kernel, self.bias, tf.constant(x, tf.float32)).numpy()
+
+    def fit(self, X, Y, mask, epochs=50, batch_size=16, validation_split=0.2,
+            patience=10, seed=None, active=None, val_mask=None, restore_best=True):
+        """
+        Mini-batch Adam on all models at once with per-model early stopping on
+        val_loss and restore of the best weights /
+        Мини-батчевый Adam для всех моделей сразу с ранней остановкой по
+        val_loss для каждой модели и восстановлением лучших весов
+
+        batch_size is a scalar or a per-model (M,) vector; a model with a
+        smaller batch takes more, smaller steps per epoch, as it would alone /
+        batch_size - скаляр или вектор (M,) по моделям; модель с меньшим
+        батчем делает за эпоху больше меньших шагов, как при обучении отдельно
+
+        With val_mask given, mask is used as the training mask as is (e.g. for
+        cross-validation folds); restore_best=False keeps the last weights like
+        a plain Keras fit /
+        Если задана val_mask, mask используется как маска обучения без
+        разбиения (например, для фолдов кросс-валидации); restore_best=False
+        оставляет последние веса, как обычный fit в Keras
+
+        Returns a dict with per-model 'best_loss', 'best_epoch', 'epochs' and the
+        monitored 'loss' per epoch (epochs, M) /
+        Возвращает словарь с 'best_loss', 'best_epoch', 'epochs' по моделям и
+        отслеживаемой 'loss' по эпохам (epochs, M)
+        """
+        M = self.number_of_models
+        rng = np.random.default_rng(seed)
+        if val_mask is None:
+            train_mask, val_mask = split_validation(mask, validation_split)
+        else:
+            train_mask = np.asarray(mask, dtype=bool)
+            val_mask = np.asarray(val_mask, dtype=bool)
+        # Models without validation samples monitor their training loss /
+        # Модели без валидационной выборки отслеживают потерю обучения
+        no_val = val_mask.sum(axis=1) == 0
+        monitor_mask = np.where(no_val[:, None], train_mask, val_mask)
+
+        active = np.ones(M, dtype=np.float32) if active is None else np.asarray(active, np.float32)
+        best_loss = np.full(M, np.inf)
+        best_epoch = np.zeros(M, dtype=int)
+        wait = np.zeros(M, dtype=int)
+        epochs_run = np.zeros(M, dtype=int)
+        best_kernel, best_bias = self.get_weights()
+        losses = []
+
+        train_counts = train_mask.sum(axis=1)
+        batch_sizes = np.broadcast_to(np.asarray(batch_size, dtype=np.int64), (M,))
+        steps_per_epoch = max(1, int(np.ceil(train_counts / batch_sizes).max()))
+        width = int(batch_sizes.max())
+
+        for epoch in range(epochs):
+            if not active.any():
+                break
+
+            # Independent shuffle of each model's training rows cut into its own
+            # batches, padded with -1 /
+            # Независимое перемешивание строк каждой модели, разрезанное на ее
+            # батчи и дополненное -1
+            order = np.full((M, steps_per_epoch, width), -1, dtype=np.int64)
+            for i in range(M):
+                rows = rng.permutation(np.flatnonzero(train_mask[i]))
+                size = batch_sizes[i]
+                padded = np.full(steps_per_epoch * size, -1, dtype=np.int64)
+                padded[:len(rows)] = rows
+                order[i, :, :size] = padded.reshape(steps_per_epoch, size)
+
+            for step in range(steps_per_epoch):
+                idx = order[:, step]
+                batch_mask = idx >= 0
+                safe_idx = np.where(batch_mask, idx, 0)
+                self._train_step(
+                    tf.constant(np.take_along_axis(X, safe_idx, axis=1)),
+                    tf.constant(np.take_along_axis(Y, safe_idx, axis=1)),
+                    tf.constant(batch_mask, tf.float32),
+                    tf.constant(active)
+                )
+
+            epochs_run += active.astype(int)
+            monitor_loss, _ = self.evaluate(X, Y, monitor_mask)
+            losses.append(monitor_loss)
+            kernel, bias = self.get_weights()
+
+            improved = (monitor_loss < best_loss) & (active > 0)
+            best_loss[improved] = monitor_loss[improved]
+            best_epoch[improved] = epoch
+            best_kernel[improved] = kernel[improved]
+            best_bias[improved] = bias[improved]
+            wait[improved] = 0
+            wait[~improved & (active > 0)] += 1
+            active[wait >= patience] = 0.0
+
+        if restore_best:
+            self.kernel.assign(best_kernel)
+            self.bias.assign(best_bias)
+        return {'best_loss': best_loss, 'best_epoch': best_epoch, 'epochs': epochs_run,
+                'loss': np.array(losses).reshape(-1, M)}
+
+
+def model_batch_sizes(mask, batch_size=16):
+    """
+    Per-model batch sizes of fine_tune_model: at most half of each series /
+    Размеры батчей по моделям как в fine_tune_model: не больше половины ряда
+    """
+    return np.maximum(1, np.minimum(batch_size, mask.sum(axis=1) // 2))
+
+
+def fine_tune_models_batched(jobs, store_dir=None, number_of_sinuses=NUMBER_OF_SINUSES,
+                             epochs=50, batch_size=16, validation_split=0.2, patience=10,
+                             learning_rate=0.0005, beta_1=0.9, beta_2=0.999, seed=None):
+    """
+    Fine-tune every job from update_models in one stacked graph and return
+    (job, enhanced_model, model_info) like fine_tune_model does /
+    Дообучить все задания update_models в одном общем графе и вернуть
+    (job, enhanced_model, model_info), как fine_tune_model
+    """
+    import fine_tune
+
+    results = []
+    prepared = []
+    kernels, biases, xs, ys = [], [], [], []
+
+    for job in jobs:
+        print(f"\nPreparing {os.path.basename(job['city_file'])} - {job['parameter']}...")
+        X, y, model_info = fine_tune.prepare_fine_tune_data(
+            job['city_file'], job['parameter'], job['info_path'], store_dir=store_dir,
+            statistics_path=job.get('statistics_path')
+        )
+        if X is None:
+            results.append((job, None, None))
+            continue
+
+        # Coefficients straight from the archive, no Keras deserialization /
+        # Коэффициенты напрямую из архива, без десериализации Keras
+        try:
+            kernel, bias = unpack_coefficients(read_keras_coefficients(job['model_path'])[0])
+        except Exception as e:
+            print(f"Error: {e}, using random weights")
+            kernel = np.random.normal(0.0, 0.05, (number_of_sinuses, 3)).astype(np.float32)
+            bias = np.float32(0.0)
+
+        prepared.append((job, model_info))
+        kernels.append(kernel)
+        biases.append(bias)
+        xs.append(X[:, 0] - model_info['denoised_length'])
+        ys.append(y[:, 0])
+
+    if not prepared:
+        return results
+
+    print(f"Fine-tuning {len(prepared)} models in one batch...")
+    trainer = BatchedSinTrainer(len(prepared), number_of_sinuses, learning_rate, beta_1, beta_2)
+    trainer.reset(np.stack(kernels), np.array(biases))
+    X, Y, mask = pad_batch(xs, ys)
+    history = trainer.fit(X, Y, mask, epochs=epochs, batch_size=model_batch_sizes(mask, batch_size),
+                          validation_split=validation_split, patience=patience, seed=seed)
+    new_kernels, new_biases = trainer.get_weights()
+
+    # Split the stack back into individual enhanced models /
+    # Разделить общий тензор обратно на отдельные улучшенные модели
+    for i, (job, model_info) in enumerate(prepared):
+        print(f"{job['city']} - {job['parameter']}: best val_loss {history['best_loss'][i]:.6f} "
+              f"after {history['epochs'][i]} epochs")
+        base_model = fine_tune.recreate_base_model(number_of_sinuses)
+        base_model.set_weights([new_kernels[i], new_biases[i]])
+        enhanced_model = fine_tune.build_enhanced_model(
+            base_model, model_info['denoised_length'], model_info['mean'], model_info['std_dev']
+        )
+        new_info = fine_tune.make_model_info(
+            job['city_file'], job['parameter'],
+            model_info['mean'], model_info['std_dev'], model_info['denoised_length'],
+            fine_tune.window_end_date(job['city_file'], store_dir),
+            model_info.get('normalization')
+        )
+        results.append((job, enhanced_model, new_info))
+
+    return results
@@ -0,0 +1,86 @@
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+
+from hyperparam_search import initial_weights, load_series, prepare_series
+from lstsq_fit import fit_sinusoids
+from sine_model import NUMBER_OF_SINUSES, evaluate_sinusoids, pack_coefficients
+
+PARAMETERS = ['temperature_avg', 'humidity_avg', 'wind_speed_max']
+
+
+def keras_fit(x_train, y_train, number_of_sinuses, epochs):
+    """Notebook training path: FFT init + Adam / Путь обучения ноутбука: FFT + Adam"""
+    from keras.optimizers import Adam
+    from fine_tune import recreate_base_model
+
+    kernel, bias = initial_weights(y_train, number_of_sinuses)
+    model = recreate_base_model(number_of_sinuses)
+    model.compile(optimizer=Adam(learning_rate=0.001, beta_1=0.9, beta_2=0.99), loss='mean_squared_error')
+    model.set_weights([kernel, np.asarray(bias)])
+    model.fit(x_train, y_train, epochs=epochs, verbose=0)
+    new_kernel, new_bias = model.get_weights()
+    return new_kernel, new_bias
+
+
+def mae(kernel, bias, x, y):
+    return float(np.mean(np.abs(evaluate_sinusoids(pack_coefficients(kernel, bias), x) - y)))
+
+
+def run(data_dir, number_of_cities, epochs, refine_steps, holdout, number_of_sinuses):
+    """
+    Fit every (city, parameter) on the first part of the series with both
+    backends and report time and MAE on train and holdout /
+    Подобрать каждую пару (город, параметр) на первой части ряда обоими
+    способами и вывести время и MAE на обучении и отложенной выборке
+    """
+    city_files = sorted(glob.glob(os.path.join(data_dir, '*.csv')))[:number_of_cities]
+    rows = []
+    for city_file in city_files:
+        for parameter in PARAMETERS:
+            _, values = load_series(city_file, parameter)
+            series = None if values is None else prepare_series(values)
+            if series is None:
+                continue
+            x, y = series['x_data'], series['denoised_data']
+            split = int(len(x) * (1.0 - holdout))
+
+            row = {'city': os.path.basename(city_file).replace('.csv', ''), 'parameter': parameter}
+            for backend in ('keras', 'lstsq'):
+                start = time.perf_counter()
+                if backend == 'keras':
+                    kernel, bias = keras_fit(x[:split], y[:split], number_of_sinuses, epochs)
+                else:
+                    kernel, bias = fit_sinusoids(x[:split], y[:split], number_of_sinuses, refine_steps)
+                row[f'{backend}_seconds'] = time.perf_counter() - start
+                row[f'{backend}_train_mae'] = mae(kernel, bias, x[:split], y[:split])
+                row[f'{backend}_holdout_mae'] = mae(kernel, bias, x[split:], y[split:])
+            rows.append(row)
+            print(f"{row['city']:<16} {parameter:<16} "
+                  f"keras {row['keras_seconds']:7.2f}s {row['keras_train_mae']:.4f}/{row['keras_holdout_mae']:.4f}  "
+                  f"lstsq {row['lstsq_seconds']:7.3f}s {row['lstsq_train_mae']:.4f}/{row['lstsq_holdout_mae']:.4f}")
+
+    if rows:
+        print("\nTotal / Итого (seconds, mean train MAE / mean holdout MAE):")
+        for backend in ('keras', 'lstsq'):
+            print(f"  {backend}: {sum(row[f'{backend}_seconds'] for row in rows):.2f}s, "
+                  f"{np.mean([row[f'{backend}_train_mae'] for row in rows]):.4f} / "
+                  f"{np.mean([row[f'{backend}_holdout_mae'] for row in rows]):.4f}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Least squares vs Keras training / Метод наименьших квадратов против Keras"
+    )
+    parser.add_argument('--data-dir', default='../or_cities')
+    parser.add_argument('--cities', type=int, default=3)
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--refine-steps', type=int, default=5)
+    parser.add_argument('--holdout', type=float, default=0.1)
+    args = parser.parse_args()
+
+    run(args.data_dir, args.cities, args.epochs, args.refine_steps, args.holdout, NUMBER_OF_SINUSES)
@@ -0,0 +1,387 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from city_csv import CSV_COLUMNS
+from day_index import ZERO_DATE
+
+# Current fleet: 16 cities with about 2000 days each / Текущий парк: 16 городов примерно по 2000 дней
+BASE_CITIES = 16
+BASE_DAYS = 2000
+PARAMETERS = CSV_COLUMNS[1:]
+RESULTS_VERSION = 1
+# Dimensions a scale multiplies / Измерения, которые умножает масштаб
+DIMENSIONS = ('cities', 'days', 'both')
+# CSV dates are parsed as pandas timestamps, which end in 2262 /
+# Даты CSV разбираются как метки времени pandas, которые заканчиваются в 2262 году
+MAX_DAYS = int((np.datetime64('2262-04-11', 'D') - ZERO_DATE).astype(int))
+
+
+def generate_cities(data_dir, number_of_cities, days=BASE_DAYS, seed=0):
+    """
+    Write synthetic city CSVs with seasonal signals and noise /
+    Записать синтетические CSV городов с сезонным сигналом и шумом
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(data_dir, exist_ok=True)
+    dates = np.datetime_as_string(ZERO_DATE + np.arange(days), unit='D')
+    season = np.sin(np.arange(days) * 2 * np.pi / 365.25)
+    for index in range(number_of_cities):
+        phase = rng.uniform(0, 2 * np.pi)
+        shifted = np.sin(np.arange(days) * 2 * np.pi / 365.25 + phase)
+        columns = [
+            np.round(rng.uniform(0, 20) + rng.uniform(3, 12) * season + rng.normal(0, 2, days), 1),
+            np.round(np.clip(70 + 15 * shifted + rng.normal(0, 8, days), 5, 100)),
+            np.round(np.abs(15 + 5 * shifted + rng.normal(0, 5, days)), 1)
+        ]
+        rows = (','.join([day, *map(str, values)]) for day, *values in zip(dates, *columns))
+        with open(os.path.join(data_dir, f'City{index:05d}.csv'), 'w') as f:
+            f.write(','.join(CSV_COLUMNS) + '\n')
+            f.write('\n'.join(rows) + '\n')
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the pipeline's progress prints / Заглушить вывод прогресса конвейера"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def measure(function, repeat=1):
+    """
+    Best-of-repeat wall and CPU time and the traced peak memory of one stage /
+    Лучшее из повторов время (настенное и CPU) и пиковая память одного этапа
+    """
+    walls, cpus, peak = [], [], 0
+    for _ in range(repeat):
+        tracemalloc.start()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            with quiet():
+                items = function()
+        finally:
+            wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        walls.append(wall)
+        cpus.append(cpu)
+    seconds = min(walls)
+    return {
+        'seconds': seconds,
+        'cpu_seconds': min(cpus),
+        'items': items,
+        'per_item_seconds': seconds / max(items, 1),
+        'peak_bytes': peak,
+        'all_seconds': walls
+    }
+
+
+def base_model_files(context):
+    """
+    Save enhanced models from synthetic coefficients for the model stages /
+    Сохранить улучшенные модели из синтетических коэффициентов для этапов моделей
+    """
+    from fine_tune import build_enhanced_model, make_model_info, recreate_base_model
+
+    rng = np.random.default_rng(1)
+    # 'model_keras' in the path selects the enhanced-model loader /
+    # 'model_keras' в пути выбирает загрузчик улучшенной модели
+    keras_dir = os.path.join(context['work_dir'], 'model_keras')
+    info_dir = os.path.join(context['work_dir'], 'model_info')
+    os.makedirs(keras_dir, exist_ok=True)
+    os.makedirs(info_dir, exist_ok=True)
+
+    jobs = []
+    for city_file, parameter in context['model_sample']:
+        city = os.path.basename(city_file).replace('.csv', '')
+        base_model = recreate_base_model(4)
+        kernel = np.column_stack([rng.uniform(0.1, 1.0, 4), rng.uniform(0.005, 0.05, 4),
+                                  rng.uniform(-3, 3, 4)]).astype(np.float32)
+        base_model.set_weights([kernel, np.float32(0.0)])
+        series = context['series'][(city_file, parameter)]
+        denoised_length = len(series) - max(1, len(series) // 70) + 1
+        model = build_enhanced_model(base_model, denoised_length, float(series.mean()), float(series.std()))
+
+        keras_path = os.path.join(keras_dir, f'{city}_{parameter}.keras')
+        info_path = os.path.join(info_dir, f'{city}_{parameter}_info.json')
+        model.save(keras_path)
+        with open(info_path, 'w') as f:
+            json.dump(make_model_info(city_file, parameter, series.mean(), series.std(), denoised_length), f)
+        jobs.append((city_file, parameter, keras_path, info_path))
+    context['model_jobs'] = jobs
+    context['keras_dir'], context['info_dir'] = keras_dir, info_dir
+    return len(jobs)
+
+
+def scaled_size(scale, dimension='cities', base_days=BASE_DAYS):
+    """(cities, days) of a scale along a dimension / (города, дни) масштаба по измерению"""
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Unknown dimension {dimension}, expected one of {DIMENSIONS}")
+    cities = BASE_CITIES * scale if dimension in ('cities', 'both') else BASE_CITIES
+    days = base_days * scale if dimension in ('days', 'both') else base_days
+    if days > MAX_DAYS:
+        raise ValueError(f"{days} days run past 2262, the last date pandas can parse; "
+                         f"at most {MAX_DAYS} days")
+    return cities, days
+
+
+def run_scale(scale, work_dir, sample_models=3, repeat=1, backend='keras', dimension='cities',
+              base_days=BASE_DAYS):
+    """
+    Generate a dataset of scale x the current fleet and time every stage /
+    Сгенерировать данные в scale раз больше текущего парка и измерить каждый этап
+
+    dimension picks what the scale multiplies: the number of cities, the days
+    of history per city, or both /
+    dimension выбирает, что умножает масштаб: число городов, дни истории
+    каждого города или и то, и другое
+
+    Row-level stages (ingest, parsing, normalization, denoising) run over every
+    city; model stages (save, fine-tune, conversion, loading, inference) run on
+    sample_models models and are compared per item /
+    Построчные этапы (загрузка, разбор, нормализация, сглаживание) выполняются
+    для всех городов; этапы моделей (сохранение, дообучение, конвертация,
+    загрузка, вывод) - на sample_models моделях и сравниваются на элемент
+    """
+    from fine_tune import Normalize, denoise_data, load_and_prepare_new_data
+    from weather_store import build_store
+
+    number_of_cities, days = scaled_size(scale, dimension, base_days)
+    data_dir = os.path.join(work_dir, 'or_cities')
+    store_dir = os.path.join(work_dir, 'weather_store')
+    # The whole generated history / Вся сгенерированная история
+    start = datetime.combine(ZERO_DATE.item(), datetime.min.time())
+    end = datetime.combine((ZERO_DATE + days).item(), datetime.min.time())
+
+    generation_start = time.perf_counter()
+    generate_cities(data_dir, number_of_cities, days)
+    print(f"Scale {scale}x ({dimension}): {number_of_cities} cities x {days} days generated in "
+          f"{time.perf_counter() - generation_start:.1f}s")
+
+    city_files = sorted(os.path.join(data_dir, name) for name in os.listdir(data_dir))
+    context = {'work_dir': work_dir, 'series': {}}
+
+    def ingest():
+        build_store(data_dir, store_dir, force=True)
+        return len(city_files)
+
+    def parse_csv():
+        for city_file in city_files:
+            for parameter in PARAMETERS:
+                data, _ = load_and_prepare_new_data(city_file, parameter, start, end)
+                context['series'][(city_file, parameter)] = data[:, 1]
+        return len(city_files) * len(PARAMETERS)
+
+    def slice_store():
+        for city_file in city_files:
+            for parameter in PARAMETERS:
+                load_and_prepare_new_data(city_file, parameter, start, end, store_dir)
+        return len(city_files) * len(PARAMETERS)
+
+    def normalize():
+        context['normalized'] = {key: Normalize(values.reshape(-1, 1)).normalizeData().flatten()
+                                 for key, values in context['series'].items()}
+        return len(context['normalized'])
+
+    def denoise():
+        for values in context['normalized'].values():
+            denoise_data(values, max(1, len(values) // 70))
+        return len(context['normalized'])
+
+    context['model_sample'] = [(city_file, parameter) for city_file in city_files[:sample_models]
+                               for parameter in PARAMETERS[:1]]
+
+    def fine_tune():
+        from fine_tune import fine_tune_model
+
+        context['tuned'] = []
+        for city_file, parameter, keras_path, info_path in context['model_jobs']:
+            model, _ = fine_tune_model(city_file, parameter, keras_path, info_path,
+                                       store_dir=store_dir, backend=backend)
+            context['tuned'].append(model)
+        return len(context['tuned'])
+
+    def convert():
+        import tensorflow as tf
+
+        context['tflite'] = [tf.lite.TFLiteConverter.from_keras_model(model).convert()
+                             for model in context['tuned']]
+        return len(context['tflite'])
+
+    def load_weights():
+        from fine_tune import load_enhanced_base_weights
+
+        for _, _, keras_path, _ in context['model_jobs']:
+            load_enhanced_base_weights(keras_path)
+        return len(context['model_jobs'])
+
+    def read_coefficients():
+        from sine_model import read_keras_coefficients
+
+        for _, _, keras_path, _ in context['model_jobs']:
+            read_keras_coefficients(keras_path)
+        return len(context['model_jobs'])
+
+    def tflite_invoke():
+        import tensorflow as tf
+
+        days = np.arange(30, dtype=np.float32)
+        for content in context['tflite']:
+            interpreter = tf.lite.Interpreter(model_content=content)
+            interpreter.allocate_tensors()
+            input_index = interpreter.get_input_details()[0]['index']
+            for day in days:
+                interpreter.set_tensor(input_index, np.array([[day]], dtype=np.float32))
+                interpreter.invoke()
+        return len(context['tflite']) * len(days)
+
+    def bundle_forecast():
+        from forecast import ForecastEngine
+        from model_bundle import build_bundle
+
+        bundle_path = os.path.join(work_dir, 'model_bundle.bin')
+        build_bundle(context['keras_dir'], context['info_dir'], bundle_path)
+        engine = ForecastEngine(bundle_path, '2025-05-29')
+        cities = [os.path.basename(city_file).replace('.csv', '') for city_file, _ in context['model_sample']]
+        engine.forecast(cities, PARAMETERS, 0, 30)
+        engine.close()
+        return len(cities) * 30
+
+    stages = [
+        ('ingest', ingest, repeat),
+        ('parse_csv', parse_csv, repeat),
+        ('slice_store', slice_store, repeat),
+        ('normalize', normalize, repeat),
+        ('denoise', denoise, repeat),
+        ('save_models', lambda: base_model_files(context), 1),
+        ('fine_tune', fine_tune, repeat),
+        ('convert', convert, repeat),
+        ('load_weights', load_weights, repeat),
+        ('read_coefficients', read_coefficients, repeat),
+        ('tflite_invoke', tflite_invoke, repeat),
+        ('bundle_forecast', bundle_forecast, repeat)
+    ]
+
+    results = {}
+    for name, function, stage_repeat in stages:
+        results[name] = measure(function, stage_repeat)
+        result = results[name]
+        print(f"  {name:<18} {result['seconds']:>9.3f}s  {result['items']:>6} items  "
+              f"{result['per_item_seconds'] * 1e3:>9.3f} ms/item  peak {result['peak_bytes'] / 2 ** 20:>8.1f} MiB")
+    return {'scale': scale, 'scaled': dimension, 'cities': number_of_cities, 'days': days, 'stages': results}
+
+
+def environment():
+    """Where the numbers come from / Откуда получены числа"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    info = {
+        'commit': commit,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count()
+    }
+    if 'tensorflow' in sys.modules:
+        info['tensorflow'] = sys.modules['tensorflow'].__version__
+    return info
+
+
+def compare(results, baseline, threshold=0.2, noise_floor=0.005):
+    """
+    Stages slower per item than the baseline by more than threshold (relative)
+    and noise_floor seconds (absolute), matched by scale, scaled dimension and
+    size / Этапы, медленнее базы на элемент больше чем на threshold
+    (относительно) и noise_floor секунд (абсолютно), с сопоставлением по
+    масштабу, измерению и размеру
+
+    Returns a list of (scale, stage, baseline, current) per-item seconds /
+    Возвращает список (масштаб, этап, база, текущее) секунд на элемент
+    """
+    def run_key(run):
+        # Results without 'scaled' scaled the cities / Результаты без 'scaled' масштабировали города
+        return run['scale'], run.get('scaled', 'cities'), run['cities'], run['days']
+
+    baseline_runs = {run_key(run): run for run in baseline['runs']}
+    slower = []
+    for run in results['runs']:
+        base_run = baseline_runs.get(run_key(run))
+        if base_run is None:
+            continue
+        for name, stage in run['stages'].items():
+            if name not in base_run['stages']:
+                continue
+            before = base_run['stages'][name]['per_item_seconds']
+            after = stage['per_item_seconds']
+            if after > before * (1.0 + threshold) and \
+                    (after - before) * stage['items'] > noise_floor:
+                slower.append((run['scale'], name, before, after))
+    return slower
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pipeline benchmark on synthetic data / "
+                                                 "Бенчмарк конвейера на синтетических данных")
+    parser.add_argument('--scales', default='1,10,100',
+                        help="dataset sizes relative to 16 cities x --days days / размеры данных")
+    parser.add_argument('--scale-dimension', choices=DIMENSIONS, default='cities',
+                        help="what a scale multiplies / что умножает масштаб")
+    parser.add_argument('--days', type=int, default=BASE_DAYS,
+                        help="days of history per city at 1x / дней истории города при 1x")
+    parser.add_argument('--sample-models', type=int, default=3,
+                        help="models for the model stages / моделей для этапов моделей")
+    parser.add_argument('--repeat', type=int, default=1, help="best-of repeats / лучшее из повторов")
+    parser.add_argument('--backend', choices=['keras', 'lstsq'], default='keras')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', metavar='BASELINE_JSON', help="earlier results / прошлые результаты")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="allowed relative slowdown per item / допустимое относительное замедление")
+    args = parser.parse_args()
+
+    # CPU only and offline / Только CPU и без сети
+    os.environ.setdefault('CUDA_VISIBLE_DEVICES', '-1')
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+
+    scales = [int(scale) for scale in args.scales.split(',')]
+    for scale in scales:
+        try:
+            scaled_size(scale, args.scale_dimension, args.days)
+        except ValueError as e:
+            parser.error(str(e))
+
+    runs = []
+    for scale in scales:
+        with tempfile.TemporaryDirectory(prefix=f'benchmark-{scale}x-') as work_dir:
+            runs.append(run_scale(scale, work_dir, args.sample_models, args.repeat, args.backend,
+                                  args.scale_dimension, args.days))
+
+    results = {'version': RESULTS_VERSION, 'environment': environment(), 'runs': runs}
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved benchmark results at {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        slower = compare(results, baseline, args.threshold)
+        for scale, name, before, after in slower:
+            print(f"Regression at {scale}x ({args.scale_dimension}) {name}: {before * 1e3:.3f} -> {after * 1e3:.3f} ms/item")
+        if slower:
+            sys.exit(1)
+        print(f"No stage slower than {args.threshold:.0%} of {args.compare}")
@@ -0,0 +1,78 @@
+import argparse
+import time
+
+import numpy as np
+
+PARAMETERS = ['temperature_avg', 'humidity_avg', 'wind_speed_max']
+
+
+def synthetic_windows(number_of_models, window_days=31, seed=0):
+    """
+    Random fine-tune windows and starting weights / Случайные окна дообучения и начальные веса
+    """
+    rng = np.random.default_rng(seed)
+    windows = []
+    for _ in range(number_of_models):
+        x = np.arange(window_days + 1, dtype=np.float32)
+        y = (np.sin(x * 0.0172 + rng.uniform(0, 6)) + rng.normal(0, 0.2, len(x))).astype(np.float32)
+        kernel = np.column_stack([rng.uniform(0.1, 1.0, 4), rng.uniform(0.005, 0.05, 4),
+                                  rng.uniform(-3, 3, 4)]).astype(np.float32)
+        windows.append((x, y, kernel, np.float32(0.0)))
+    return windows
+
+
+def keras_fine_tune(x, y, kernel, bias):
+    """Per-model Keras path: build, compile, fit with EarlyStopping / Путь Keras для каждой модели"""
+    import tensorflow as tf
+    from keras.optimizers import Adam
+    from fine_tune import recreate_base_model
+
+    model = recreate_base_model(len(kernel))
+    model.set_weights([kernel, bias])
+    model.compile(optimizer=Adam(learning_rate=0.0005, beta_1=0.9, beta_2=0.999), loss='mse',
+                  metrics=['mae'])
+    model.fit(x.reshape(-1, 1), y.reshape(-1, 1), epochs=50, batch_size=min(16, len(x) // 2),
+              validation_split=0.2, verbose=0,
+              callbacks=[tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience=10,
+                                                          restore_best_weights=True)])
+    return model.get_weights()
+
+
+def run(number_of_models, keras_models, jit_compile):
+    """
+    Time the shared trainer against per-model Keras fits and count traces /
+    Сравнить время общего тренера и отдельных fit в Keras и посчитать трассировки
+    """
+    from sin_trainer import SinTrainer
+
+    windows = synthetic_windows(number_of_models)
+    trainer = SinTrainer(jit_compile=jit_compile)
+
+    times = []
+    for x, y, kernel, bias in windows:
+        start = time.perf_counter()
+        trainer.fit(x, y, kernel, bias, batch_size=min(16, len(x) // 2))
+        times.append(time.perf_counter() - start)
+    rest = times[1:] or times
+    print(f"SinTrainer{' (XLA)' if jit_compile else ''}: {number_of_models} models, "
+          f"traces {trainer.trace_count}, first {times[0] * 1e3:.1f} ms, "
+          f"then {np.mean(rest) * 1e3:.2f} ms per model")
+
+    if keras_models:
+        times = []
+        for x, y, kernel, bias in windows[:keras_models]:
+            start = time.perf_counter()
+            keras_fine_tune(x, y, kernel, bias)
+            times.append(time.perf_counter() - start)
+        print(f"Keras compile/fit: {len(times)} models, {np.mean(times) * 1e3:.1f} ms per model")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fine-tune trainer benchmark / Бенчмарк тренера дообучения")
+    parser.add_argument('--models', type=int, default=60)
+    parser.add_argument('--keras-models', type=int, default=5,
+                        help="Keras fits to time, 0 to skip / число fit в Keras, 0 - пропустить")
+    parser.add_argument('--xla', action='store_true')
+    args = parser.parse_args()
+
+    run(args.models, args.keras_models, args.xla)
@@ -0,0 +1,81 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Wall-time budget of a fast command / Бюджет времени быстрой команды
+BUDGET_SECONDS = 1.0
+
+# Commands that must start fast and the modules they must not import /
+# Команды, которые должны запускаться быстро, и модули, которые им нельзя импортировать
+FAST_COMMANDS = {
+    'forecast': ['tensorflow', 'keras', 'pandas', 'requests'],
+    'backtest': ['tensorflow', 'keras', 'pandas', 'requests'],
+    'serve': ['tensorflow', 'keras', 'pandas', 'requests'],
+    'bundle': ['tensorflow', 'keras', 'pandas', 'requests'],
+    'fetch': ['tensorflow', 'keras', 'pandas', 'requests'],
+    'refresh': ['tensorflow', 'keras', 'pandas', 'requests'],
+    'fleet': ['tensorflow', 'keras', 'pandas', 'requests'],
+    'package': ['tensorflow', 'keras', 'pandas', 'requests'],
+}
+
+
+def startup_seconds(command, repeat=3) -> float:
+    """Best wall time of `cli.py COMMAND --help` / Лучшее время запуска `cli.py COMMAND --help`"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(BASE_DIR, 'cli.py'), command, '--help'],
+                       check=True, stdout=subprocess.DEVNULL, cwd=BASE_DIR)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def imported_modules(command) -> set:
+    """Top-level packages imported by `cli.py COMMAND --help` / Импортированные пакеты верхнего уровня"""
+    completed = subprocess.run([sys.executable, '-X', 'importtime', os.path.join(BASE_DIR, 'cli.py'),
+                                command, '--help'],
+                               check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                               cwd=BASE_DIR)
+    modules = set()
+    for line in completed.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if line.startswith('import time:') and '|' in line:
+            name = line.rsplit('|', 1)[1].strip()
+            modules.add(name.split('.')[0])
+    return modules
+
+
+def check(commands, budget, repeat=3):
+    """
+    Returns a list of failure messages / Возвращает список сообщений об ошибках
+    """
+    failures = []
+    for command in commands:
+        seconds = startup_seconds(command, repeat)
+        heavy = sorted(set(FAST_COMMANDS[command]) & imported_modules(command))
+        print(f"{command:<10} {seconds * 1e3:8.1f} ms  heavy imports: {', '.join(heavy) or '-'}")
+        if seconds > budget:
+            failures.append(f"{command} started in {seconds:.3f}s, budget {budget:.3f}s")
+        if heavy:
+            failures.append(f"{command} imported {', '.join(heavy)}")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Enforce the CLI startup budget / Проверить бюджет запуска CLI")
+    parser.add_argument('--budget', type=float, default=BUDGET_SECONDS,
+                        help="seconds per command / секунд на команду")
+    parser.add_argument('--repeat', type=int, default=3, help="best-of repeats / лучшее из повторов")
+    parser.add_argument('--command', action='append', choices=sorted(FAST_COMMANDS),
+                        help="default: all fast commands / по умолчанию все быстрые команды")
+    args = parser.parse_args()
+
+    failures = check(args.command or list(FAST_COMMANDS), args.budget, args.repeat)
+    for failure in failures:
+        print(failure)
+    if failures:
+        sys.exit(1)
+    print(f"All commands started within {args.budget:.3f}s without heavy imports")
@@ -0,0 +1,108 @@
+import os
+from datetime import date
+
+CSV_COLUMNS = ["date", "temperature_avg", "humidity_avg", "wind_speed_max"]
+
+
+def read_tail(csv_path, min_rows, block_size=4096):
+    """
+    Read the last rows of a city CSV without parsing the whole file /
+    Прочитать последние строки CSV города, не разбирая весь файл
+
+    Returns a list of (byte_offset, fields) for up to min_rows data rows /
+    Возвращает список (смещение_в_байтах, поля) для не более min_rows строк
+    """
+    with open(csv_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        file_size = f.tell()
+        read_size = min(block_size, file_size)
+
+        while True:
+            f.seek(file_size - read_size)
+            chunk = f.read(read_size)
+            lines = chunk.split(b'\n')
+            if read_size < file_size:
+                # First line may be cut in the middle / Первая строка может быть обрезана
+                lines = lines[1:]
+            data_lines = [line for line in lines if line.strip() and not line.startswith(b'date,')]
+            if len(data_lines) > min_rows or read_size == file_size:
+                break
+            read_size = min(file_size, read_size * 2)
+
+    rows = []
+    offset = file_size
+    for line in reversed(chunk.split(b'\n')):
+        offset -= len(line) + 1
+        if not line.strip() or line.startswith(b'date,'):
+            continue
+        rows.append((offset + 1, line.decode('utf-8').rstrip('\r').split(',')))
+        if len(rows) == min_rows:
+            break
+    rows.reverse()
+    return rows
+
+
+def last_stored_date(csv_path):
+    """Last date stored in a city CSV / Последняя дата, сохраненная в CSV города"""
+    if not os.path.exists(csv_path):
+        return None
+    rows = read_tail(csv_path, 1)
+    if not rows:
+        return None
+    return date.fromisoformat(rows[-1][1][0])
+
+
+def refresh_start_date(csv_path, overlap_days=3):
+    """
+    First date that has to be (re)fetched: the overlap window before the last
+    stored day, or the earliest tail row with missing values /
+    Первая дата для (повторной) загрузки: окно перекрытия перед последним днем
+    или самая ранняя строка хвоста с пропущенными значениями
+    """
+    rows = read_tail(csv_path, overlap_days + 30)
+    if not rows:
+        return None, 0
+
+    last_date = date.fromisoformat(rows[-1][1][0])
+    start_index = max(0, len(rows) - overlap_days)
+    for i, (_, fields) in enumerate(rows):
+        if any(value == '' for value in fields[1:]):
+            start_index = min(start_index, i)
+            break
+
+    if start_index < len(rows):
+        offset, fields = rows[start_index]
+        return date.fromisoformat(fields[0]), offset
+
+    # Nothing to overwrite, append after the last day /
+    # Нечего перезаписывать, дописать после последнего дня
+    return date.fromordinal(last_date.toordinal() + 1), os.path.getsize(csv_path)
+
+
+def _format_value(value):
+    return '' if value is None else str(value)
+
+
+def replace_tail(csv_path, offset, rows):
+    """
+    Truncate the CSV at offset and append rows in place /
+    Обрезать CSV по смещению и дописать строки на месте
+    """
+    with open(csv_path, 'r+b') as f:
+        f.seek(offset)
+        f.truncate()
+        if offset > 0:
+            f.seek(offset - 1)
+            if f.read(1) != b'\n':
+                f.write(b'\n')
+        f.write(''.join(','.join(_format_value(v) for v in row) + '\n' for row in rows).encode('utf-8'))
+
+
+def write_rows(csv_path, rows):
+    """Write a new city CSV with header / Записать новый CSV города с заголовком"""
+    tmp_path = csv_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(','.join(CSV_COLUMNS) + '\n')
+        for row in rows:
+            f.write(','.join(_format_value(v) for v in row) + '\n')
+    os.replace(tmp_path, csv_path)
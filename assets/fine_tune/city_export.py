@@ -0,0 +1,185 @@
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from model_bundle import split_model_name
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# CSV column -> output name of the city model / Колонка CSV -> имя выхода модели города
+OUTPUT_NAMES = {
+    'temperature_avg': 'temperature',
+    'humidity_avg': 'humidity',
+    'wind_speed_max': 'wind'
+}
+
+
+def load_enhanced_model(keras_path):
+    """Load a saved enhanced model with its custom layers / Загрузить улучшенную модель"""
+    from tensorflow import keras
+    from fine_tune import DayAdjustmentLayer, DenormalizeLayer, SinLayer
+
+    with keras.utils.custom_object_scope({
+        'SinLayer': SinLayer,
+        'DayAdjustmentLayer': DayAdjustmentLayer,
+        'DenormalizeLayer': DenormalizeLayer
+    }):
+        return keras.models.load_model(keras_path, compile=False)
+
+
+def city_model(models, stacked=False):
+    """
+    All parameter models of one city behind one input with a dynamic batch of
+    days and one named output per parameter (or one stacked output) /
+    Все модели параметров города за одним входом с динамическим батчем дней
+    и именованным выходом на параметр (или одним общим выходом)
+    """
+    from tensorflow import keras
+
+    days = keras.Input(shape=(1,), name='days')
+    # Each sub-model runs its own layers, so the math is the per-parameter model's /
+    # Каждая подмодель выполняет свои слои, поэтому вычисления как у отдельной модели
+    outputs = {name: model(days) for name, model in models.items()}
+    # Legacy .keras models return a one-element list / Старые модели .keras возвращают список из одного элемента
+    outputs = {name: output[0] if isinstance(output, (list, tuple)) else output
+               for name, output in outputs.items()}
+    if stacked:
+        outputs = {'forecast': keras.layers.Concatenate(axis=-1, name='forecast')(list(outputs.values()))}
+    return keras.Model(days, outputs)
+
+
+def convert_city(models, stacked=False) -> bytes:
+    """One TFLite conversion for all parameters of a city / Одна конвертация TFLite на город"""
+    # Same converter path as the per-parameter models / Тот же конвертер, что у моделей параметров
+    converter = tf.lite.TFLiteConverter.from_keras_model(city_model(models, stacked))
+    return converter.convert()
+
+
+def city_models(keras_dir):
+    """
+    {city: {output name: keras path}} of a model directory /
+    {город: {имя выхода: путь keras}} директории моделей
+    """
+    cities = {}
+    for model_file in sorted(os.listdir(keras_dir)):
+        if not model_file.endswith('.keras'):
+            continue
+        city, parameter = split_model_name(model_file[:-len('.keras')])
+        name = OUTPUT_NAMES.get(parameter, parameter)
+        cities.setdefault(city, {})[name] = os.path.join(keras_dir, model_file)
+    return cities
+
+
+def ordered_outputs(paths):
+    """Known parameters first, in OUTPUT_NAMES order / Сначала известные параметры в порядке OUTPUT_NAMES"""
+    return [name for name in OUTPUT_NAMES.values() if name in paths] + \
+        sorted(name for name in paths if name not in OUTPUT_NAMES.values())
+
+
+def export_cities(keras_dir, output_dir, cities=None, stacked=False):
+    """
+    Write {city}.tflite for every (or the given) city of keras_dir /
+    Записать {город}.tflite для всех (или указанных) городов keras_dir
+
+    Returns {city: tflite path} / Возвращает {город: путь tflite}
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    exported = {}
+    for city, paths in city_models(keras_dir).items():
+        if cities is not None and city not in cities:
+            continue
+        ordered = ordered_outputs(paths)
+        models = {name: load_enhanced_model(paths[name]) for name in ordered}
+
+        tflite_path = os.path.join(output_dir, f'{city}.tflite')
+        tmp_path = os.path.join(output_dir, f'.tmp-{os.getpid()}-{city}.tflite')
+        with open(tmp_path, 'wb') as f:
+            f.write(convert_city(models, stacked))
+        os.replace(tmp_path, tflite_path)
+        exported[city] = tflite_path
+        print(f"Saved city TFLite model with outputs {ordered} at {tflite_path}")
+    return exported
+
+
+def run_city_model(tflite_path, days):
+    """
+    {output name: (D,)} from one invoke of a city model / {имя выхода: (D,)} за один вызов
+    """
+    interpreter = tf.lite.Interpreter(model_path=tflite_path)
+    runner = interpreter.get_signature_runner()
+    outputs = runner(days=np.asarray(days, dtype=np.float32).reshape(-1, 1))
+    return {name: np.asarray(values) for name, values in outputs.items()}
+
+
+def run_single_model(tflite_content, days):
+    """
+    Per-day invokes of a per-parameter model, as the app does /
+    Вызовы модели параметра по одному дню, как в приложении
+    """
+    interpreter = tf.lite.Interpreter(model_content=tflite_content)
+    interpreter.allocate_tensors()
+    input_index = interpreter.get_input_details()[0]['index']
+    output_index = interpreter.get_output_details()[0]['index']
+    values = []
+    for day in np.asarray(days, dtype=np.float32):
+        interpreter.set_tensor(input_index, np.array([[day]], dtype=np.float32))
+        interpreter.invoke()
+        values.append(interpreter.get_tensor(output_index)[0, 0])
+    return np.array(values, dtype=np.float32)
+
+
+def verify_city_model(tflite_path, keras_paths, days=None, single_tflite_paths=None):
+    """
+    Check that one invoke of the city model equals the per-parameter TFLite
+    models invoked day by day; per-parameter models are converted from
+    keras_paths unless their .tflite files are given /
+    Проверить, что один вызов модели города равен моделям параметров,
+    вызванным по дням; модели параметров конвертируются из keras_paths, если
+    не заданы их файлы .tflite
+
+    Returns {output name: max abs difference}; raises AssertionError on mismatch /
+    Возвращает {имя выхода: макс. абсолютная разница}; AssertionError при расхождении
+    """
+    days = np.arange(0, 30, dtype=np.float32) if days is None else np.asarray(days, dtype=np.float32)
+    city_outputs = run_city_model(tflite_path, days)
+    stacked = 'forecast' in city_outputs and len(city_outputs) == 1
+
+    differences = {}
+    for position, name in enumerate(ordered_outputs(keras_paths)):
+        keras_path = keras_paths[name]
+        if single_tflite_paths and name in single_tflite_paths:
+            with open(single_tflite_paths[name], 'rb') as f:
+                content = f.read()
+        else:
+            converter = tf.lite.TFLiteConverter.from_keras_model(load_enhanced_model(keras_path))
+            content = converter.convert()
+        expected = run_single_model(content, days)
+        actual = city_outputs['forecast'][:, position] if stacked else city_outputs[name].reshape(-1)
+        differences[name] = float(np.max(np.abs(actual - expected)))
+        if not np.array_equal(actual, expected):
+            raise AssertionError(f"{tflite_path} output {name} differs by {differences[name]}")
+    return differences
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export one TFLite model per city / Экспорт модели TFLite на город")
+    parser.add_argument('--keras-dir', default=os.path.join(BASE_DIR, 'model_keras_updated'))
+    parser.add_argument('--output-dir', default=os.path.join(BASE_DIR, 'model_city_updated'))
+    parser.add_argument('--city', action='append', help="only these cities / только эти города")
+    parser.add_argument('--stacked', action='store_true', help="one (days, P) output / один выход (days, P)")
+    parser.add_argument('--verify', action='store_true',
+                        help="compare with per-parameter models / сравнить с моделями параметров")
+    args = parser.parse_args(argv)
+
+    exported = export_cities(args.keras_dir, args.output_dir, args.city, args.stacked)
+    if args.verify:
+        all_paths = city_models(args.keras_dir)
+        for city, tflite_path in exported.items():
+            print(f"{city}: {verify_city_model(tflite_path, all_paths[city])}")
+
+
+if __name__ == "__main__":
+    main()
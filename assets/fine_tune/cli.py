@@ -0,0 +1,56 @@
+import importlib
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSETS_DIR = os.path.dirname(BASE_DIR)
+
+# Subcommand -> (module, description); a module is imported only when its
+# command runs, so data and forecast commands never load TensorFlow /
+# Подкоманда -> (модуль, описание); модуль импортируется только при запуске
+# своей команды, поэтому команды данных и прогноза не загружают TensorFlow
+COMMANDS = {
+    'fetch': ('get_data', "download history of all cities / загрузить историю всех городов"),
+    'refresh': ('new_data', "append new days to the city CSVs / дописать новые дни в CSV городов"),
+    'train': ('hyperparam_search', "train base models from scratch / обучить базовые модели с нуля"),
+    'fine-tune': ('fine_tune', "fine-tune models on new data / дообучить модели на новых данных"),
+    'fleet': ('fleet', "sharded, resumable fleet update / шардированное обновление парка"),
+    'export': ('city_export', "one TFLite model per city / модель TFLite на город"),
+    'bundle': ('model_bundle', "pack coefficients into one bundle / упаковать коэффициенты в пакет"),
+    'package': ('model_archive', "archives and delta of updated models / архивы и дельта обновленных моделей"),
+    'forecast': ('forecast', "forecast from a bundle / прогноз из пакета"),
+    'serve': ('forecast_service', "forecast HTTP service / HTTP сервис прогнозов"),
+    'backtest': ('backtest', "walk-forward backtest / бэктест со сдвигом"),
+}
+
+
+def usage() -> str:
+    lines = ["usage: cli.py COMMAND [ARGS...]", "", "commands:"]
+    lines += [f"  {name:<10} {description}" for name, (_, description) in COMMANDS.items()]
+    lines += ["", "cli.py COMMAND --help shows the options of a command / показывает параметры команды"]
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage())
+        return 0
+    command, rest = argv[0], argv[1:]
+    if command not in COMMANDS:
+        print(f"Unknown command: {command}\n\n{usage()}", file=sys.stderr)
+        return 2
+
+    # Flat imports from this directory and get_data.py from assets /
+    # Плоские импорты из этой директории и get_data.py из assets
+    for path in (BASE_DIR, ASSETS_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    module = importlib.import_module(COMMANDS[command][0])
+    sys.argv = [f'cli.py {command}'] + rest
+    module.main(rest)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
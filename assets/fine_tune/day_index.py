@@ -0,0 +1,57 @@
+from datetime import date
+
+import numpy as np
+
+# Base date of every day index in the pipeline / Базовая дата всех индексов дней в конвейере
+ZERO_DATE = np.datetime64('2020-01-01', 'D')
+_ONE_DAY = np.timedelta64(1, 'D')
+
+
+def _to_datetime64(values) -> np.ndarray:
+    """
+    Convert strings, datetimes or datetime64 to a datetime64 array in one pass /
+    Преобразовать строки, datetime или datetime64 в массив datetime64 за один проход
+    """
+    if hasattr(values, 'to_numpy'):
+        # pandas Series / Index
+        values = values.to_numpy()
+    array = np.asarray(values)
+
+    if np.issubdtype(array.dtype, np.datetime64):
+        return array
+    if array.dtype.kind in ('U', 'S'):
+        return array.astype('datetime64[s]')
+
+    # Object arrays of str/datetime/Timestamp / Массивы объектов str/datetime/Timestamp
+    try:
+        return array.astype('datetime64[s]')
+    except (TypeError, ValueError):
+        import pandas as pd
+        return pd.to_datetime(array.ravel()).to_numpy().reshape(array.shape)
+
+
+def days_since_zero_date(date_input, fractional=False):
+    """
+    Days from base date 2020-01-01 to the input date(s) /
+    Дни от базовой даты 2020-01-01 до входной даты (дат)
+
+    Accepts a single str/datetime/date or a whole column (list, ndarray, pandas
+    Series) and converts it with one datetime64 operation. Returns int for a
+    scalar and an int64 array for a column; with fractional=True times of day
+    are kept as a fraction of a day (float64) for hourly data /
+    Принимает одну дату str/datetime/date или целую колонку (list, ndarray,
+    pandas Series) и преобразует ее одной операцией datetime64. Возвращает int
+    для скаляра и массив int64 для колонки; при fractional=True время суток
+    сохраняется как доля дня (float64) для почасовых данных
+    """
+    scalar = isinstance(date_input, (str, date, np.datetime64))
+    moments = _to_datetime64([date_input] if scalar else date_input)
+
+    if fractional:
+        days = (moments - ZERO_DATE) / _ONE_DAY
+    else:
+        days = (moments.astype('datetime64[D]') - ZERO_DATE).astype(np.int64)
+
+    if scalar:
+        return days[0].item()
+    return days
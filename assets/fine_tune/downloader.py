@@ -0,0 +1,331 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from city_csv import refresh_start_date, replace_tail, write_rows
+from response_cache import location
+
+ARCHIVE_URL = "https://archive-api.open-meteo.com/v1/archive"
+HISTORY_START_DATE = "2020-01-01"
+
+# CSV column -> Open-Meteo daily variable /
+# Колонка CSV -> дневная переменная Open-Meteo
+DAILY_VARIABLES = {
+    "temperature_avg": "temperature_2m_mean",
+    "humidity_avg": "relative_humidity_2m_mean",
+    "wind_speed_max": "wind_speed_10m_max",
+}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter /
+    Потокобезопасный ограничитель частоты запросов (token bucket)
+    """
+
+    def __init__(self, rate: float, capacity: float = None) -> None:
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until one token is available / Ждать, пока не освободится токен"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# Statuses the API returns when throttling or briefly unavailable /
+# Коды, которые API возвращает при ограничении частоты или кратком сбое
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class RateLimitedRetry(Retry):
+    """
+    Retry that takes a rate limiter token before every repeated request, so
+    retries count against the API rate like first attempts /
+    Повтор, берущий токен ограничителя перед каждым повторным запросом, чтобы
+    повторы учитывались в лимите API как первые попытки
+    """
+
+    def __init__(self, *args, rate_limiter=None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.rate_limiter = rate_limiter
+
+    def new(self, **kwargs) -> 'RateLimitedRetry':
+        # urllib3 copies the retry state on every attempt / urllib3 копирует состояние на каждой попытке
+        retry = super().new(**kwargs)
+        retry.rate_limiter = self.rate_limiter
+        return retry
+
+    def sleep(self, response=None) -> None:
+        super().sleep(response)
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+
+def create_session(pool_size: int = 4, retries: int = 3, backoff_factor: float = 0.5,
+                   rate_limiter=None) -> requests.Session:
+    """
+    Session with keep-alive connection pool; GET requests answered with
+    429/5xx are retried with exponential backoff, honouring Retry-After.
+    Each retry takes a token of rate_limiter, the first attempt is taken by
+    the caller /
+    Сессия с пулом keep-alive соединений; GET запросы с ответом 429/5xx
+    повторяются с экспоненциальной задержкой с учетом Retry-After. Каждый
+    повтор берет токен rate_limiter, первую попытку берет вызывающий
+    """
+    session = requests.Session()
+    retry = RateLimitedRetry(total=retries, backoff_factor=backoff_factor, status_forcelist=RETRY_STATUSES,
+                             allowed_methods=['GET'], respect_retry_after_header=True,
+                             rate_limiter=rate_limiter)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def split_date_range(start_date, end_date, max_days=None):
+    """
+    Split [start_date, end_date] into chunks of at most max_days days /
+    Разбить диапазон дат на части не длиннее max_days дней
+    """
+    start = date.fromisoformat(str(start_date))
+    end = date.fromisoformat(str(end_date))
+    if max_days is None:
+        return [(start.isoformat(), end.isoformat())]
+
+    chunks = []
+    while start <= end:
+        chunk_end = min(end, start + timedelta(days=max_days - 1))
+        chunks.append((start.isoformat(), chunk_end.isoformat()))
+        start = chunk_end + timedelta(days=1)
+    return chunks
+
+
+def response_to_frame(data: dict) -> 'pd.DataFrame':
+    """Convert Open-Meteo JSON to the city CSV layout / Преобразовать JSON Open-Meteo в формат CSV"""
+    import pandas as pd
+
+    daily = data["daily"]
+    frame = {"date": daily["time"]}
+    for column, variable in DAILY_VARIABLES.items():
+        frame[column] = daily[variable]
+    return pd.DataFrame(frame)
+
+
+def response_to_rows(data: dict) -> list:
+    """Convert Open-Meteo JSON to raw CSV rows / Преобразовать JSON Open-Meteo в строки CSV"""
+    daily = data["daily"]
+    columns = [daily["time"]] + [daily[variable] for variable in DAILY_VARIABLES.values()]
+    return [list(row) for row in zip(*columns)]
+
+
+def fetch_responses(session, lat, lon, start_date, end_date, base_url=ARCHIVE_URL,
+                    rate_limiter=None, max_days_per_request=None, timeout=60, cache=None):
+    """
+    Request daily history for one location, in a single request when possible /
+    Запросить дневную историю для одной точки, по возможности одним запросом
+
+    With a ResponseCache, fresh cached responses are used and new raw
+    responses are stored /
+    С ResponseCache используются свежие ответы из кэша, а новые сырые ответы
+    сохраняются
+    """
+    responses = []
+    for chunk_start, chunk_end in split_date_range(start_date, end_date, max_days_per_request):
+        params = {
+            "latitude": lat,
+            "longitude": lon,
+            "start_date": chunk_start,
+            "end_date": chunk_end,
+            "daily": list(DAILY_VARIABLES.values()),
+            "timezone": "auto"
+        }
+        data = None if cache is None else cache.get(params, base_url)
+        if data is None:
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            response = session.get(base_url, params=params, timeout=timeout)
+            response.raise_for_status()
+            data = response.json()
+            if cache is not None:
+                cache.put(params, base_url, response.content)
+        responses.append(data)
+    return responses
+
+
+def fetch_history(session, lat, lon, start_date, end_date, base_url=ARCHIVE_URL,
+                  rate_limiter=None, max_days_per_request=None, timeout=60, cache=None):
+    """Fetch daily history as a DataFrame / Загрузить дневную историю в DataFrame"""
+    import pandas as pd
+
+    responses = fetch_responses(session, lat, lon, start_date, end_date, base_url,
+                                rate_limiter, max_days_per_request, timeout, cache)
+    return pd.concat([response_to_frame(data) for data in responses], ignore_index=True)
+
+
+def refresh_city(session, csv_path, lat, lon, end_date, base_url=ARCHIVE_URL,
+                 rate_limiter=None, overlap_days=3, timeout=60, cache=None):
+    """
+    Fetch only the days after the last stored date and replace the tail of the
+    CSV in place; the last overlap_days rows and rows with missing values are
+    fetched again so revised values overwrite stale ones /
+    Загрузить только дни после последней сохраненной даты и заменить хвост CSV
+    на месте; последние overlap_days строк и строки с пропусками загружаются
+    повторно, чтобы исправленные значения заменили устаревшие
+
+    Returns the number of rows written / Возвращает количество записанных строк
+    """
+    end_date = date.fromisoformat(str(end_date))
+
+    if not os.path.exists(csv_path):
+        responses = fetch_responses(session, lat, lon, HISTORY_START_DATE, end_date.isoformat(),
+                                    base_url, rate_limiter, timeout=timeout, cache=cache)
+        rows = [row for data in responses for row in response_to_rows(data)]
+        write_rows(csv_path, rows)
+        return len(rows)
+
+    fetch_start, offset = refresh_start_date(csv_path, overlap_days)
+    if fetch_start is None or fetch_start > end_date:
+        return 0
+
+    responses = fetch_responses(session, lat, lon, fetch_start.isoformat(), end_date.isoformat(),
+                                base_url, rate_limiter, timeout=timeout, cache=cache)
+
+    # Dedup on date, the latest response wins / Удалить дубликаты по дате, побеждает последний ответ
+    rows_by_date = {}
+    for data in responses:
+        for row in response_to_rows(data):
+            rows_by_date[row[0]] = row
+    rows = [rows_by_date[day] for day in sorted(rows_by_date) if day >= fetch_start.isoformat()]
+
+    replace_tail(csv_path, offset, rows)
+    return len(rows)
+
+
+def _run_per_city(city_coords, max_workers, requests_per_second, job):
+    """
+    Run job(session, rate_limiter, city, lat, lon) for all cities on a thread pool /
+    Выполнить job(session, rate_limiter, city, lat, lon) для всех городов в пуле потоков
+    """
+    rate_limiter = TokenBucket(requests_per_second)
+    results = {}
+
+    with create_session(pool_size=max_workers, rate_limiter=rate_limiter) as session, \
+            ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(job, session, rate_limiter, city, lat, lon): city
+            for city, (lat, lon) in city_coords.items()
+        }
+
+        for future in as_completed(futures):
+            city = futures[future]
+            try:
+                results[city] = future.result()
+            except Exception as e:
+                print(f"Error for {city}: {e}")
+                results[city] = e
+
+    return results
+
+
+def download_cities(city_coords, output_dir, start_date, end_date, base_url=ARCHIVE_URL,
+                    max_workers=4, requests_per_second=5.0, max_days_per_request=None,
+                    timeout=60, cache=None):
+    """
+    Download history for all cities concurrently and write each CSV as soon as
+    the city is finished /
+    Параллельно загрузить историю всех городов и записывать CSV каждого города
+    сразу после его завершения
+
+    Returns a dict city -> CSV path; for failed cities the value is the exception /
+    Возвращает словарь город -> путь к CSV, для неудачных городов - исключение
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    def job(session, rate_limiter, city, lat, lon):
+        weather_data = fetch_history(session, lat, lon, start_date, end_date, base_url,
+                                     rate_limiter, max_days_per_request, timeout, cache)
+        city_path = os.path.join(output_dir, f"{city}.csv")
+        weather_data.to_csv(city_path, index=False)
+        print(f"{city}: {len(weather_data)} rows saved to {city_path}")
+        return city_path
+
+    return _run_per_city(city_coords, max_workers, requests_per_second, job)
+
+
+def refresh_cities(city_coords, data_dir, end_date=None, base_url=ARCHIVE_URL,
+                   max_workers=4, requests_per_second=5.0, overlap_days=3, timeout=60, cache=None):
+    """
+    Incrementally refresh all city CSVs up to end_date (default: today) /
+    Инкрементально обновить CSV всех городов до end_date (по умолчанию: сегодня)
+
+    Returns a dict city -> number of rows written, or the exception /
+    Возвращает словарь город -> количество записанных строк или исключение
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    if end_date is None:
+        end_date = date.today()
+
+    def job(session, rate_limiter, city, lat, lon):
+        city_path = os.path.join(data_dir, f"{city}.csv")
+        written = refresh_city(session, city_path, lat, lon, end_date, base_url,
+                               rate_limiter, overlap_days, timeout, cache)
+        print(f"{city}: {written} rows refreshed in {city_path}")
+        return written
+
+    return _run_per_city(city_coords, max_workers, requests_per_second, job)
+
+
+def rebuild_cities(city_coords, cache, output_dir, start_date=None, end_date=None, base_url=ARCHIVE_URL):
+    """
+    Offline: write every city CSV from the cached raw responses only, the
+    latest fetch of a day winning /
+    Без сети: записать CSV каждого города только из сохраненных сырых
+    ответов, для каждого дня побеждает последняя загрузка
+
+    Returns a dict city -> number of rows, or a LookupError for cities
+    without cached responses /
+    Возвращает словарь город -> количество строк или LookupError для городов
+    без сохраненных ответов
+    """
+    import json
+
+    os.makedirs(output_dir, exist_ok=True)
+    index = cache.location_index(DAILY_VARIABLES.values(), base_url)
+    results = {}
+    for city, (lat, lon) in city_coords.items():
+        entries = index.get(location(lat, lon))
+        if not entries:
+            results[city] = LookupError(f"No cached responses for {city}")
+            print(f"Error for {city}: {results[city]}")
+            continue
+
+        rows_by_date = {}
+        for entry in entries:
+            for row in response_to_rows(json.loads(cache.load(entry))):
+                rows_by_date[row[0]] = row
+        rows = [rows_by_date[day] for day in sorted(rows_by_date)
+                if (start_date is None or day >= str(start_date)) and (end_date is None or day <= str(end_date))]
+
+        city_path = os.path.join(output_dir, f"{city}.csv")
+        write_rows(city_path, rows)
+        print(f"{city}: {len(rows)} rows rebuilt from {len(entries)} cached responses in {city_path}")
+        results[city] = len(rows)
+    return results
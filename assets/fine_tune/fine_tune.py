@@ -1,24 +1,110 @@
 import tensorflow as tf
 from tensorflow import keras
 from keras import layers
-from keras.optimizers import Adam
 import numpy as np
 import os
 import json
 import pandas as pd
-from datetime import datetime
-import shutil
+from datetime import datetime, timedelta
+import time
+
+import instrumentation
+from city_csv import last_stored_date
+from day_index import ZERO_DATE, days_since_zero_date
+from manifest import (MANIFEST_FILE, code_version, data_slice_hash, file_hash, hash_json,
+                      is_unchanged, load_manifest, manifest_entry, record_update, save_manifest)
+from model_bundle import build_bundle, split_model_name
+from model_archive import package_directories, stage_files
+from sin_trainer import get_trainer
+from sine_model import history_length
+from weather_store import build_store, open_city
+
+# Paths are resolved against this file, not the current directory /
+# Пути отсчитываются от этого файла, а не от текущей директории
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSETS_DIR = os.path.dirname(BASE_DIR)
+
+# Fine-tune on the last month of the incremental store /
+# Тонкая настройка на последнем месяце инкрементального хранилища
+FINE_TUNE_WINDOW_DAYS = 31
+
+# Model parameter names -> CSV columns / Имена параметров моделей -> колонки CSV
+PARAMETER_MAPPING = {
+    "temperature": "temperature_avg",
+    "humidity": "humidity_avg",
+    "wind": "wind_speed_max"
+}
 
 class Normalize:
-    def __init__(self, data: np.ndarray) -> None:
-        self.data: np.ndarray = np.copy(data)
-        self.__mean: np.ndarray = data.mean(axis=0)
-        self.__std_dev: np.ndarray = data.std(axis=0)
+    """
+    Column mean and standard deviation kept as streaming count/mean/M2
+    accumulators, so new rows are merged in O(batch) without the history /
+    Среднее и стандартное отклонение столбцов в виде потоковых накопителей
+    count/mean/M2, поэтому новые строки добавляются за O(batch) без истории
+    """
+
+    def __init__(self, data: np.ndarray = None) -> None:
+        # Kept by reference, not copied / Хранится по ссылке, без копии
+        self.data: np.ndarray = data
+        self.count: int = 0
+        self.m2: np.ndarray = None
+        self.__mean: np.ndarray = None
+        self.__std_dev: np.ndarray = None
+        if data is not None:
+            self.update(data)
+
+    @classmethod
+    def from_statistics(cls, statistics):
+        """Restore from statistics() / Восстановить из statistics()"""
+        normalize_class = cls()
+        normalize_class.count = int(statistics['count'])
+        normalize_class.__mean = np.atleast_1d(np.asarray(statistics['mean'], dtype=float))
+        normalize_class.m2 = np.atleast_1d(np.asarray(statistics['m2'], dtype=float))
+        normalize_class._update_std_dev()
+        return normalize_class
+
+    def statistics(self) -> dict:
+        """JSON-ready accumulators / Накопители для JSON"""
+        return {'count': self.count, 'mean': self.__mean.tolist(), 'm2': self.m2.tolist()}
+
+    def update(self, batch: np.ndarray):
+        """
+        Merge a batch of rows (Chan et al. parallel Welford update) /
+        Добавить пакет строк (параллельное обновление Уэлфорда, Chan et al.)
+        """
+        batch = np.asarray(batch, dtype=float)
+        batch_count = len(batch)
+        if batch_count == 0:
+            return self
+        batch_mean = batch.mean(axis=0)
+        batch_m2 = np.square(batch - batch_mean).sum(axis=0)
+
+        if self.count == 0:
+            self.__mean, self.m2 = batch_mean, batch_m2
+        else:
+            total = self.count + batch_count
+            delta = batch_mean - self.__mean
+            self.__mean = self.__mean + delta * batch_count / total
+            self.m2 = self.m2 + batch_m2 + np.square(delta) * self.count * batch_count / total
+        self.count += batch_count
+        self._update_std_dev()
+        return self
+
+    def _update_std_dev(self):
+        self.__std_dev = np.sqrt(self.m2 / max(self.count, 1))
         # Avoid dividing by zero / Избегать деления на ноль
         self.__std_dev[self.__std_dev == 0] = 1.0
 
-    def normalizeData(self) -> np.ndarray:
-        return (self.data - self.__mean) / self.__std_dev
+    @property
+    def mean(self) -> np.ndarray:
+        return self.__mean
+
+    @property
+    def std_dev(self) -> np.ndarray:
+        return self.__std_dev
+
+    def normalizeData(self, data: np.ndarray = None) -> np.ndarray:
+        return ((self.data if data is None else data) - self.__mean) / self.__std_dev
 
     def DeNormalizeData(self, normalized_data: np.ndarray, axes=None) -> np.ndarray:
         if axes is None:
@@ -31,78 +117,68 @@ def denoise_data(data: np.ndarray, window_size: int) -> np.ndarray:
     return pd.Series(data).rolling(window=window_size).mean().iloc[window_size - 1:].values
 
 
-def days_since_zero_date(date_input):
-    """
-    Calculate days from base date 2020-01-01 to input date /
-    Рассчитать дни от базовой даты 2020-01-01 до входной даты
-    """
-    # Check input type / Проверить тип ввода
-    if isinstance(date_input, str):
-        # Convert string to datetime / Преобразовать строку в datetime
-        date_format = "%Y-%m-%d"
-        date_obj = datetime.strptime(date_input, date_format)
-    else:
-        # Use directly if already datetime / Использовать напрямую если уже datetime
-        date_obj = date_input
-
-    # Base date 2020-01-01 / Базовая дата
-    zero_date = datetime(2020, 1, 1)
-
-    # Calculate days / Рассчитать дни
-    delta = date_obj - zero_date
-    return delta.days
-
-def load_and_prepare_new_data(city_file, parameter, start_date, end_date):
+def load_and_prepare_new_data(city_file, parameter, start_date, end_date, store_dir=None):
     """
     Load and prepare new data for fine-tuning /
     Загрузить и подготовить новые данные для тонкой настройки
+
+    With store_dir the memory-mapped weather store is sliced instead of parsing the CSV /
+    При заданном store_dir вместо разбора CSV используется срез хранилища в памяти
     """
-    # Map parameters from model to new data /
-    # Сопоставить параметры модели с новыми данными
-    parameter_mapping = {
-        "temperature": "temperature_avg",
-        "humidity": "humidity_avg",
-        "wind": "wind_speed_max"
-    }
+    # Map parameter name if needed / Сопоставить имя параметра если нужно
+    actual_param = PARAMETER_MAPPING.get(parameter, parameter)
 
-    # Read CSV file / Прочитать CSV файл
-    df = pd.read_csv(city_file)
+    if store_dir is not None:
+        # Slice the columnar store / Срез колоночного хранилища
+        city_store = open_city(store_dir, os.path.basename(city_file).replace('.csv', ''))
+        if actual_param not in city_store.meta['columns']:
+            print(f"Parameter {actual_param} not found in data")
+            return None, None
 
-    # Convert date format / Преобразовать формат даты
-    df['date'] = pd.to_datetime(df['date'])
+        days, values = city_store.get(
+            actual_param, days_since_zero_date(start_date), days_since_zero_date(end_date)
+        )
+        if len(days) == 0:
+            print(f"No data available between {start_date} and {end_date}")
+            return None, None
 
-    # Filter by date range / Фильтровать по диапазону дат
-    mask = (df['date'] >= start_date) & (df['date'] <= end_date)
-    df = df.loc[mask]
+        data = np.column_stack([days, values]).astype(float)
+        all_dates = pd.Series(ZERO_DATE + np.asarray(days))
+    else:
+        # Read CSV file / Прочитать CSV файл
+        df = pd.read_csv(city_file)
 
-    if len(df) == 0:
-        print(f"No data available between {start_date} and {end_date}")
-        return None, None
+        # Convert date format / Преобразовать формат даты
+        df['date'] = pd.to_datetime(df['date'])
 
-    # Map parameter name if needed / Сопоставить имя параметра если нужно
-    actual_param = parameter
-    if parameter in parameter_mapping:
-        actual_param = parameter_mapping[parameter]
+        # Filter by date range / Фильтровать по диапазону дат
+        mask = (df['date'] >= start_date) & (df['date'] <= end_date)
+        df = df.loc[mask]
 
-    # Check if parameter exists in data / Проверить наличие параметра в данных
-    if actual_param not in df.columns:
-        print(f"Parameter {actual_param} not found in data")
-        return None, None
+        if len(df) == 0:
+            print(f"No data available between {start_date} and {end_date}")
+            return None, None
 
-    # Calculate days from base date / Рассчитать дни от базовой даты
-    df['days'] = df['date'].apply(days_since_zero_date)
+        # Check if parameter exists in data / Проверить наличие параметра в данных
+        if actual_param not in df.columns:
+            print(f"Parameter {actual_param} not found in data")
+            return None, None
 
-    # Prepare data / Подготовить данные
-    data = df[['days', actual_param]].values
+        # Calculate days from base date / Рассчитать дни от базовой даты
+        df['days'] = days_since_zero_date(df['date'])
+
+        # Prepare data / Подготовить данные
+        data = df[['days', actual_param]].values
+        all_dates = df['date'].reset_index(drop=True)
 
     # Handle NaN values / Обработать NaN значения
     if np.isnan(data).any():
         print(f"Data contains NaN values, filtering out...")
         mask = ~np.isnan(data).any(axis=1)
         data = data[mask]
-        dates = df['date'][mask].reset_index(drop=True)
+        dates = all_dates[mask].reset_index(drop=True)
     else:
-        dates = df['date'].reset_index(drop=True)
+        dates = all_dates
 
     if len(data) == 0:
         print(f"No data left after filtering NaN values")
@@ -134,12 +210,13 @@ class SinLayer(layers.Layer):
         super(SinLayer, self).build(input_shape)
 
     def call(self, inputs):
-        result = 0
-        for i in range(self.number_of_sinuses):
-            result += self.kernel[i][0] * tf.sin(
-                self.kernel[i][1] * inputs + self.kernel[i][2]
-            )
-        return result + self.bias
+        # All harmonics in one broadcasted op: (N, 1) x (K,) -> (N, K) /
+        # Все гармоники одной операцией с broadcast: (N, 1) x (K,) -> (N, K)
+        amplitudes = self.kernel[:, 0]
+        frequencies = self.kernel[:, 1]
+        phases = self.kernel[:, 2]
+        harmonics = amplitudes * tf.sin(inputs * frequencies + phases)
+        return tf.reduce_sum(harmonics, axis=-1, keepdims=True) + self.bias
 
     def get_config(self):
         config = super(SinLayer, self).get_config()
@@ -168,6 +245,15 @@ class DayAdjustmentLayer(tf.keras.layers.Layer):
 class DenormalizeLayer(tf.keras.layers.Layer):
     def __init__(self, mean, std_dev, **kwargs):
         super(DenormalizeLayer, self).__init__(**kwargs)
+        self.set_statistics(mean, std_dev)
+
+    def set_statistics(self, mean, std_dev):
+        """
+        Replace the constants, e.g. with merged Normalize statistics; takes
+        effect on the next trace or conversion /
+        Заменить константы, например объединенной статистикой Normalize;
+        действует со следующей трассировки или конвертации
+        """
         self.mean = tf.constant(mean, dtype=tf.float32)
         self.std_dev = tf.constant(std_dev, dtype=tf.float32)
 
@@ -231,41 +317,131 @@ def recreate_base_model(number_of_sinuses=4):
     return model
 
 
-def fine_tune_model(city_file, parameter, base_model_path, info_path, number_of_sinuses=4):
+def window_end_date(city_file, store_dir=None):
+    """Last stored day of a city, the end of its fine-tune window / Последний сохраненный день города"""
+    if store_dir is not None:
+        last_day = open_city(store_dir, os.path.basename(city_file).replace('.csv', '')).last_day()
+        return None if last_day is None else (ZERO_DATE + last_day).item()
+    return last_stored_date(city_file)
+
+
+def stored_statistics(city_file, parameter, model_info, end_date, store_dir=None):
     """
-    Fine-tune model with new data /
-    Тонкая настройка модели с новыми данными
+    (Normalize, last merged day) from the info JSON. Infos written before the
+    accumulators existed are seeded from mean/std_dev and the history length
+    behind denoised_length; their last day is found once in the history /
+    (Normalize, последний учтенный день) из JSON информации. Информация,
+    записанная до появления накопителей, восстанавливается из mean/std_dev и
+    длины истории за denoised_length; последний день ищется один раз в истории
+    """
+    if 'normalization' in model_info:
+        statistics = model_info['normalization']
+        return (Normalize.from_statistics(statistics),
+                days_since_zero_date(statistics['end_date']))
+
+    count = history_length(model_info['denoised_length'])
+    normalize_class = Normalize.from_statistics({
+        'count': count,
+        'mean': model_info['mean'],
+        'm2': model_info['std_dev'] ** 2 * count
+    })
+    history, _ = load_and_prepare_new_data(city_file, parameter, datetime(1900, 1, 1),
+                                           end_date, store_dir)
+    if history is None or len(history) < count:
+        return normalize_class, None
+    return normalize_class, int(history[count - 1, 0])
+
+
+def merge_new_statistics(city_file, parameter, model_info, window_data, start_date, end_date,
+                         store_dir=None):
+    """
+    Stored statistics updated with the rows after their last day: the window
+    rows plus, when the statistics end before the window, the gap between /
+    Сохраненная статистика, дополненная строками после ее последнего дня:
+    строки окна и, если статистика заканчивается раньше окна, промежуток между
+    """
+    normalize_class, end_day = stored_statistics(city_file, parameter, model_info, end_date, store_dir)
+    if end_day is None:
+        # History shorter than the seeded count: keep the stored values /
+        # История короче восстановленного числа строк: оставить сохраненные значения
+        return normalize_class
+
+    window_start_day = days_since_zero_date(start_date)
+    if end_day < window_start_day - 1:
+        gap, _ = load_and_prepare_new_data(city_file, parameter, ZERO_DATE + (end_day + 1),
+                                           start_date - timedelta(days=1), store_dir)
+        if gap is not None:
+            normalize_class.update(gap[:, 1:2])
+
+    new_rows = window_data[window_data[:, 0] > end_day]
+    normalize_class.update(new_rows[:, 1:2])
+    print(f"Merged {len(new_rows)} new rows into normalization statistics "
+          f"(count {normalize_class.count})")
+    return normalize_class
+
+
+def load_model_info(info_path, statistics_path=None):
+    """
+    Info JSON of a model with the normalization accumulators of its last
+    update (statistics_path, the info written by the previous run) when they
+    exist, so only days after them are merged /
+    JSON информации модели с накопителями нормализации ее последнего
+    обновления (statistics_path, информация предыдущего запуска), если они
+    есть, чтобы добавлялись только дни после них
     """
-    print(f"\nStarting fine-tuning for {os.path.basename(city_file)} - {parameter}...")
-
-    # Read model info / Прочитать информацию модели
     with open(info_path, 'r') as f:
         model_info = json.load(f)
+    if statistics_path is not None and os.path.exists(statistics_path):
+        try:
+            with open(statistics_path, 'r') as f:
+                normalization = json.load(f).get('normalization')
+        except (OSError, ValueError):
+            normalization = None
+        if normalization is not None:
+            model_info['normalization'] = normalization
+    return model_info
+
+
+def prepare_fine_tune_data(city_file, parameter, info_path, window_days=FINE_TUNE_WINDOW_DAYS,
+                           store_dir=None, statistics_path=None):
+    """
+    Load the fine-tune window and normalize it with the stored statistics /
+    Загрузить окно тонкой настройки и нормализовать его сохраненной статистикой
+
+    Returns (X, y, model_info) or (None, None, None) /
+    Возвращает (X, y, model_info) или (None, None, None)
+    """
+    # Read model info / Прочитать информацию модели
+    model_info = load_model_info(info_path, statistics_path)
 
     print(f"Model info: {model_info}")
 
-    # Set date range / Установить диапазон дат
-    end_date = datetime(2025, 4, 8)
-    start_date = datetime(2025, 3, 8)
+    # Window ends at the last stored day / Окно заканчивается последним сохраненным днем
+    last_date = window_end_date(city_file, store_dir)
+    if last_date is None:
+        print(f"No data in {city_file}")
+        return None, None, None
+    end_date = datetime.combine(last_date, datetime.min.time())
+    start_date = end_date - timedelta(days=window_days)
 
     # Load new data / Загрузить новые данные
-    new_data, dates = load_and_prepare_new_data(city_file, parameter, start_date, end_date)
+    with instrumentation.stage('load_data'):
+        new_data, dates = load_and_prepare_new_data(city_file, parameter, start_date, end_date, store_dir)
     if new_data is None or len(new_data) < 7:
         print(f"Insufficient new data for {os.path.basename(city_file)} - {parameter}")
-        return None, None
+        return None, None, None
 
     print(f"Loaded {len(new_data)} rows of new data")
 
-    # Normalize new data using old parameters /
-    # Нормализовать новые данные используя старые параметры
-    mean = model_info['mean']
-    std_dev = model_info['std_dev']
-    denoised_length = model_info['denoised_length']
-
-    normalize_class = Normalize(new_data[:, 1].reshape(-1, 1))
-    normalize_class._Normalize__mean = np.array([mean])
-    normalize_class._Normalize__std_dev = np.array([std_dev])
-    normalized_new_data = normalize_class.normalizeData().flatten()
+    # Merge rows newer than the stored statistics and normalize with the result /
+    # Добавить строки новее сохраненной статистики и нормализовать результатом
+    with instrumentation.stage('normalize'):
+        normalize_class = merge_new_statistics(city_file, parameter, model_info, new_data,
+                                               start_date, end_date, store_dir)
+    model_info['mean'] = float(normalize_class.mean[0])
+    model_info['std_dev'] = float(normalize_class.std_dev[0])
+    model_info['normalization'] = dict(normalize_class.statistics(), end_date=last_date.isoformat())
+    normalized_new_data = normalize_class.normalizeData(new_data[:, 1].reshape(-1, 1)).flatten()
 
     # Create training dataset (days -> values) /
     # Создать набор данных для обучения (дни -> значения)
@@ -273,13 +449,14 @@ def fine_tune_model(city_file, parameter, base_model_path, info_path, number_of_
     y = normalized_new_data.reshape(-1, 1)  # Normalized values / Нормализованные значения
 
     print(f"X shape: {X.shape}, y shape: {y.shape}")
+    return X, y, model_info
 
-    # Recreate base model with same structure /
-    # Воссоздать базовую модель с той же структурой
-    base_model = recreate_base_model(number_of_sinuses)
 
-    # Attempt to load weights from saved model /
-    # Попытка загрузить веса из сохраненной модели
+def load_enhanced_base_weights(base_model_path):
+    """
+    Weights of base_model inside a saved enhanced model, or None /
+    Веса base_model внутри сохраненной улучшенной модели или None
+    """
     try:
         # For enhanced_model path / Для пути enhanced_model
         if 'model_keras' in base_model_path:
@@ -297,56 +474,37 @@ def fine_tune_model(city_file, parameter, base_model_path, info_path, number_of_
                     if isinstance(layer, keras.Model):
                         base_model_weights = layer.get_weights()
                         print(f"Found base_model in enhanced_model, weight shapes: {[w.shape for w in base_model_weights]}")
-                        base_model.set_weights(base_model_weights)
-                        break
+                        return base_model_weights
         else:
             # Handle TFLite differently / Обработать TFLite по-другому
             print("Cannot load weights from TFLite, using random weights")
 
     except Exception as e:
         print(f"Error: {e}")
+    return None
 
-    # Compile model with low learning rate for fine-tuning /
-    # Компилировать модель с низкой скоростью обучения для тонкой настройки
-    base_model.compile(
-        optimizer=Adam(learning_rate=0.0005, beta_1=0.9, beta_2=0.999),
-        loss='mse',
-        metrics=['mae']
-    )
-
-    # Fine-tuning / Тонкая настройка
-    print("Starting fine-tuning...")
-    history = base_model.fit(
-        X - denoised_length,  # Adjust X to relative days / Преобразовать X в относительные дни
-        y,
-        epochs=50,
-        batch_size=min(16, len(X) // 2),
-        validation_split=0.2,
-        callbacks=[
-            tf.keras.callbacks.EarlyStopping(
-                monitor='val_loss',
-                patience=10,
-                restore_best_weights=True
-            )
-        ],
-        verbose=1
-    )
-
-    print(f"Fine-tuning completed for {os.path.basename(city_file)} - {parameter}")
-
-    # Create new enhanced model with custom layers /
-    # Создать новую улучшенную модель с пользовательскими слоями
-    print(f"Creating new enhanced model...")
 
-    # Manually create integrated model / Вручную создать интегрированную модель
+def build_enhanced_model(base_model, denoised_length, mean, std_dev):
+    """
+    Input -> DayAdjustmentLayer -> base_model -> DenormalizeLayer -> Output /
+    Вход -> DayAdjustmentLayer -> base_model -> DenormalizeLayer -> Выход
+    """
     input_layer = keras.Input(shape=(1,))
     adjusted_day = DayAdjustmentLayer(denoised_length)(input_layer)
     prediction = base_model(adjusted_day)
     denormalized = DenormalizeLayer(mean, std_dev)(prediction)
-    enhanced_model = keras.Model(inputs=input_layer, outputs=denormalized)
+    return keras.Model(inputs=input_layer, outputs=denormalized)
 
-    # Update model info / Обновить информацию модели
-    new_model_info = {
+
+def make_model_info(city_file, parameter, mean, std_dev, denoised_length, data_end_date=None,
+                    normalization=None):
+    """
+    Info JSON of an updated model; normalization holds the streaming
+    count/mean/M2 accumulators and their last day /
+    Информация JSON обновленной модели; normalization хранит потоковые
+    накопители count/mean/M2 и их последний день
+    """
+    model_info = {
         'mean': float(mean),
         'std_dev': float(std_dev),
         'denoised_length': int(denoised_length),
@@ -354,115 +512,617 @@ def fine_tune_model(city_file, parameter, base_model_path, info_path, number_of_
         'parameter': parameter,
         'updated_date': datetime.now().strftime('%Y-%m-%d')
     }
+    if data_end_date is not None:
+        # Last day of the fine-tune window / Последний день окна тонкой настройки
+        model_info['data_end_date'] = data_end_date.isoformat()
+    if normalization is not None:
+        model_info['normalization'] = normalization
+    return model_info
+
+
+def fine_tune_model(city_file, parameter, base_model_path, info_path, number_of_sinuses=4,
+                    window_days=FINE_TUNE_WINDOW_DAYS, store_dir=None, backend='keras',
+                    jit_compile=False, statistics_path=None):
+    """
+    Fine-tune model with new data /
+    Тонкая настройка модели с новыми данными
+
+    backend='keras' runs Adam epochs (optionally XLA-compiled), backend='lstsq'
+    re-solves amplitudes, phases and bias in closed form with the frequencies
+    of the old model /
+    backend='keras' выполняет эпохи Adam (при желании с компиляцией XLA),
+    backend='lstsq' заново решает амплитуды, фазы и смещение в замкнутой форме
+    с частотами старой модели
+    """
+    print(f"\nStarting fine-tuning for {os.path.basename(city_file)} - {parameter}...")
+
+    X, y, model_info = prepare_fine_tune_data(city_file, parameter, info_path, window_days, store_dir,
+                                              statistics_path)
+    if X is None:
+        return None, None
+
+    mean = model_info['mean']
+    std_dev = model_info['std_dev']
+    denoised_length = model_info['denoised_length']
+
+    # Recreate base model with same structure /
+    # Воссоздать базовую модель с той же структурой
+    base_model = recreate_base_model(number_of_sinuses)
+
+    # Attempt to load weights from saved model /
+    # Попытка загрузить веса из сохраненной модели
+    with instrumentation.stage('load_weights'):
+        base_model_weights = load_enhanced_base_weights(base_model_path)
+    if base_model_weights is not None:
+        base_model.set_weights(base_model_weights)
+
+    if backend == 'lstsq':
+        from lstsq_fit import fine_tune_sinusoids, fit_sinusoids
+
+        print("Starting least-squares fine-tuning...")
+        relative_days = X[:, 0] - denoised_length
+        with instrumentation.stage('fit'):
+            if base_model_weights is not None:
+                kernel, bias = fine_tune_sinusoids(relative_days, y[:, 0], *base_model_weights)
+            else:
+                kernel, bias = fit_sinusoids(relative_days, y[:, 0], number_of_sinuses)
+        base_model.set_weights([kernel, bias])
+    else:
+        # One compiled training loop shared by all jobs of the process /
+        # Один скомпилированный цикл обучения для всех заданий процесса
+        print("Starting fine-tuning...")
+        trainer = get_trainer(number_of_sinuses, len(X), jit_compile)
+        with instrumentation.stage('fit'):
+            kernel, bias, best_loss, epochs_run = trainer.fit(
+                X[:, 0] - denoised_length,  # Adjust X to relative days / Преобразовать X в относительные дни
+                y[:, 0],
+                *base_model.get_weights(),
+                epochs=50,
+                batch_size=min(16, len(X) // 2),
+                validation_split=0.2,
+                patience=10,
+                learning_rate=0.0005,
+                beta_1=0.9,
+                beta_2=0.999
+            )
+        print(f"Best val_loss {best_loss:.6f} after {epochs_run} epochs")
+        base_model.set_weights([kernel, bias])
+
+    print(f"Fine-tuning completed for {os.path.basename(city_file)} - {parameter}")
+
+    # Create new enhanced model with custom layers /
+    # Создать новую улучшенную модель с пользовательскими слоями
+    print(f"Creating new enhanced model...")
+    enhanced_model = build_enhanced_model(base_model, denoised_length, mean, std_dev)
+
+    # Update model info / Обновить информацию модели
+    new_model_info = make_model_info(city_file, parameter, mean, std_dev, denoised_length,
+                                     window_end_date(city_file, store_dir),
+                                     model_info.get('normalization'))
 
     return enhanced_model, new_model_info
 
 
-def update_models():
+def _temporary_path(path):
+    """Sibling temp path keeping the extension / Временный путь рядом с тем же расширением"""
+    directory, file_name = os.path.split(path)
+    return os.path.join(directory, f'.tmp-{os.getpid()}-{file_name}')
+
+
+def save_model_artifacts(enhanced_model, model_info, keras_path, info_path, tflite_path):
+    """
+    Save .keras, .tflite and info JSON of one updated model. Every file is
+    written to a temp path and renamed; the info JSON goes last and marks the
+    job as complete. tflite_path=None skips the per-parameter TFLite model
+    (city export) /
+    Сохранить .keras, .tflite и информацию JSON одной обновленной модели.
+    Каждый файл пишется во временный путь и переименовывается; JSON пишется
+    последним и отмечает задание как завершенное. tflite_path=None пропускает
+    модель TFLite параметра (экспорт по городам)
+    """
+    # Save new Keras model / Сохранить новую модель Keras
+    with instrumentation.stage('save_keras'):
+        tmp_path = _temporary_path(keras_path)
+        enhanced_model.save(tmp_path)
+        os.replace(tmp_path, keras_path)
+    instrumentation.artifact(keras_path, 'save_keras')
+    print(f"Saved new Keras model at {keras_path}")
+
+    # Convert and save TFLite model / Конвертировать и сохранить модель TFLite
+    if tflite_path is not None:
+        with instrumentation.stage('convert_tflite'):
+            converter = tf.lite.TFLiteConverter.from_keras_model(enhanced_model)
+            tflite_model = converter.convert()
+
+        tmp_path = _temporary_path(tflite_path)
+        with open(tmp_path, 'wb') as f:
+            f.write(tflite_model)
+        os.replace(tmp_path, tflite_path)
+        instrumentation.artifact(tflite_path, 'convert_tflite')
+        print(f"Saved new TFLite model at {tflite_path}")
+
+    # Save new model info / Сохранить новую информацию модели
+    tmp_path = _temporary_path(info_path)
+    with open(tmp_path, 'w') as f:
+        json.dump(model_info, f)
+    os.replace(tmp_path, info_path)
+    instrumentation.artifact(info_path, 'save_info')
+    print(f"Saved new model info at {info_path}")
+
+    # Compress for packaging while the job runs / Сжать для упаковки, пока задание выполняется
+    with instrumentation.stage('stage_package'):
+        stage_files([keras_path, tflite_path, info_path])
+
+
+def collect_update_jobs(keras_dir, info_dir, data_dir, manifest=None, statistics_dir=None):
+    """
+    List (city, parameter) models that can be updated /
+    Список моделей (город, параметр), которые можно обновить
+
+    City and parameter come from the manifest entry, then from the info JSON,
+    so names with spaces or underscores are not split apart /
+    Город и параметр берутся из записи манифеста, затем из JSON информации,
+    поэтому имена с пробелами или подчеркиваниями не разрываются
+
+    statistics_dir is the output info directory; the accumulators a previous
+    run saved there are merged forward instead of rescanning the history /
+    statistics_dir - выходная директория информации; накопители, сохраненные
+    там предыдущим запуском, дополняются вместо повторного чтения истории
+    """
+    jobs = []
+    for model_file in sorted(os.listdir(keras_dir)):
+        if model_file.endswith('.keras'):
+            city_param = model_file.replace('.keras', '')
+            info_file = f'{city_param}_info.json'
+
+            # Full paths / Полные пути
+            model_path = os.path.join(keras_dir, model_file)
+            info_path = os.path.join(info_dir, info_file)
+
+            if not os.path.exists(info_path):
+                print(f"Info file {info_path} not found, skipping model")
+                continue
+
+            # Extract city name and parameter / Извлечь название города и параметр
+            entry = manifest_entry(manifest, model_file) if manifest else None
+            if entry is not None:
+                city_name, parameter = entry['city'], entry['parameter']
+            else:
+                with open(info_path, 'r') as f:
+                    city_name, parameter = split_model_name(city_param, json.load(f).get('city'))
+            if not city_name or not parameter:
+                print(f"Invalid file name: {model_file}")
+                continue
+
+            city_file = f'{data_dir}/{city_name}.csv'
+            if not os.path.exists(city_file):
+                print(f"Data file {city_file} not found")
+                continue
+
+            jobs.append({
+                'model_file': model_file,
+                'info_file': info_file,
+                'city': city_name,
+                'parameter': parameter,
+                'model_path': model_path,
+                'info_path': info_path,
+                'statistics_path': None if statistics_dir is None else os.path.join(statistics_dir, info_file),
+                'city_file': city_file
+            })
+    return jobs
+
+
+def job_output_paths(job, new_model_dir, new_info_dir, new_keras_dir, export='model'):
+    """
+    (keras, info, tflite) output paths of a job; with export='city' the
+    TFLite output is the city model in new_model_dir /
+    Пути результатов задания (keras, info, tflite); при export='city'
+    результат TFLite - модель города в new_model_dir
+    """
+    if export == 'city':
+        tflite_path = os.path.join(new_model_dir, f"{job['city']}.tflite")
+    else:
+        tflite_path = os.path.join(new_model_dir, job['model_file'].replace('.keras', '.tflite'))
+    return (
+        os.path.join(new_keras_dir, job['model_file']),
+        os.path.join(new_info_dir, job['info_file']),
+        tflite_path
+    )
+
+
+def save_paths(output_paths, export='model'):
+    """Paths for save_model_artifacts / Пути для save_model_artifacts"""
+    keras_path, info_path, tflite_path = output_paths
+    # City models are exported once per city after training / Модели городов экспортируются после обучения
+    return keras_path, info_path, (None if export == 'city' else tflite_path)
+
+
+def update_hyperparameters(backend='keras', batched=False, number_of_sinuses=4,
+                           window_days=FINE_TUNE_WINDOW_DAYS):
+    """Settings that change the trained models / Настройки, влияющие на обученные модели"""
+    hyperparameters = {
+        'backend': backend,
+        'number_of_sinuses': number_of_sinuses,
+        'window_days': window_days
+    }
+    if backend == 'keras':
+        hyperparameters.update({'batched': batched, 'learning_rate': 0.0005, 'beta_1': 0.9,
+                                'beta_2': 0.999, 'epochs': 50, 'patience': 10,
+                                'validation_split': 0.2})
+    return hyperparameters
+
+
+def job_hashes(job, hyperparameters, code, store_dir=None, window_days=FINE_TUNE_WINDOW_DAYS):
+    """
+    Content hashes of everything a job's output depends on /
+    Хеши содержимого всего, от чего зависит результат задания
+    """
+    last_date = window_end_date(job['city_file'], store_dir)
+    if last_date is None:
+        data = None
+    else:
+        data = data_slice_hash(job['city_file'], PARAMETER_MAPPING.get(job['parameter'], job['parameter']),
+                               last_date - timedelta(days=window_days), last_date, store_dir)
+    return {
+        'data': data,
+        'weights': hash_json([file_hash(job['model_path']), file_hash(job['info_path'])]),
+        'hyperparameters': hash_json(hyperparameters),
+        'code': code
+    }
+
+
+def is_job_complete(job, output_paths, store_dir=None):
+    """
+    Outputs exist, are non-empty and were built from the current data /
+    Результаты существуют, не пусты и построены по текущим данным
+    """
+    keras_path, info_path, tflite_path = output_paths
+    for path in output_paths:
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return False
+    try:
+        with open(info_path, 'r') as f:
+            model_info = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    last_date = window_end_date(job['city_file'], store_dir)
+    return last_date is not None and model_info.get('data_end_date') == last_date.isoformat()
+
+
+def _init_worker(threads_per_worker):
+    """
+    Pin TensorFlow threads so workers do not oversubscribe cores /
+    Ограничить потоки TensorFlow, чтобы процессы не перегружали ядра
+    """
+    os.environ['OMP_NUM_THREADS'] = str(threads_per_worker)
+    tf.config.threading.set_intra_op_parallelism_threads(threads_per_worker)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def _run_update_job(job, output_paths, store_dir, backend='keras', jit_compile=False, instrument=False):
+    """
+    Fine-tune and save one (city, parameter) job inside a worker; with
+    instrument=True the job's stage records travel back in the status /
+    Дообучить и сохранить одно задание (город, параметр) в процессе; при
+    instrument=True записи этапов задания возвращаются в статусе
+    """
+    start = time.perf_counter()
+    status = {'city': job['city'], 'parameter': job['parameter'], 'model_file': job['model_file']}
+    recorder = instrumentation.enable() if instrument else instrumentation.recorder()
+    try:
+        with recorder.job(job['city'], job['parameter']), recorder.stage('job'):
+            updated_model, new_info = fine_tune_model(
+                job['city_file'],
+                job['parameter'],
+                job['model_path'],
+                job['info_path'],
+                number_of_sinuses=4,
+                store_dir=store_dir,
+                backend=backend,
+                jit_compile=jit_compile,
+                statistics_path=job.get('statistics_path')
+            )
+            if updated_model is None:
+                status['status'] = 'no_data'
+            else:
+                save_model_artifacts(updated_model, new_info, *output_paths)
+                status['status'] = 'updated'
+    except Exception as e:
+        status['status'] = 'failed'
+        status['error'] = repr(e)
+    status['seconds'] = time.perf_counter() - start
+    if instrument:
+        status['instrumentation'] = recorder.export()
+    return status
+
+
+def run_jobs_parallel(jobs, new_model_dir, new_info_dir, new_keras_dir, store_dir,
+                      workers, threads_per_worker=1, backend='keras', skip_complete=True,
+                      on_done=None, jit_compile=False, export='model'):
+    """
+    Run update jobs on a process pool; complete jobs are skipped so an
+    interrupted run can be restarted /
+    Выполнить задания в пуле процессов; завершенные задания пропускаются,
+    поэтому прерванный запуск можно перезапустить
+
+    on_done(status) is called in this process as each job finishes /
+    on_done(status) вызывается в этом процессе по завершении каждого задания
+
+    Returns a list of per-job status dicts / Возвращает список статусов заданий
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    statuses = []
+    pending = []
+    for job in jobs:
+        output_paths = job_output_paths(job, new_model_dir, new_info_dir, new_keras_dir, export)
+        if skip_complete and is_job_complete(job, output_paths, store_dir):
+            statuses.append({'city': job['city'], 'parameter': job['parameter'],
+                             'status': 'skipped', 'seconds': 0.0})
+        else:
+            pending.append((job, save_paths(output_paths, export)))
+
+    print(f"Running {len(pending)} jobs on {workers} workers, {len(statuses)} already complete")
+
+    # spawn: TensorFlow is not fork-safe / spawn: TensorFlow небезопасен при fork
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker,
+                             initargs=(threads_per_worker,)) as executor:
+        # Workers record stages only when this process does / Процессы пишут этапы, только если пишет этот
+        instrument = instrumentation.recorder().enabled
+        futures = [executor.submit(_run_update_job, job, output_paths, store_dir, backend, jit_compile,
+                                   instrument)
+                   for job, output_paths in pending]
+        for future in as_completed(futures):
+            status = future.result()
+            instrumentation.recorder().merge(status.pop('instrumentation', None))
+            print(f"{status['city']} - {status['parameter']}: {status['status']} "
+                  f"in {status['seconds']:.2f}s")
+            if on_done is not None:
+                on_done(status)
+            statuses.append(status)
+
+    return statuses
+
+
+def package_updated_models(new_model_dir, new_info_dir, new_keras_dir,
+                           bundle_path=os.path.join(BASE_DIR, 'model_bundle_updated.bin')):
+    """
+    Zip the updated model directories, write a delta of the changed files
+    and build the model bundle /
+    Упаковать директории обновленных моделей в zip, записать дельту
+    измененных файлов и собрать пакет моделей
+    """
+    recorder = instrumentation.recorder()
+
+    # Deterministic zip files from the members staged by the jobs /
+    # Детерминированные zip архивы из файлов, добавленных заданиями
+    package_directories({new_model_dir: new_model_dir,
+                         'model_info_updated': new_info_dir,
+                         'model_keras_updated': new_keras_dir})
+
+    print("Created zip files for updated models")
+
+    # All updated models in one memory-mapped bundle /
+    # Все обновленные модели в одном пакете, отображаемом в память
+    with recorder.stage('bundle'):
+        build_bundle(new_keras_dir, new_info_dir, bundle_path)
+    recorder.artifact(bundle_path, 'bundle')
+
+
+def update_models(batched=False, parallel=0, threads_per_worker=1, backend='keras', force=False,
+                  jit_compile=False, export='model', verify_export=False, report_path=None,
+                  prometheus_path=None):
     """
     Update all models / Обновить все модели
+
+    With batched=True all models are fine-tuned together in one stacked graph;
+    with parallel=N jobs run on N worker processes; backend='lstsq' replaces
+    Adam with the closed-form solver. Jobs whose data slice, base weights,
+    hyperparameters and code hash the same as in the manifest are skipped
+    unless force=True. export='city' writes one multi-output TFLite model per
+    city instead of one per parameter; verify_export compares it with the
+    per-parameter models. With report_path and/or prometheus_path, wall time,
+    CPU time, peak RSS and artifact sizes of every stage are written there as
+    JSON and as a Prometheus textfile /
+    При batched=True все модели дообучаются вместе в одном общем графе;
+    при parallel=N задания выполняются в N процессах; backend='lstsq' заменяет
+    Adam решением в замкнутой форме. Задания с теми же хешами среза данных,
+    базовых весов, гиперпараметров и кода, что в манифесте, пропускаются,
+    если не задан force=True. export='city' записывает одну модель TFLite с
+    несколькими выходами на город вместо модели на параметр; verify_export
+    сравнивает ее с моделями параметров. При report_path и/или prometheus_path
+    время, время CPU, пиковая RSS и размеры файлов каждого этапа записываются
+    туда в JSON и в текстовый файл Prometheus
     """
-    model_dir = 'modelzz'  # Directory for TFLite models / Директория для моделей TFLite
-    info_dir = 'model_info'  # Directory for model info / Директория для информации о моделях
-    keras_dir = 'model_keras'  # Directory for Keras models / Директория для моделей Keras
-    data_dir = 'cities'  # Directory for city data / Директория для данных городов
+    model_dir = os.path.join(BASE_DIR, 'modelzz')  # Directory for TFLite models / Директория для моделей TFLite
+    info_dir = os.path.join(BASE_DIR, 'model_info')  # Directory for model info / Директория для информации о моделях
+    keras_dir = os.path.join(BASE_DIR, 'model_keras')  # Directory for Keras models / Директория для моделей Keras
+    data_dir = os.path.join(ASSETS_DIR, 'or_cities')  # Incremental city data store / Инкрементальное хранилище данных городов
+    store_dir = os.path.join(ASSETS_DIR, 'weather_store')  # Columnar copy of data_dir / Колоночная копия data_dir
 
     # Create directories for new models / Создать директории для новых моделей
-    new_model_dir = 'model_updated'
-    new_info_dir = 'model_info_updated'
-    new_keras_dir = 'model_keras_updated'
+    new_model_dir = os.path.join(BASE_DIR, 'model_city_updated' if export == 'city' else 'model_updated')
+    new_info_dir = os.path.join(BASE_DIR, 'model_info_updated')
+    new_keras_dir = os.path.join(BASE_DIR, 'model_keras_updated')
+    manifest_path = os.path.join(BASE_DIR, MANIFEST_FILE)  # Next to new_info_dir / Рядом с new_info_dir
 
     os.makedirs(new_model_dir, exist_ok=True)
     os.makedirs(new_info_dir, exist_ok=True)
     os.makedirs(new_keras_dir, exist_ok=True)
 
+    # Disabled instrumentation is a no-op / Выключенный сбор ничего не делает
+    recorder = instrumentation.enable() if report_path or prometheus_path else instrumentation.recorder()
+
+    # Parse each city CSV once for all parameters / Разобрать CSV каждого города один раз для всех параметров
+    with recorder.stage('ingest'):
+        build_store(data_dir, store_dir)
+
     # Iterate through all models / Перебрать все модели
     updated_models = []
+    updated_cities = set()
 
     # Prioritize Keras models if available / Отдать приоритет моделям Keras если доступны
     if os.path.exists(keras_dir):
         print(f"Found Keras model directory: {keras_dir}")
-
-        for model_file in os.listdir(keras_dir):
-            if model_file.endswith('.keras'):
-                city_param = model_file.replace('.keras', '')
-                info_file = f'{city_param}_info.json'
-
-                # Full paths / Полные пути
-                model_path = os.path.join(keras_dir, model_file)
-                info_path = os.path.join(info_dir, info_file)
-
-                if not os.path.exists(info_path):
-                    print(f"Info file {info_path} not found, skipping model")
-                    continue
-
-                # Extract city name and parameter / Извлечь название города и параметр
-                parts = city_param.split('_')
-                if len(parts) < 2:
-                    print(f"Invalid file name: {model_file}")
-                    continue
-
-                city_name = parts[0]
-                parameter = parts[1]
-
-                print(f"Updating Keras model for {city_name} - {parameter}")
-
-                # Fine-tune model / Тонкая настройка модели
-                city_file = f'{data_dir}/{city_name}.csv'
-                if not os.path.exists(city_file):
-                    print(f"Data file {city_file} not found")
-                    continue
-
-                updated_model, new_info = fine_tune_model(
-                    city_file,
-                    parameter,
-                    model_path,
-                    info_path,
-                    number_of_sinuses=4  # Number of sines in original model /
-                )
-
-                if updated_model is not None:
-                    # Save new model / Сохранить новую модель
-                    new_model_path = os.path.join(new_keras_dir, model_file)
-                    new_info_path = os.path.join(new_info_dir, info_file)
-                    new_tflite_path = os.path.join(new_model_dir, model_file.replace('.keras', '.tflite'))
-
-                    # Save new Keras model / Сохранить новую модель Keras
-                    updated_model.save(new_model_path)
-                    print(f"Saved new Keras model at {new_model_path}")
-
-                    # Save new model info / Сохранить новую информацию модели
-                    with open(new_info_path, 'w') as f:
-                        json.dump(new_info, f)
-                    print(f"Saved new model info at {new_info_path}")
-
-                    # Convert and save TFLite model / Конвертировать и сохранить модель TFLite
-                    converter = tf.lite.TFLiteConverter.from_keras_model(updated_model)
-                    tflite_model = converter.convert()
-
-                    with open(new_tflite_path, 'wb') as f:
-                        f.write(tflite_model)
-                    print(f"Saved new TFLite model at {new_tflite_path}")
-
-                    updated_models.append(f"{city_name}_{parameter}")
+        manifest = load_manifest(manifest_path)
+        all_jobs = collect_update_jobs(keras_dir, info_dir, data_dir, manifest, new_info_dir)
+
+        # Skip jobs whose inputs did not change / Пропустить задания с неизменными входами
+        hyperparameters = update_hyperparameters(backend, batched and not parallel)
+        code = code_version()
+        hashes = {}
+        jobs = []
+        for job in all_jobs:
+            with recorder.stage('hash_inputs', job['city'], job['parameter']):
+                hashes[job['model_file']] = job_hashes(job, hyperparameters, code, store_dir)
+            output_paths = job_output_paths(job, new_model_dir, new_info_dir, new_keras_dir, export)
+            if not force and is_unchanged(manifest, job['model_file'], hashes[job['model_file']],
+                                          output_paths):
+                continue
+            jobs.append(job)
+
+        if export == 'city':
+            # A city model is stale once any of its models retrains, so an
+            # interrupted run re-exports it /
+            # Модель города устаревает при переобучении любой ее модели,
+            # поэтому прерванный запуск экспортирует ее заново
+            for city in {job['city'] for job in jobs}:
+                city_path = os.path.join(new_model_dir, f'{city}.tflite')
+                if os.path.exists(city_path):
+                    os.remove(city_path)
+        print(f"{len(jobs)} of {len(all_jobs)} models have new inputs"
+              f"{' (forced)' if force else ''}")
+
+        jobs_by_file = {job['model_file']: job for job in jobs}
+
+        def record(job):
+            record_update(manifest, job['model_file'], job['city'], job['parameter'],
+                          hashes[job['model_file']], datetime.now().strftime('%Y-%m-%d'))
+            save_manifest(manifest_path, manifest)
+
+        if parallel:
+            def on_done(status):
+                if status['status'] == 'updated':
+                    record(jobs_by_file[status['model_file']])
+
+            statuses = run_jobs_parallel(jobs, new_model_dir, new_info_dir, new_keras_dir,
+                                         store_dir, parallel, threads_per_worker, backend,
+                                         skip_complete=False, on_done=on_done,
+                                         jit_compile=jit_compile, export=export)
+            results = []
+            for status in sorted(statuses, key=lambda status: -status['seconds']):
+                print(f"  {status['city']} - {status['parameter']}: {status['status']} "
+                      f"({status['seconds']:.2f}s) {status.get('error', '')}")
+                if status['status'] == 'updated':
+                    updated_models.append(f"{status['city']}_{status['parameter']}")
+                    updated_cities.add(status['city'])
+        elif batched and backend == 'keras':
+            from batch_trainer import fine_tune_models_batched
+            with recorder.stage('fit_batched'):
+                results = fine_tune_models_batched(jobs, store_dir=store_dir)
+        else:
+            def run_job(job):
+                with recorder.job(job['city'], job['parameter']):
+                    return (job, *fine_tune_model(
+                        job['city_file'],
+                        job['parameter'],
+                        job['model_path'],
+                        job['info_path'],
+                        number_of_sinuses=4,  # Number of sines in original model /
+                        store_dir=store_dir,
+                        backend=backend,
+                        jit_compile=jit_compile,
+                        statistics_path=job.get('statistics_path')
+                    ))
+
+            results = (run_job(job) for job in jobs)
+
+        for job, updated_model, new_info in results:
+            if updated_model is not None:
+                print(f"Updating Keras model for {job['city']} - {job['parameter']}")
+
+                # Save new model / Сохранить новую модель
+                with recorder.job(job['city'], job['parameter']):
+                    save_model_artifacts(
+                        updated_model,
+                        new_info,
+                        *save_paths(job_output_paths(job, new_model_dir, new_info_dir, new_keras_dir, export),
+                                    export)
+                    )
+                record(job)
+
+                updated_models.append(f"{job['city']}_{job['parameter']}")
+                updated_cities.add(job['city'])
     else:
         print("Keras model directory not found")
 
+    if export == 'city' and updated_cities:
+        # One conversion per city with updated models / Одна конвертация на город с обновленными моделями
+        from city_export import city_models, export_cities, verify_city_model
+
+        with recorder.stage('export_city'):
+            exported = export_cities(new_keras_dir, new_model_dir, updated_cities)
+        for city, tflite_path in exported.items():
+            recorder.artifact(tflite_path, 'export_city', city)
+        if verify_export:
+            all_paths = city_models(new_keras_dir)
+            for city, tflite_path in exported.items():
+                print(f"Verified {city}: {verify_city_model(tflite_path, all_paths[city])}")
+
     # Package updated models / Упаковать обновленные модели
     if updated_models:
         print(f"Successfully updated {len(updated_models)} models:")
         for model in updated_models:
             print(f"  - {model}")
 
-        # Create zip files / Создать zip архивы
-        shutil.make_archive('model_updated', 'zip', new_model_dir)
-        shutil.make_archive('model_info_updated', 'zip', new_info_dir)
-        shutil.make_archive('model_keras_updated', 'zip', new_keras_dir)
-
-        print("Created zip files for updated models")
+        package_updated_models(new_model_dir, new_info_dir, new_keras_dir)
     else:
         print("No models were updated")
 
+    if report_path:
+        recorder.write_json(report_path)
+    if prometheus_path:
+        recorder.write_prometheus(prometheus_path)
+    instrumentation.disable()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fine-tune all models / Дообучить все модели")
+    parser.add_argument('--batched', action='store_true',
+                        help="train all models at once in one stacked graph / обучить все модели сразу")
+    parser.add_argument('--parallel', type=int, default=0, metavar='N',
+                        help="run jobs on N worker processes / выполнять задания в N процессах")
+    parser.add_argument('--threads-per-worker', type=int, default=1,
+                        help="TensorFlow threads per worker / потоков TensorFlow на процесс")
+    parser.add_argument('--backend', choices=['keras', 'lstsq'], default='keras',
+                        help="Adam or closed-form least squares / Adam или метод наименьших квадратов")
+    parser.add_argument('--force', action='store_true',
+                        help="retrain models with unchanged inputs / переобучить модели с неизменными входами")
+    parser.add_argument('--xla', action='store_true',
+                        help="XLA-compile the training loop / компилировать цикл обучения XLA")
+    parser.add_argument('--export', choices=['model', 'city'], default='model',
+                        help="one TFLite per parameter or per city / TFLite на параметр или на город")
+    parser.add_argument('--verify-export', action='store_true',
+                        help="check city models against per-parameter models / "
+                             "проверить модели городов по моделям параметров")
+    parser.add_argument('--report', metavar='PATH',
+                        help="JSON report of stage timings / JSON отчет по времени этапов")
+    parser.add_argument('--prometheus', metavar='PATH',
+                        help="Prometheus textfile-collector file / файл для textfile-collector Prometheus")
+    args = parser.parse_args(argv)
+
+    update_models(batched=args.batched, parallel=args.parallel,
+                  threads_per_worker=args.threads_per_worker, backend=args.backend,
+                  force=args.force, jit_compile=args.xla, export=args.export,
+                  verify_export=args.verify_export, report_path=args.report,
+                  prometheus_path=args.prometheus)
+
 
 if __name__ == "__main__":
-    update_models()
\ No newline at end of file
+    main()
@@ -0,0 +1,376 @@
+import json
+import os
+import socket
+import time
+from datetime import date
+
+from job_queue import DONE, FAILED, PENDING, JobQueue, print_progress, retry_delay
+from manifest import MANIFEST_FILE
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSETS_DIR = os.path.dirname(BASE_DIR)
+
+QUEUE_FILE = os.path.join(BASE_DIR, 'fleet_queue.sqlite')
+CITY = 'city'
+PACKAGE = 'package'
+
+DEFAULT_SETTINGS = {
+    'data_dir': os.path.join(ASSETS_DIR, 'or_cities'),
+    'store_dir': os.path.join(ASSETS_DIR, 'weather_store'),
+    'new_model_dir': os.path.join(BASE_DIR, 'model_updated'),
+    'new_info_dir': os.path.join(BASE_DIR, 'model_info_updated'),
+    'new_keras_dir': os.path.join(BASE_DIR, 'model_keras_updated'),
+    'export': 'model',
+    'backend': 'keras',
+    'refresh': True,
+    'end_date': None,
+    'requests_per_second': 1.0,
+    'cache_dir': os.path.join(ASSETS_DIR, 'response_cache'),
+    'lease_seconds': 900.0,
+    # Shared with update_models, so either skips what the other trained /
+    # Общий с update_models, поэтому каждый пропускает обученное другим
+    'manifest_path': os.path.join(BASE_DIR, MANIFEST_FILE),
+    'force': False
+}
+
+
+class LeaseLost(Exception):
+    """Another worker took over the job / Задание забрал другой процесс"""
+
+
+def worker_name() -> str:
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+def city_payloads(city_coords, keras_dir, info_dir, data_dir, statistics_dir=None):
+    """
+    {city: payload} with the coordinates and the model jobs of every city that
+    has coordinates or models /
+    {город: данные} с координатами и заданиями моделей каждого города, у
+    которого есть координаты или модели
+    """
+    from fine_tune import collect_update_jobs
+
+    payloads = {city: {'coords': list(coords), 'models': []} for city, coords in city_coords.items()}
+    if os.path.exists(keras_dir):
+        for job in collect_update_jobs(keras_dir, info_dir, data_dir, statistics_dir=statistics_dir):
+            payloads.setdefault(job['city'], {'coords': None, 'models': []})['models'].append(job)
+    return payloads
+
+
+def enqueue(queue, run, city_coords, keras_dir=os.path.join(BASE_DIR, 'model_keras'),
+            info_dir=os.path.join(BASE_DIR, 'model_info'), settings=None, max_attempts=3):
+    """
+    Put one job per city and one packaging job of a run into the queue. A run
+    that is already queued keeps its settings and finished jobs /
+    Поставить в очередь задание на каждый город и задание упаковки запуска.
+    Уже поставленный запуск сохраняет свои настройки и завершенные задания
+
+    Returns the settings of the run / Возвращает настройки запуска
+    """
+    settings = queue.create_run(run, dict(DEFAULT_SETTINGS, **(settings or {})))
+    payloads = city_payloads(city_coords, keras_dir, info_dir, settings['data_dir'], settings['new_info_dir'])
+    added = queue.add(run, CITY, payloads, max_attempts)
+    queue.add(run, PACKAGE, {'all': {}}, max_attempts)
+    print(f"Queued {added} new city jobs of run {run} ({len(payloads)} cities)")
+    return settings
+
+
+def run_city_job(queue, job, settings, session=None, rate_limiter=None):
+    """
+    Refresh the CSV, the store and the models of one city. Each finished step
+    is checkpointed, so a retried or taken-over job continues after it /
+    Обновить CSV, хранилище и модели одного города. Каждый завершенный шаг
+    сохраняется, поэтому повторное или перехваченное задание продолжает после него
+
+    Returns {model file: status} / Возвращает {файл модели: состояние}
+    """
+    from fine_tune import (fine_tune_model, is_job_complete, job_hashes, job_output_paths, save_model_artifacts,
+                           save_paths, update_hyperparameters)
+    from manifest import code_version, is_unchanged, load_manifest
+    from weather_store import build_city, is_stale
+
+    city, payload = job['key'], job['payload']
+    checkpoint = job['checkpoint'] or {'models': {}}
+
+    def save_checkpoint():
+        if not queue.save_checkpoint(job, checkpoint, settings['lease_seconds']):
+            raise LeaseLost(city)
+
+    csv_path = os.path.join(settings['data_dir'], f'{city}.csv')
+    if settings['refresh'] and payload['coords'] and 'rows' not in checkpoint:
+        from downloader import refresh_city
+        from response_cache import ResponseCache
+
+        lat, lon = payload['coords']
+        cache = ResponseCache(settings['cache_dir']) if settings.get('cache_dir') else None
+        checkpoint['rows'] = refresh_city(session, csv_path, lat, lon,
+                                          settings['end_date'] or date.today().isoformat(),
+                                          rate_limiter=rate_limiter, cache=cache)
+        save_checkpoint()
+
+    if os.path.exists(csv_path) and is_stale(csv_path, settings['store_dir']):
+        build_city(csv_path, settings['store_dir'])
+
+    # Runs queued before the manifest setting use the default one /
+    # Запуски, поставленные до настройки манифеста, используют манифест по умолчанию
+    manifest_path = settings.get('manifest_path', DEFAULT_SETTINGS['manifest_path'])
+    hyperparameters = update_hyperparameters(settings['backend'])
+    code = code_version()
+
+    statuses = checkpoint['models']
+    for model_job in payload['models']:
+        if model_job['model_file'] in statuses:
+            continue
+        output_paths = job_output_paths(model_job, settings['new_model_dir'], settings['new_info_dir'],
+                                        settings['new_keras_dir'], settings['export'])
+        # After the refresh above, so new days change the data hash /
+        # После обновления выше, чтобы новые дни меняли хеш данных
+        hashes = job_hashes(model_job, hyperparameters, code, settings['store_dir'])
+        if not settings.get('force') and is_unchanged(load_manifest(manifest_path), model_job['model_file'],
+                                                      hashes, output_paths):
+            statuses[model_job['model_file']] = 'unchanged'
+        elif is_job_complete(model_job, output_paths, settings['store_dir']):
+            statuses[model_job['model_file']] = 'skipped'
+        else:
+            updated_model, new_info = fine_tune_model(
+                model_job['city_file'], model_job['parameter'], model_job['model_path'],
+                model_job['info_path'], number_of_sinuses=4, store_dir=settings['store_dir'],
+                backend=settings['backend'], statistics_path=model_job.get('statistics_path')
+            )
+            if updated_model is None:
+                statuses[model_job['model_file']] = 'no_data'
+            else:
+                save_model_artifacts(updated_model, new_info, *save_paths(output_paths, settings['export']))
+                record_model_update(manifest_path, model_job, hashes)
+                statuses[model_job['model_file']] = 'updated'
+        save_checkpoint()
+
+    if settings['export'] == 'city' and 'updated' in statuses.values() and not checkpoint.get('exported'):
+        from city_export import export_cities
+
+        export_cities(settings['new_keras_dir'], settings['new_model_dir'], {city})
+        checkpoint['exported'] = True
+        save_checkpoint()
+    return statuses
+
+
+def record_model_update(manifest_path, model_job, hashes):
+    """
+    Record one trained model in the manifest, re-read first so entries other
+    workers saved meanwhile are kept; a write lost to a concurrent save only
+    costs one retraining /
+    Записать одну обученную модель в манифест, перечитав его, чтобы сохранить
+    записи других процессов; запись, потерянная при одновременном сохранении,
+    стоит лишь одного повторного обучения
+    """
+    from manifest import load_manifest, record_update, save_manifest
+
+    manifest = load_manifest(manifest_path)
+    record_update(manifest, model_job['model_file'], model_job['city'], model_job['parameter'], hashes,
+                  date.today().isoformat())
+    save_manifest(manifest_path, manifest)
+
+
+def run_package_job(queue, run, settings):
+    """
+    Package the run once every city job has finished / Упаковать запуск после всех заданий городов
+    """
+    from fine_tune import package_updated_models
+
+    updated = sum(list((job['result'] or {}).values()).count('updated') for job in queue.jobs(run, CITY, DONE))
+    if updated:
+        package_updated_models(settings['new_model_dir'], settings['new_info_dir'], settings['new_keras_dir'])
+    else:
+        print("No models were updated")
+    return {'updated': updated}
+
+
+def has_waiting_jobs(queue, run, shard=None) -> bool:
+    """
+    Whether this worker may still get a job: an open city job of its shard,
+    or the packaging job once all cities are finished /
+    Может ли процесс еще получить задание: открытое задание города его шарда
+    или задание упаковки после завершения всех городов
+    """
+    if queue.open_count(run, [CITY], shard):
+        return True
+    if queue.open_count(run, [CITY]):
+        # Workers of the other shards package the run / Процессы других шардов упакуют запуск
+        return False
+    return any(job['status'] == PENDING for job in queue.jobs(run, PACKAGE))
+
+
+def work(queue_path, run, shard=None, max_jobs=None, poll_seconds=10.0, progress_every=10):
+    """
+    Claim and run jobs of a run until none are left for this worker; the
+    worker that sees the last city job finish also packages the run /
+    Захватывать и выполнять задания запуска, пока для процесса есть задания;
+    процесс, увидевший завершение последнего задания города, упаковывает запуск
+
+    Returns the number of jobs run / Возвращает количество выполненных заданий
+    """
+    from downloader import TokenBucket, create_session
+
+    worker = worker_name()
+    done = 0
+    with JobQueue(queue_path) as queue:
+        settings = queue.run_settings(run)
+        if settings is None:
+            raise ValueError(f"Run {run} is not queued in {queue_path}")
+        for directory in (settings['new_model_dir'], settings['new_info_dir'], settings['new_keras_dir']):
+            os.makedirs(directory, exist_ok=True)
+
+        # Each worker keeps its own share of the API rate / У каждого процесса своя доля лимита API
+        rate_limiter = TokenBucket(settings['requests_per_second'])
+        with create_session(pool_size=1, rate_limiter=rate_limiter) as session:
+            while max_jobs is None or done < max_jobs:
+                job = queue.claim(run, worker, [CITY], shard, settings['lease_seconds'])
+                if job is None and queue.open_count(run, [CITY]) == 0:
+                    job = queue.claim(run, worker, [PACKAGE], None, settings['lease_seconds'])
+                if job is None:
+                    if not has_waiting_jobs(queue, run, shard):
+                        break
+                    time.sleep(min(poll_seconds, queue.next_wakeup(run) or poll_seconds))
+                    continue
+
+                start = time.perf_counter()
+                try:
+                    if job['kind'] == CITY:
+                        result = run_city_job(queue, job, settings, session, rate_limiter)
+                    else:
+                        result = run_package_job(queue, run, settings)
+                except LeaseLost:
+                    print(f"{job['key']}: lease lost, left to the other worker")
+                    continue
+                except Exception as e:
+                    status = queue.fail(job, repr(e), retry_delay(job['attempts']))
+                    print(f"{job['kind']} {job['key']}: attempt {job['attempts']} failed ({e!r}), {status}")
+                    continue
+
+                queue.complete(job, result)
+                done += 1
+                print(f"{job['kind']} {job['key']}: {summarize(result)} in {time.perf_counter() - start:.2f}s")
+                if done % progress_every == 0:
+                    print_progress(queue.progress(run, CITY))
+    return done
+
+
+def summarize(result) -> str:
+    if not isinstance(result, dict) or 'updated' in result:
+        return json.dumps(result)
+    counts = {}
+    for status in result.values():
+        counts[status] = counts.get(status, 0) + 1
+    return ', '.join(f'{count} {status}' for status, count in sorted(counts.items())) or 'no models'
+
+
+def _work_process(queue_path, run, shard, threads_per_worker):
+    from fine_tune import _init_worker
+
+    _init_worker(threads_per_worker)
+    work(queue_path, run, shard)
+
+
+def run_workers(queue_path, run, workers, shard=None, threads_per_worker=1):
+    """
+    Run several workers of this machine as processes / Запустить несколько процессов этой машины
+    """
+    import multiprocessing
+
+    # spawn: TensorFlow is not fork-safe / spawn: TensorFlow небезопасен при fork
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=_work_process, args=(queue_path, run, shard, threads_per_worker))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+def status(queue_path, run):
+    with JobQueue(queue_path) as queue:
+        for kind in (CITY, PACKAGE):
+            print_progress(queue.progress(run, kind), queue.jobs(run, kind, FAILED))
+
+
+def parse_shard(text):
+    """'index/count' -> (index, count) / 'индекс/количество' -> (индекс, количество)"""
+    if text is None:
+        return None
+    index, count = (int(part) for part in text.split('/'))
+    if not 0 <= index < count:
+        raise ValueError(f"Shard {text} is not index/count with 0 <= index < count")
+    return index, count
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sharded, resumable fleet update / "
+                                                 "Шардированное возобновляемое обновление парка")
+    parser.add_argument('--queue', default=QUEUE_FILE, help="SQLite queue file / файл очереди SQLite")
+    parser.add_argument('--run', default=date.today().isoformat(), help="run label / метка запуска")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    enqueue_parser = commands.add_parser('enqueue', help="queue a run / поставить запуск в очередь")
+    enqueue_parser.add_argument('--coords', default=os.path.join(ASSETS_DIR, 'city_coords.json'))
+    enqueue_parser.add_argument('--keras-dir', default=os.path.join(BASE_DIR, 'model_keras'))
+    enqueue_parser.add_argument('--info-dir', default=os.path.join(BASE_DIR, 'model_info'))
+    enqueue_parser.add_argument('--data-dir', default=DEFAULT_SETTINGS['data_dir'])
+    enqueue_parser.add_argument('--store-dir', default=DEFAULT_SETTINGS['store_dir'])
+    enqueue_parser.add_argument('--export', choices=['model', 'city'], default='model')
+    enqueue_parser.add_argument('--backend', choices=['keras', 'lstsq'], default='keras')
+    enqueue_parser.add_argument('--no-refresh', action='store_true', help="skip downloads / без загрузки")
+    enqueue_parser.add_argument('--end', default=None, help="last date to fetch / последняя дата загрузки")
+    enqueue_parser.add_argument('--requests-per-second', type=float, default=1.0, help="per worker / на процесс")
+    enqueue_parser.add_argument('--cache-dir', default=DEFAULT_SETTINGS['cache_dir'],
+                                help="raw response cache, empty to disable / кэш ответов, пусто - отключить")
+    enqueue_parser.add_argument('--max-attempts', type=int, default=3)
+    enqueue_parser.add_argument('--force', action='store_true',
+                                help="retrain models with unchanged inputs / переобучить модели с неизменными входами")
+
+    work_parser = commands.add_parser('work', help="run jobs / выполнять задания")
+    work_parser.add_argument('--workers', type=int, default=1, help="processes on this machine / процессов")
+    work_parser.add_argument('--threads-per-worker', type=int, default=1)
+    work_parser.add_argument('--shard', default=None, metavar='INDEX/COUNT',
+                             help="only cities of this shard / только города этого шарда")
+
+    commands.add_parser('status', help="progress and failures / прогресс и ошибки")
+    retry_parser = commands.add_parser('retry', help="retry failed jobs / повторить неудачные задания")
+    retry_parser.add_argument('--kind', choices=[CITY, PACKAGE], default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == 'enqueue':
+        with open(args.coords, 'r') as f:
+            city_coords = json.load(f)
+        settings = {
+            'data_dir': args.data_dir,
+            'store_dir': args.store_dir,
+            'new_model_dir': os.path.join(BASE_DIR, 'model_city_updated' if args.export == 'city' else 'model_updated'),
+            'export': args.export,
+            'backend': args.backend,
+            'refresh': not args.no_refresh,
+            'end_date': args.end,
+            'requests_per_second': args.requests_per_second,
+            'cache_dir': args.cache_dir,
+            'force': args.force
+        }
+        with JobQueue(args.queue) as queue:
+            enqueue(queue, args.run, city_coords, args.keras_dir, args.info_dir, settings, args.max_attempts)
+    elif args.command == 'work':
+        shard = parse_shard(args.shard)
+        if args.workers > 1:
+            run_workers(args.queue, args.run, args.workers, shard, args.threads_per_worker)
+        else:
+            work(args.queue, args.run, shard)
+        status(args.queue, args.run)
+    elif args.command == 'status':
+        status(args.queue, args.run)
+    else:
+        with JobQueue(args.queue) as queue:
+            print(f"{queue.retry_failed(args.run, args.kind)} failed jobs queued again")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import os
+from datetime import date
+
+import numpy as np
+
+from day_index import ZERO_DATE, days_since_zero_date
+from model_bundle import open_bundle
+from sine_model import evaluate_sinusoids_per_model
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class ForecastEngine:
+    """
+    Vectorized forecasts for many cities and parameters from one model bundle /
+    Векторизованные прогнозы для многих городов и параметров из одного пакета моделей
+
+    Semantics match the enhanced model: day + denoised_length -> SinLayer ->
+    * std_dev + mean, where day is counted from the last data date /
+    Семантика как у улучшенной модели: день + denoised_length -> SinLayer ->
+    * std_dev + mean, где день отсчитывается от последней даты данных
+    """
+
+    def __init__(self, bundle, last_data_date=None) -> None:
+        self.bundle = open_bundle(bundle) if isinstance(bundle, str) else bundle
+        records = self.bundle.records
+        self.coefficients = records['coefficients']
+        self.mean = records['mean'].astype(np.float32)
+        self.std_dev = records['std_dev'].astype(np.float32)
+        self.denoised_length = records['denoised_length'].astype(np.float32)
+
+        # Models without a stored end date use last_data_date /
+        # Модели без сохраненной даты окончания используют last_data_date
+        end_day = records['data_end_day'].astype(np.int64)
+        if last_data_date is not None:
+            end_day = np.where(end_day < 0, days_since_zero_date(last_data_date), end_day)
+        self.end_day = end_day
+
+    def close(self):
+        self.bundle.close()
+
+    def relative_days(self, indices, start, horizon) -> np.ndarray:
+        """
+        Model input days (C, P, H): an int start is an offset from each model's
+        last data date (as in the app), a date is converted per model /
+        Входные дни моделей (C, P, H): целый start - смещение от последней
+        даты данных каждой модели (как в приложении), дата пересчитывается
+        для каждой модели
+        """
+        steps = np.arange(horizon, dtype=np.int64)
+        if isinstance(start, (str, date, np.datetime64)):
+            end_day = self.end_day[np.maximum(indices, 0)]
+            if (end_day[indices >= 0] < 0).any():
+                raise ValueError("Model without data end date; pass last_data_date")
+            offsets = days_since_zero_date(start) - end_day
+        else:
+            offsets = np.full(indices.shape, int(start), dtype=np.int64)
+        return offsets[..., None] + steps
+
+    def forecast(self, cities, parameters, start=0, horizon=7) -> np.ndarray:
+        """
+        Forecast tensor (C, P, H) in one evaluation; NaN where a model is missing /
+        Тензор прогноза (C, P, H) за одно вычисление; NaN, где модели нет
+        """
+        indices = self.bundle.indices(cities, parameters)
+        safe = np.maximum(indices, 0)
+        days = self.relative_days(indices, start, horizon) + self.denoised_length[safe][..., None]
+
+        values = evaluate_sinusoids_per_model(self.coefficients[safe], days)
+        values = values * self.std_dev[safe][..., None] + self.mean[safe][..., None]
+        values[indices < 0] = np.nan
+        return values
+
+    def forecast_dates(self, start, horizon):
+        """Calendar dates of a horizon starting at a date / Календарные даты горизонта от даты"""
+        first = ZERO_DATE + days_since_zero_date(start)
+        return [(first + step).item() for step in range(horizon)]
+
+
+def forecast(bundle_path, cities, parameters, start=0, horizon=7, last_data_date=None):
+    """One-shot forecast from a bundle file / Разовый прогноз из файла пакета"""
+    engine = ForecastEngine(bundle_path, last_data_date)
+    try:
+        return engine.forecast(cities, parameters, start, horizon)
+    finally:
+        engine.close()
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Forecast from a model bundle / Прогноз из пакета моделей")
+    parser.add_argument('--bundle', default=os.path.join(BASE_DIR, 'model_bundle_updated.bin'))
+    parser.add_argument('--city', action='append', required=True)
+    parser.add_argument('--parameter', action='append',
+                        help="default: all three parameters / по умолчанию все три параметра")
+    parser.add_argument('--start', default='0',
+                        help="days after the last data date or a date / дни после последней даты или дата")
+    parser.add_argument('--horizon', type=int, default=7)
+    parser.add_argument('--last-data-date', default=None,
+                        help="for models without a stored end date / для моделей без даты окончания")
+    parser.add_argument('--json', action='store_true', help="print JSON / вывести JSON")
+    args = parser.parse_args(argv)
+
+    from city_csv import CSV_COLUMNS
+
+    parameters = args.parameter or CSV_COLUMNS[1:]
+    start = int(args.start) if args.start.lstrip('-').isdigit() else args.start
+    values = forecast(args.bundle, args.city, parameters, start, args.horizon, args.last_data_date)
+
+    if args.json:
+        print(json.dumps({'cities': args.city, 'parameters': parameters, 'start': start,
+                          'values': np.where(np.isnan(values), None, np.round(values, 4)).tolist()}))
+        return
+    for c, city in enumerate(args.city):
+        for p, parameter in enumerate(parameters):
+            print(f"{city:<20} {parameter:<16} " + ' '.join(f"{value:8.2f}" for value in values[c, p]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from forecast import BASE_DIR, ForecastEngine
+
+MAX_HORIZON = 366
+DEFAULT_PARAMETERS = ['temperature_avg', 'humidity_avg', 'wind_speed_max']
+
+
+class LRUCache:
+    """Small ordered-dict LRU / Небольшой LRU на OrderedDict"""
+
+    def __init__(self, maxsize, on_evict=None) -> None:
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        self._items = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key, default=None):
+        if key not in self._items:
+            return default
+        self._items.move_to_end(key)
+        return self._items[key]
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            _, evicted = self._items.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict(evicted)
+
+
+class ForecastService:
+    """
+    Forecast service over model bundles / Сервис прогнозов поверх пакетов моделей
+
+    Loaded bundles (engines) live in an LRU keyed by file and reload when the
+    file changes; answers live in a second LRU, and identical requests that
+    arrive while one is being computed share its result /
+    Загруженные пакеты (движки) хранятся в LRU по файлу и перезагружаются при
+    изменении файла; ответы хранятся во втором LRU, а одинаковые запросы,
+    пришедшие во время вычисления, получают его результат
+    """
+
+    def __init__(self, bundle_dir, default_bundle, last_data_date=None,
+                 max_models=8, max_responses=4096) -> None:
+        self.bundle_dir = bundle_dir
+        self.default_bundle = default_bundle
+        self.last_data_date = last_data_date
+        self.engines = LRUCache(max_models, on_evict=lambda entry: self._retire(entry[1]))
+        self.responses = LRUCache(max_responses)
+        self._in_flight = {}
+        # Engines used by running computations, and evicted or replaced ones
+        # that close when their last computation ends /
+        # Движки, используемые идущими вычислениями, и вытесненные или
+        # замененные, которые закрываются по окончании последнего вычисления
+        self._users = {}
+        self._retired = set()
+        self.stats = {'requests': 0, 'cache_hits': 0, 'coalesced': 0, 'computed': 0}
+
+    def engine(self, bundle_name):
+        """
+        (mtime, engine) of a bundle, reloaded when the file changes; called on
+        the event loop only /
+        (mtime, движок) пакета, перезагружается при изменении файла; вызывается
+        только в цикле событий
+        """
+        path = os.path.join(self.bundle_dir, os.path.basename(bundle_name))
+        mtime = os.stat(path).st_mtime_ns
+        entry = self.engines.get(path)
+        if entry is None or entry[0] != mtime:
+            if entry is not None:
+                self._retire(entry[1])
+            entry = (mtime, ForecastEngine(path, self.last_data_date))
+            self.engines.put(path, entry)
+        return entry
+
+    def _retire(self, engine):
+        if self._users.get(engine):
+            self._retired.add(engine)
+        else:
+            engine.close()
+
+    def _acquire(self, engine):
+        self._users[engine] = self._users.get(engine, 0) + 1
+
+    def _release(self, engine):
+        self._users[engine] -= 1
+        if not self._users[engine]:
+            del self._users[engine]
+            if engine in self._retired:
+                self._retired.discard(engine)
+                engine.close()
+
+    @staticmethod
+    def _compute(engine, key):
+        _, _, cities, parameters, start, horizon = key
+        values = engine.forecast(list(cities), list(parameters), start, horizon)
+        body = {
+            'cities': list(cities),
+            'parameters': list(parameters),
+            'start': start,
+            'horizon': horizon,
+            # NaN (missing model) -> null / NaN (нет модели) -> null
+            'values': np.where(np.isnan(values), None, np.round(values, 4)).tolist()
+        }
+        if isinstance(start, str):
+            body['dates'] = [day.isoformat() for day in engine.forecast_dates(start, horizon)]
+        return json.dumps(body).encode('utf-8')
+
+    async def forecast(self, bundle_name, cities, parameters, start, horizon) -> bytes:
+        """JSON response for one request / JSON ответ на один запрос"""
+        self.stats['requests'] += 1
+        # The bundle mtime in the key keeps answers of a rebuilt bundle apart /
+        # mtime пакета в ключе отделяет ответы пересобранного пакета
+        mtime, engine = self.engine(bundle_name)
+        key = (bundle_name, mtime, tuple(cities), tuple(parameters), start, horizon)
+
+        cached = self.responses.get(key)
+        if cached is not None:
+            self.stats['cache_hits'] += 1
+            return cached
+
+        # The computation runs as its own task, so a cancelled request (a client
+        # that went away) neither stops it nor leaves identical requests waiting /
+        # Вычисление идет отдельной задачей, поэтому отмененный запрос (ушедший
+        # клиент) не останавливает его и не оставляет одинаковые запросы ждать
+        computation = self._in_flight.get(key)
+        if computation is not None:
+            self.stats['coalesced'] += 1
+        else:
+            self.stats['computed'] += 1
+            computation = asyncio.ensure_future(self._computation(engine, key))
+            # Retrieved here so failures without waiters are not reported as unhandled /
+            # Извлекается здесь, чтобы ошибки без ожидающих не считались необработанными
+            computation.add_done_callback(lambda task: task.cancelled() or task.exception())
+            self._in_flight[key] = computation
+        return await asyncio.shield(computation)
+
+    async def _computation(self, engine, key) -> bytes:
+        self._acquire(engine)
+        try:
+            body = await asyncio.get_running_loop().run_in_executor(None, self._compute, engine, key)
+            self.responses.put(key, body)
+            return body
+        finally:
+            del self._in_flight[key]
+            self._release(engine)
+
+    def parse_query(self, query):
+        params = parse_qs(query)
+        cities = params.get('city', [])
+        if not cities:
+            raise ValueError("at least one city is required")
+        parameters = params.get('parameter', DEFAULT_PARAMETERS)
+        horizon = int(params.get('horizon', ['7'])[0])
+        if not 0 < horizon <= MAX_HORIZON:
+            raise ValueError(f"horizon must be in 1..{MAX_HORIZON}")
+        if 'date' in params:
+            start = params['date'][0]
+            np.datetime64(start, 'D')  # validate / проверка
+        else:
+            start = int(params.get('start', ['0'])[0])
+        bundle_name = params.get('bundle', [self.default_bundle])[0]
+        return bundle_name, cities, parameters, start, horizon
+
+    async def handle_request(self, method, target):
+        """(status, body) for one HTTP request / (статус, тело) для одного HTTP запроса"""
+        url = urlsplit(target)
+        if method != 'GET':
+            return 405, b'{"error": "method not allowed"}'
+        if url.path == '/health':
+            return 200, json.dumps(self.stats).encode('utf-8')
+        if url.path != '/forecast':
+            return 404, b'{"error": "not found"}'
+        try:
+            request = self.parse_query(url.query)
+            return 200, await self.forecast(*request)
+        except (ValueError, KeyError, FileNotFoundError) as e:
+            return 400, json.dumps({'error': str(e)}).encode('utf-8')
+        except Exception as e:
+            print(f"Error: {e!r} for {target}")
+            return 500, b'{"error": "internal error"}'
+
+    async def handle_connection(self, reader, writer):
+        """Minimal HTTP/1.1 with keep-alive / Минимальный HTTP/1.1 с keep-alive"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3:
+                    break
+                method, target, version = parts
+
+                keep_alive = version == 'HTTP/1.1'
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = header.decode('latin-1').partition(':')
+                    if name.strip().lower() == 'connection':
+                        value = value.strip().lower()
+                        if value == 'close':
+                            keep_alive = False
+                        elif value == 'keep-alive':
+                            keep_alive = True
+
+                status, body = await self.handle_request(method, target)
+                reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+                          405: 'Method Not Allowed', 500: 'Internal Server Error'}[status]
+                writer.write(
+                    f"HTTP/1.1 {status} {reason}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + body
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(bundle_dir, default_bundle, host='127.0.0.1', port=8080, last_data_date=None,
+                max_models=8, max_responses=4096):
+    service = ForecastService(bundle_dir, default_bundle, last_data_date, max_models, max_responses)
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    print(f"Forecast service on http://{host}:{port}/forecast?city=...&parameter=...&start=0&horizon=7")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local forecast service / Локальный сервис прогнозов")
+    parser.add_argument('--bundle-dir', default=BASE_DIR)
+    parser.add_argument('--bundle', default='model_bundle_updated.bin')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--last-data-date', default=None,
+                        help="for models without a stored end date / для моделей без даты окончания")
+    parser.add_argument('--max-models', type=int, default=8)
+    parser.add_argument('--max-responses', type=int, default=4096)
+    args = parser.parse_args(argv)
+
+    asyncio.run(serve(args.bundle_dir, args.bundle, args.host, args.port, args.last_data_date,
+                      args.max_models, args.max_responses))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,484 @@
+import itertools
+import math
+import os
+
+import numpy as np
+
+from batch_trainer import BatchedSinTrainer
+from sine_model import NUMBER_OF_SINUSES
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSETS_DIR = os.path.dirname(BASE_DIR)
+
+# Grid of the original notebook search / Сетка исходного поиска из ноутбука
+DEFAULT_SEARCH_SPACE = {
+    'learning_rate': [0.001],
+    'beta_1': [0.7, 0.8, 0.9],
+    'beta_2': [0.9, 0.95, 0.99]
+}
+# Adam values for names a search space leaves out / Значения Adam для имен, которых нет в пространстве поиска
+ADAM_DEFAULTS = {'learning_rate': 0.001, 'beta_1': 0.9, 'beta_2': 0.999}
+
+
+def adam_parameter(trial, name):
+    return trial.get(name, ADAM_DEFAULTS[name])
+
+
+def _is_valid(trial):
+    # Adam needs beta_2 > beta_1 in this search / В этом поиске для Adam нужно beta_2 > beta_1
+    return adam_parameter(trial, 'beta_2') > adam_parameter(trial, 'beta_1')
+
+
+def grid_trials(search_space=None):
+    """
+    All valid combinations of a {name: [values]} grid /
+    Все допустимые комбинации сетки {имя: [значения]}
+    """
+    search_space = DEFAULT_SEARCH_SPACE if search_space is None else search_space
+    names = list(search_space)
+    trials = [dict(zip(names, values)) for values in itertools.product(*search_space.values())]
+    return [trial for trial in trials if _is_valid(trial)]
+
+
+def random_trials(search_space, number_of_trials, seed=None):
+    """
+    Random search: a list of values is sampled as a choice, a (low, high) tuple
+    uniformly and a (low, high, 'log') tuple log-uniformly /
+    Случайный поиск: список значений выбирается случайно, кортеж (low, high) -
+    равномерно, кортеж (low, high, 'log') - логарифмически равномерно
+    """
+    rng = np.random.default_rng(seed)
+    trials = []
+    # Bounded number of draws in case the space is mostly invalid /
+    # Ограниченное число попыток, если пространство почти целиком недопустимо
+    for _ in range(number_of_trials * 100):
+        trial = {}
+        for name, values in search_space.items():
+            if isinstance(values, tuple):
+                low, high = values[0], values[1]
+                if len(values) > 2 and values[2] == 'log':
+                    trial[name] = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+                else:
+                    trial[name] = float(rng.uniform(low, high))
+            else:
+                trial[name] = values[rng.integers(len(values))]
+        if _is_valid(trial):
+            trials.append(trial)
+            if len(trials) == number_of_trials:
+                break
+    return trials
+
+
+def time_series_folds(length, n_splits=3):
+    """
+    Expanding-window folds like sklearn TimeSeriesSplit as boolean masks /
+    Фолды с расширяющимся окном, как sklearn TimeSeriesSplit, в виде булевых масок
+
+    Returns train_masks, val_masks of shape (n_splits, length) /
+    Возвращает train_masks, val_masks формы (n_splits, length)
+    """
+    test_size = length // (n_splits + 1)
+    positions = np.arange(length)
+    train_masks = np.zeros((n_splits, length), dtype=bool)
+    val_masks = np.zeros((n_splits, length), dtype=bool)
+    for i in range(n_splits):
+        train_end = length - (n_splits - i) * test_size
+        train_masks[i] = positions < train_end
+        val_masks[i] = (positions >= train_end) & (positions < train_end + test_size)
+    return train_masks, val_masks
+
+
+def load_series(city_file, parameter, store_dir=None):
+    """
+    Day indices and values of one parameter from the store or the CSV /
+    Индексы дней и значения одного параметра из хранилища или CSV
+    """
+    city_name = os.path.basename(city_file).replace('.csv', '')
+    if store_dir is not None:
+        from weather_store import open_city
+
+        city_store = open_city(store_dir, city_name)
+        if parameter not in city_store.meta['columns']:
+            return None, None
+        days, values = city_store.get(parameter)
+        return np.asarray(days, dtype=float), np.asarray(values, dtype=float)
+
+    import pandas as pd
+    from day_index import days_since_zero_date
+
+    df = pd.read_csv(city_file)
+    if parameter not in df.columns:
+        return None, None
+    return days_since_zero_date(df['date']).astype(float), df[parameter].values.astype(float)
+
+
+def prepare_series(values):
+    """
+    Normalize and denoise like the notebook; returns None when too short /
+    Нормализация и сглаживание, как в ноутбуке; None, если данных мало
+
+    Returns dict with x_data, denoised_data, mean, std_dev, denoised_length /
+    Возвращает словарь с x_data, denoised_data, mean, std_dev, denoised_length
+    """
+    from fine_tune import Normalize, denoise_data
+
+    normalize_class = Normalize(np.asarray(values, dtype=float).reshape(-1, 1))
+    normalized_data = normalize_class.normalizeData().flatten()
+
+    window_size = max(1, len(normalized_data) // 70)
+    if len(normalized_data) <= window_size:
+        return None
+
+    denoised_data = denoise_data(normalized_data, window_size)
+    return {
+        'x_data': np.linspace(0, len(denoised_data), len(denoised_data)),
+        'denoised_data': denoised_data,
+        'mean': float(normalize_class.mean[0]),
+        'std_dev': float(normalize_class.std_dev[0]),
+        'denoised_length': len(denoised_data)
+    }
+
+
+def find_dominant_frequencies(data: np.ndarray, num_frequencies: int) -> np.ndarray:
+    """Main frequencies by Fourier transform / Основные частоты с помощью преобразования Фурье"""
+    mfft: np.ndarray = np.fft.fft(data)
+    imax: np.ndarray = np.argsort(np.absolute(mfft))[::-1]
+    imax = imax[:num_frequencies]
+    return np.array(imax) / len(data)
+
+
+def initial_weights(denoised_data, number_of_sinuses=NUMBER_OF_SINUSES):
+    """Starting kernel (K, 3) and bias of the notebook / Начальные kernel (K, 3) и bias из ноутбука"""
+    frequencies = find_dominant_frequencies(denoised_data, number_of_sinuses)
+    kernel = np.array([
+        [np.std(denoised_data), frequencies[i] * 2 * np.pi, 0.0]
+        for i in range(number_of_sinuses)
+    ], dtype=np.float32)
+    return kernel, np.float32(np.mean(denoised_data))
+
+
+def halving_budgets(min_epochs, max_epochs, eta):
+    """
+    Cumulative epoch budget of each successive-halving rung /
+    Накопленный бюджет эпох для каждой ступени последовательного деления
+    """
+    rungs = max(0, int(math.floor(math.log(max_epochs / min_epochs, eta) + 1e-9)))
+    budgets = [max(min_epochs, int(round(max_epochs / eta ** (rungs - i)))) for i in range(rungs + 1)]
+    return sorted(set(budgets))
+
+
+class HyperparameterSearch:
+    """
+    Successive-halving search over Adam hyperparameters of the SinLayer model /
+    Поиск гиперпараметров Adam модели SinLayer последовательным делением
+
+    All trials x folds are one stacked BatchedSinTrainer that is built (and
+    traced) once and reset between searches, so a whole fleet reuses the same
+    graph. After each rung only the best 1/eta trials keep training; pruned
+    trials are frozen through the trainer's active mask /
+    Все пробы x фолды - один общий BatchedSinTrainer, который строится (и
+    трассируется) один раз и сбрасывается между поисками, поэтому весь парк
+    моделей использует один граф. После каждой ступени обучение продолжают
+    только лучшие 1/eta проб; отсеянные пробы замораживаются маской active
+    """
+
+    def __init__(self, max_trials, cv_folds=3, number_of_sinuses=NUMBER_OF_SINUSES,
+                 batch_size=32, min_epochs=2, max_epochs=10, eta=3, seed=None) -> None:
+        self.max_trials = max_trials
+        self.cv_folds = cv_folds
+        self.number_of_sinuses = number_of_sinuses
+        self.batch_size = batch_size
+        self.budgets = halving_budgets(min_epochs, max_epochs, eta)
+        self.eta = eta
+        self.seed = seed
+        self.trainer = BatchedSinTrainer(max_trials * cv_folds, number_of_sinuses)
+
+    def _fit(self, X, Y, train_mask, val_mask, epochs, active, rung):
+        seed = None if self.seed is None else self.seed + rung
+        self.trainer.fit(X, Y, train_mask, epochs=epochs, batch_size=self.batch_size,
+                         patience=epochs + 1, seed=seed, active=active,
+                         val_mask=val_mask, restore_best=False)
+
+    def search(self, x_data, y_data, kernel, bias, trials):
+        """
+        Cross-validated successive halving over trials /
+        Последовательное деление проб с кросс-валидацией
+
+        Returns (best_params, best_mae, table) where table lists every trial
+        with its last mean validation MAE and epochs trained /
+        Возвращает (best_params, best_mae, table), где table содержит каждую
+        пробу с последней средней MAE на валидации и числом эпох
+        """
+        T, F = len(trials), self.cv_folds
+        if T == 0:
+            return None, float('inf'), []
+        if T > self.max_trials:
+            raise ValueError(f"{T} trials do not fit into a search built for {self.max_trials}")
+        M = self.trainer.number_of_models
+
+        # Row r = trial r // F on fold r % F; unused rows have empty masks /
+        # Строка r = проба r // F на фолде r % F; у лишних строк пустые маски
+        train_masks, val_masks = time_series_folds(len(x_data), F)
+        train_mask = np.zeros((M, len(x_data)), dtype=bool)
+        val_mask = np.zeros((M, len(x_data)), dtype=bool)
+        train_mask[:T * F] = np.tile(train_masks, (T, 1))
+        val_mask[:T * F] = np.tile(val_masks, (T, 1))
+        X = np.broadcast_to(np.asarray(x_data, np.float32), (M, len(x_data)))
+        Y = np.broadcast_to(np.asarray(y_data, np.float32), (M, len(y_data)))
+
+        def per_row(name, default):
+            values = np.full(M, default, dtype=np.float32)
+            values[:T * F] = np.repeat([adam_parameter(trial, name) for trial in trials], F)
+            return values
+
+        self.trainer.reset(np.broadcast_to(kernel, (M,) + np.shape(kernel)), np.full(M, bias))
+        self.trainer.set_hyperparameters(per_row('learning_rate', 0.0),
+                                         per_row('beta_1', 0.9), per_row('beta_2', 0.999))
+
+        scores = np.full(T, np.inf)
+        epochs_trained = np.zeros(T, dtype=int)
+        alive = np.arange(T)
+        trained = 0
+        for rung, budget in enumerate(self.budgets):
+            active = np.zeros(M, dtype=np.float32)
+            for trial_index in alive:
+                active[trial_index * F:(trial_index + 1) * F] = 1.0
+            self._fit(X, Y, train_mask, val_mask, budget - trained, active, rung)
+            trained = budget
+
+            _, mae = self.trainer.evaluate(X, Y, val_mask)
+            fold_mae = mae[:T * F].reshape(T, F).mean(axis=1)
+            scores[alive] = fold_mae[alive]
+            epochs_trained[alive] = budget
+
+            if rung == len(self.budgets) - 1 or len(alive) == 1:
+                break
+            keep = max(1, int(math.ceil(len(alive) / self.eta)))
+            alive = alive[np.argsort(scores[alive], kind='stable')[:keep]]
+
+        table = [dict(trial, mae=float(scores[i]), epochs=int(epochs_trained[i]))
+                 for i, trial in enumerate(trials)]
+        best = alive[np.argmin(scores[alive])]
+        return dict(trials[best]), float(scores[best]), table
+
+    def train_final(self, x_data, y_data, kernel, bias, params, epochs=50):
+        """
+        Train the chosen hyperparameters on all data in row 0 of the same trainer /
+        Обучить выбранные гиперпараметры на всех данных в строке 0 того же тренера
+
+        Returns kernel, bias and the training loss per epoch /
+        Возвращает kernel, bias и потерю обучения по эпохам
+        """
+        M = self.trainer.number_of_models
+        X = np.broadcast_to(np.asarray(x_data, np.float32), (M, len(x_data)))
+        Y = np.broadcast_to(np.asarray(y_data, np.float32), (M, len(y_data)))
+        mask = np.zeros((M, len(x_data)), dtype=bool)
+        mask[0] = True
+        active = np.zeros(M, dtype=np.float32)
+        active[0] = 1.0
+
+        self.trainer.reset(np.broadcast_to(kernel, (M,) + np.shape(kernel)), np.full(M, bias))
+        self.trainer.set_hyperparameters(adam_parameter(params, 'learning_rate'), adam_parameter(params, 'beta_1'),
+                                         adam_parameter(params, 'beta_2'))
+        seed = None if self.seed is None else self.seed + len(self.budgets)
+        history = self.trainer.fit(X, Y, mask, epochs=epochs, batch_size=self.batch_size,
+                                   patience=epochs + 1, seed=seed, active=active,
+                                   val_mask=mask, restore_best=False)
+        new_kernels, new_biases = self.trainer.get_weights()
+        return new_kernels[0], new_biases[0], history['loss'][:, 0].tolist()
+
+
+def lstsq_cross_validation(x_data, y_data, number_of_sinuses=NUMBER_OF_SINUSES, cv_folds=3,
+                           refine_steps=5):
+    """
+    Mean validation MAE of the least-squares backend on the same folds /
+    Средняя MAE на валидации для метода наименьших квадратов на тех же фолдах
+    """
+    from lstsq_fit import fit_sinusoids
+    from sine_model import evaluate_sinusoids, pack_coefficients
+
+    maes = []
+    for train_mask, val_mask in zip(*time_series_folds(len(x_data), cv_folds)):
+        kernel, bias = fit_sinusoids(x_data[train_mask], y_data[train_mask], number_of_sinuses,
+                                     refine_steps)
+        predictions = evaluate_sinusoids(pack_coefficients(kernel, bias), x_data[val_mask])
+        maes.append(np.mean(np.abs(predictions - y_data[val_mask])))
+    return float(np.mean(maes))
+
+
+def grid_search_optimizer(city_file, parameter, number_of_sinuses=NUMBER_OF_SINUSES, cv_folds=3,
+                          store_dir=None, trials=None, search=None, final_epochs=50,
+                          backend='keras', refine_steps=5):
+    """
+    Drop-in replacement of the notebook grid search /
+    Замена поиска по сетке из ноутбука
+
+    backend='lstsq' skips the Adam search and fits the model in closed form;
+    best_params then describe the solver /
+    backend='lstsq' пропускает поиск Adam и подбирает модель в замкнутой
+    форме; best_params тогда описывают решатель
+
+    Returns (base_model, best_params, best_mae, history) with history['loss']
+    per epoch of the final training, or four Nones /
+    Возвращает (base_model, best_params, best_mae, history), где
+    history['loss'] - потеря по эпохам финального обучения, или четыре None
+    """
+    import fine_tune
+
+    city_name = os.path.basename(city_file).replace('.csv', '')
+    print(f"Optimized for {city_name} - {parameter}...")
+
+    days, values = load_series(city_file, parameter, store_dir)
+    if values is None:
+        print(f"  Parameter {parameter} is not present in the data")
+        return None, None, None, None
+
+    series = prepare_series(values)
+    if series is None:
+        print(f"  Not enough data for {parameter}")
+        return None, None, None, None
+
+    if backend == 'lstsq':
+        from lstsq_fit import fit_sinusoids
+        from sine_model import evaluate_sinusoids, pack_coefficients
+
+        x_data, y_data = series['x_data'], series['denoised_data']
+        best_mae = lstsq_cross_validation(x_data, y_data, number_of_sinuses, cv_folds, refine_steps)
+        kernel, bias = fit_sinusoids(x_data, y_data, number_of_sinuses, refine_steps)
+        final_model = fine_tune.recreate_base_model(number_of_sinuses)
+        final_model.set_weights([kernel, np.asarray(bias)])
+        loss = np.mean((evaluate_sinusoids(pack_coefficients(kernel, bias), x_data) - y_data) ** 2)
+
+        best_params = {'backend': 'lstsq', 'refine_steps': refine_steps}
+        print(f"  Least-squares fit for {city_name} - {parameter}, MAE: {best_mae:.6f}")
+        return final_model, best_params, best_mae, {'loss': [float(loss)]}
+
+    trials = grid_trials() if trials is None else trials
+    if search is None:
+        search = HyperparameterSearch(len(trials), cv_folds, number_of_sinuses)
+
+    kernel, bias = initial_weights(series['denoised_data'], number_of_sinuses)
+    best_params, best_mae, table = search.search(
+        series['x_data'], series['denoised_data'], kernel, bias, trials
+    )
+    if best_params is None:
+        return None, None, None, None
+    print(f"  Best parameters: {best_params}, MAE: {best_mae:.6f} "
+          f"({sum(row['epochs'] for row in table)} trial epochs)")
+
+    new_kernel, new_bias, losses = search.train_final(
+        series['x_data'], series['denoised_data'], kernel, bias, best_params, final_epochs
+    )
+    final_model = fine_tune.recreate_base_model(number_of_sinuses)
+    final_model.set_weights([new_kernel, new_bias])
+
+    print(f"  Optimized parameters for {city_name} - {parameter}: {best_params}")
+    return final_model, best_params, best_mae, {'loss': losses, 'trials': table}
+
+
+def search_fleet(city_files, parameters, store_dir=None, trials=None,
+                 number_of_sinuses=NUMBER_OF_SINUSES, cv_folds=3, seed=None, backend='keras',
+                 **kwargs):
+    """
+    Run the search for every city and parameter with one shared trainer and
+    return the notebook's results structure /
+    Выполнить поиск для каждого города и параметра с одним общим тренером и
+    вернуть структуру results из ноутбука
+    """
+    trials = grid_trials() if trials is None else trials
+    search = None
+    if backend == 'keras':
+        search = HyperparameterSearch(len(trials), cv_folds, number_of_sinuses, seed=seed, **kwargs)
+
+    results = {}
+    for city_file in city_files:
+        city_name = os.path.basename(city_file).replace('.csv', '')
+        results[city_name] = {'models': {}, 'best_params': {}, 'metrics': {}, 'histories': {}}
+
+        for param in parameters:
+            model, best_params, mae, history = grid_search_optimizer(
+                city_file, param, number_of_sinuses, cv_folds, store_dir, trials, search,
+                backend=backend
+            )
+            if model is not None:
+                results[city_name]['models'][param] = model
+                results[city_name]['best_params'][param] = best_params
+                results[city_name]['metrics'][param] = mae
+                results[city_name]['histories'][param] = history
+    return results
+
+
+def train_fleet(city_files, parameters, keras_dir, info_dir, tflite_dir=None, store_dir=None,
+                trials=None, number_of_sinuses=NUMBER_OF_SINUSES, cv_folds=3, seed=None,
+                backend='keras'):
+    """
+    Search and train base models for every city and parameter and save them
+    as enhanced models with their info JSON, like the notebook export /
+    Подобрать и обучить базовые модели для каждого города и параметра и
+    сохранить их как улучшенные модели с JSON информацией, как экспорт ноутбука
+
+    Returns the search_fleet results / Возвращает результаты search_fleet
+    """
+    import fine_tune
+
+    for directory in (keras_dir, info_dir, tflite_dir):
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    results = search_fleet(city_files, parameters, store_dir, trials, number_of_sinuses, cv_folds,
+                           seed, backend)
+    for city_file in city_files:
+        city_name = os.path.basename(city_file).replace('.csv', '')
+        for parameter, model in results[city_name]['models'].items():
+            days, values = load_series(city_file, parameter, store_dir)
+            series = prepare_series(values)
+            data_end_date = (fine_tune.ZERO_DATE + int(days[-1])).item()
+            normalization = fine_tune.Normalize(np.asarray(values, dtype=float).reshape(-1, 1)).statistics()
+            normalization['end_date'] = data_end_date.isoformat()
+
+            enhanced_model = fine_tune.build_enhanced_model(model, series['denoised_length'],
+                                                            series['mean'], series['std_dev'])
+            model_info = fine_tune.make_model_info(city_file, parameter, series['mean'], series['std_dev'],
+                                                   series['denoised_length'], data_end_date, normalization)
+            stem = f'{city_name}_{parameter}'
+            fine_tune.save_model_artifacts(
+                enhanced_model, model_info,
+                os.path.join(keras_dir, f'{stem}.keras'),
+                os.path.join(info_dir, f'{stem}_info.json'),
+                None if tflite_dir is None else os.path.join(tflite_dir, f'{stem}.tflite')
+            )
+    return results
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Train base models from scratch / Обучить базовые модели с нуля")
+    parser.add_argument('--data-dir', default=os.path.join(ASSETS_DIR, 'or_cities'))
+    parser.add_argument('--store-dir', default=os.path.join(ASSETS_DIR, 'weather_store'))
+    parser.add_argument('--city', action='append', help="only these cities / только эти города")
+    parser.add_argument('--parameter', action='append',
+                        help="default: all three parameters / по умолчанию все три параметра")
+    parser.add_argument('--backend', choices=['keras', 'lstsq'], default='keras',
+                        help="Adam search or closed-form least squares / поиск Adam или наименьшие квадраты")
+    parser.add_argument('--cv-folds', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--keras-dir', default=os.path.join(BASE_DIR, 'model_keras_trained'))
+    parser.add_argument('--info-dir', default=os.path.join(BASE_DIR, 'model_info_trained'))
+    parser.add_argument('--tflite-dir', default=os.path.join(BASE_DIR, 'model_trained'),
+                        help="empty to skip TFLite / пусто, чтобы пропустить TFLite")
+    args = parser.parse_args(argv)
+
+    from city_csv import CSV_COLUMNS
+    from weather_store import build_store
+
+    build_store(args.data_dir, args.store_dir)
+    city_files = sorted(os.path.join(args.data_dir, name) for name in os.listdir(args.data_dir)
+                        if name.endswith('.csv') and (not args.city or name[:-len('.csv')] in args.city))
+    train_fleet(city_files, args.parameter or CSV_COLUMNS[1:], args.keras_dir, args.info_dir,
+                args.tflite_dir or None, args.store_dir, cv_folds=args.cv_folds, seed=args.seed,
+                backend=args.backend)
+
+
+if __name__ == "__main__":
+    main()
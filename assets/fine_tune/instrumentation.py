@@ -0,0 +1,218 @@
+import contextlib
+import contextvars
+import json
+import os
+import sys
+import time
+
+# (city, parameter) of the job being run / (город, параметр) выполняемого задания
+_current_job = contextvars.ContextVar('instrumentation_job', default=(None, None))
+_DISABLED = contextlib.nullcontext()
+METRIC_PREFIX = 'weather_update'
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of this process / Пиковый размер резидентной памяти процесса"""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS / Килобайты в Linux, байты в macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Recorder:
+    """
+    Wall time, CPU time and peak RSS per stage and (city, parameter), plus
+    sizes of written artifacts /
+    Настенное время, время CPU и пиковая RSS по этапам и (город, параметр),
+    а также размеры записанных файлов
+    """
+
+    enabled = True
+
+    def __init__(self) -> None:
+        self.started = time.time()
+        self.records = []
+        self.artifacts = []
+
+    @contextlib.contextmanager
+    def stage(self, name, city=None, parameter=None):
+        if city is None:
+            city, parameter = _current_job.get()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.records.append({
+                'stage': name,
+                'city': city,
+                'parameter': parameter,
+                'wall_seconds': time.perf_counter() - wall_start,
+                'cpu_seconds': time.process_time() - cpu_start,
+                'peak_rss_bytes': peak_rss_bytes(),
+                'pid': os.getpid()
+            })
+
+    @contextlib.contextmanager
+    def job(self, city, parameter):
+        token = _current_job.set((city, parameter))
+        try:
+            yield
+        finally:
+            _current_job.reset(token)
+
+    def artifact(self, path, stage, city=None, parameter=None):
+        if city is None:
+            city, parameter = _current_job.get()
+        if os.path.exists(path):
+            self.artifacts.append({'path': path, 'stage': stage, 'city': city, 'parameter': parameter,
+                                   'bytes': os.path.getsize(path)})
+
+    def export(self) -> dict:
+        """Records to send from a worker process / Записи для передачи из процесса"""
+        return {'records': self.records, 'artifacts': self.artifacts}
+
+    def merge(self, exported):
+        if exported:
+            self.records.extend(exported['records'])
+            self.artifacts.extend(exported['artifacts'])
+
+    def summary(self) -> dict:
+        """Totals per stage / Итоги по этапам"""
+        stages = {}
+        for record in self.records:
+            total = stages.setdefault(record['stage'], {'calls': 0, 'wall_seconds': 0.0,
+                                                        'cpu_seconds': 0.0, 'peak_rss_bytes': 0})
+            total['calls'] += 1
+            total['wall_seconds'] += record['wall_seconds']
+            total['cpu_seconds'] += record['cpu_seconds']
+            total['peak_rss_bytes'] = max(total['peak_rss_bytes'], record['peak_rss_bytes'])
+        return stages
+
+    def report(self) -> dict:
+        return {
+            'started': self.started,
+            'finished': time.time(),
+            'peak_rss_bytes': max([peak_rss_bytes()] + [record['peak_rss_bytes'] for record in self.records]),
+            'stages': self.summary(),
+            'records': self.records,
+            'artifacts': self.artifacts
+        }
+
+    def write_json(self, path):
+        _write_atomic(path, json.dumps(self.report(), indent=2))
+        print(f"Saved instrumentation report at {path}")
+
+    def write_prometheus(self, path):
+        """
+        Prometheus textfile-collector format, per (stage, city, parameter) /
+        Формат textfile-collector Prometheus по (этап, город, параметр)
+        """
+        totals = {}
+        for record in self.records:
+            key = (record['stage'], record['city'] or '', record['parameter'] or '')
+            total = totals.setdefault(key, [0, 0.0, 0.0])
+            total[0] += 1
+            total[1] += record['wall_seconds']
+            total[2] += record['cpu_seconds']
+
+        report = self.report()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {METRIC_PREFIX}_{name} {help_text}')
+            lines.append(f'# TYPE {METRIC_PREFIX}_{name} {kind}')
+            for labels, value in samples:
+                label_text = ','.join(f'{label}="{_escape(str(text))}"' for label, text in labels)
+                lines.append(f'{METRIC_PREFIX}_{name}{{{label_text}}} {value}' if label_text
+                             else f'{METRIC_PREFIX}_{name} {value}')
+
+        def stage_labels(key):
+            return [('stage', key[0]), ('city', key[1]), ('parameter', key[2])]
+
+        metric('stage_calls', 'gauge', 'Calls of a pipeline stage in the last run',
+               [(stage_labels(key), total[0]) for key, total in sorted(totals.items())])
+        metric('stage_wall_seconds', 'gauge', 'Wall time of a pipeline stage in the last run',
+               [(stage_labels(key), f'{total[1]:.6f}') for key, total in sorted(totals.items())])
+        metric('stage_cpu_seconds', 'gauge', 'CPU time of a pipeline stage in the last run',
+               [(stage_labels(key), f'{total[2]:.6f}') for key, total in sorted(totals.items())])
+        metric('artifact_bytes', 'gauge', 'Size of an artifact written in the last run',
+               [([('path', artifact['path']), ('stage', artifact['stage']),
+                  ('city', artifact['city'] or ''), ('parameter', artifact['parameter'] or '')],
+                 artifact['bytes']) for artifact in self.artifacts])
+        metric('peak_rss_bytes', 'gauge', 'Peak resident set size of the run', [([], report['peak_rss_bytes'])])
+        metric('duration_seconds', 'gauge', 'Duration of the last run',
+               [([], f"{report['finished'] - report['started']:.3f}")])
+        metric('last_run_timestamp_seconds', 'gauge', 'End time of the last run',
+               [([], f"{report['finished']:.0f}")])
+
+        _write_atomic(path, '\n'.join(lines) + '\n')
+        print(f"Saved Prometheus metrics at {path}")
+
+
+class NullRecorder:
+    """Disabled instrumentation: shared no-op contexts / Выключенный сбор: общие пустые контексты"""
+
+    enabled = False
+
+    def stage(self, name, city=None, parameter=None):
+        return _DISABLED
+
+    def job(self, city, parameter):
+        return _DISABLED
+
+    def artifact(self, path, stage, city=None, parameter=None):
+        pass
+
+    def export(self):
+        return None
+
+    def merge(self, exported):
+        pass
+
+
+_recorder = NullRecorder()
+
+
+def _escape(text) -> str:
+    return text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _write_atomic(path, text):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def enable() -> Recorder:
+    """Start recording in this process / Начать сбор в этом процессе"""
+    global _recorder
+    _recorder = Recorder()
+    return _recorder
+
+
+def disable():
+    global _recorder
+    _recorder = NullRecorder()
+
+
+def recorder():
+    return _recorder
+
+
+def stage(name, city=None, parameter=None):
+    """Time a block, labelled with the current job by default / Замерить блок"""
+    return _recorder.stage(name, city, parameter)
+
+
+def job(city, parameter):
+    """Label the stages inside with (city, parameter) / Пометить этапы внутри (город, параметр)"""
+    return _recorder.job(city, parameter)
+
+
+def artifact(path, stage_name, city=None, parameter=None):
+    """Record the size of a written file / Записать размер созданного файла"""
+    _recorder.artifact(path, stage_name, city, parameter)
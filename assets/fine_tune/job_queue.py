@@ -0,0 +1,316 @@
+import json
+import os
+import random
+import sqlite3
+import time
+import zlib
+
+# Job states / Состояния заданий
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    run TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    shard INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    not_before REAL NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    checkpoint TEXT,
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    UNIQUE (run, kind, key)
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (run, kind, status, not_before);
+CREATE TABLE IF NOT EXISTS runs (
+    run TEXT PRIMARY KEY,
+    settings TEXT NOT NULL,
+    created REAL NOT NULL
+);
+"""
+
+
+def shard_of(key) -> int:
+    """Stable shard number of a key / Стабильный номер шарда ключа"""
+    return zlib.crc32(str(key).encode('utf-8')) & 0x7fffffff
+
+
+def retry_delay(attempt, base=30.0, cap=3600.0) -> float:
+    """
+    Exponential backoff with jitter after the given failed attempt, so
+    workers do not retry a flaky API in lockstep /
+    Экспоненциальная задержка со случайной добавкой после неудачной попытки,
+    чтобы процессы не повторяли запросы к нестабильному API одновременно
+    """
+    delay = min(cap, base * 2 ** max(0, attempt - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class JobQueue:
+    """
+    Job queue in one SQLite file shared by the worker processes of one host.
+    A job is claimed with a lease; a worker that crashes stops renewing it and
+    the job is claimed again after the lease expires. Jobs are unique per
+    (run, kind, key), so enqueueing a run again does not redo finished jobs /
+    Очередь заданий в одном файле SQLite, общая для процессов одной машины.
+    Задание захватывается с арендой; упавший процесс перестает ее продлевать,
+    и задание захватывается снова после ее истечения. Задания уникальны по
+    (run, kind, key), поэтому повторная постановка запуска не повторяет
+    завершенные задания
+
+    The file must be on a local disk: SQLite locking is not reliable on
+    network filesystems such as NFS or SMB. wal=True is faster /
+    Файл должен лежать на локальном диске: блокировки SQLite ненадежны в
+    сетевых файловых системах, таких как NFS или SMB. wal=True быстрее
+    """
+
+    def __init__(self, path, wal=False, timeout=60.0) -> None:
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # Autocommit; writes take the lock with BEGIN IMMEDIATE /
+        # Автофиксация; записи берут блокировку через BEGIN IMMEDIATE
+        self.connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        if wal:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _write(self, statements):
+        """Run (sql, args) pairs in one write transaction / Выполнить пары (sql, args) в одной транзакции"""
+        cursor = self.connection.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            results = [cursor.execute(sql, args).rowcount for sql, args in statements]
+            cursor.execute('COMMIT')
+        except BaseException:
+            cursor.execute('ROLLBACK')
+            raise
+        return results
+
+    def create_run(self, run, settings) -> dict:
+        """
+        Store the settings every worker of a run uses; the first stored
+        settings win. Returns the settings of the run /
+        Сохранить настройки, общие для всех процессов запуска; побеждают первые
+        сохраненные настройки. Возвращает настройки запуска
+        """
+        self._write([('INSERT OR IGNORE INTO runs (run, settings, created) VALUES (?, ?, ?)',
+                      (run, json.dumps(settings), time.time()))])
+        return self.run_settings(run)
+
+    def run_settings(self, run):
+        row = self.connection.execute('SELECT settings FROM runs WHERE run = ?', (run,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def add(self, run, kind, items, max_attempts=3) -> int:
+        """
+        Enqueue {key: payload} jobs; existing (run, kind, key) jobs are kept
+        as they are. Returns the number of new jobs /
+        Поставить задания {ключ: данные}; существующие задания (run, kind, key)
+        остаются как есть. Возвращает количество новых заданий
+        """
+        now = time.time()
+        sql = ('INSERT OR IGNORE INTO jobs (run, kind, key, shard, payload, status, max_attempts, created) '
+               'VALUES (?, ?, ?, ?, ?, ?, ?, ?)')
+        return sum(self._write([(sql, (run, kind, key, shard_of(key), json.dumps(payload), PENDING,
+                                       max_attempts, now))
+                                for key, payload in items.items()]))
+
+    def claim(self, run, worker, kinds=None, shard=None, lease_seconds=600.0):
+        """
+        Take the next runnable job: pending and past its backoff, or running
+        with an expired lease. shard=(index, count) takes only keys of that
+        shard. Returns a job dict or None /
+        Взять следующее задание: ожидающее и после задержки или выполняемое
+        с истекшей арендой. shard=(index, count) берет только ключи этого
+        шарда. Возвращает словарь задания или None
+        """
+        now = time.time()
+        where = ['run = ?', '((status = ? AND not_before <= ?) OR (status = ? AND lease_until < ?))']
+        args = [run, PENDING, now, RUNNING, now]
+        if kinds is not None:
+            where.append(f"kind IN ({', '.join('?' * len(kinds))})")
+            args += list(kinds)
+        if shard is not None:
+            where.append('shard % ? = ?')
+            args += [shard[1], shard[0]]
+
+        cursor = self.connection.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            # Jobs of crashed workers without attempts left fail /
+            # Задания упавших процессов без оставшихся попыток завершаются ошибкой
+            cursor.execute('UPDATE jobs SET status = ?, finished = ?, error = COALESCE(error, ?) '
+                           'WHERE run = ? AND status = ? AND lease_until < ? AND attempts >= max_attempts',
+                           (FAILED, now, 'lease expired', run, RUNNING, now))
+            row = cursor.execute(f"SELECT * FROM jobs WHERE {' AND '.join(where)} ORDER BY id LIMIT 1",
+                                 args).fetchone()
+            if row is not None:
+                cursor.execute('UPDATE jobs SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1, '
+                               'started = COALESCE(started, ?) WHERE id = ?',
+                               (RUNNING, worker, now + lease_seconds, now, row['id']))
+            cursor.execute('COMMIT')
+        except BaseException:
+            cursor.execute('ROLLBACK')
+            raise
+        if row is None:
+            return None
+        job = self._job(row)
+        job.update(status=RUNNING, worker=worker, attempts=row['attempts'] + 1)
+        return job
+
+    @staticmethod
+    def _job(row) -> dict:
+        job = dict(row)
+        for name in ('payload', 'checkpoint', 'result'):
+            job[name] = None if job[name] is None else json.loads(job[name])
+        return job
+
+    def save_checkpoint(self, job, checkpoint, lease_seconds=600.0) -> bool:
+        """
+        Store the job's progress and renew the lease. False when another
+        worker took the job over /
+        Сохранить прогресс задания и продлить аренду. False, если задание
+        забрал другой процесс
+        """
+        job['checkpoint'] = checkpoint
+        return self._write([('UPDATE jobs SET checkpoint = ?, lease_until = ? WHERE id = ? AND worker = ?',
+                             (json.dumps(checkpoint), time.time() + lease_seconds, job['id'],
+                              job['worker']))])[0] == 1
+
+    def complete(self, job, result=None) -> bool:
+        return self._write([('UPDATE jobs SET status = ?, result = ?, error = NULL, finished = ? '
+                             'WHERE id = ? AND worker = ?',
+                             (DONE, json.dumps(result), time.time(), job['id'], job['worker']))])[0] == 1
+
+    def fail(self, job, error, delay=None) -> str:
+        """
+        Put the job back with a backoff, or fail it when no attempts are left.
+        Returns the new status /
+        Вернуть задание с задержкой или завершить ошибкой, если попыток не
+        осталось. Возвращает новое состояние
+        """
+        now = time.time()
+        if job['attempts'] < job['max_attempts']:
+            delay = retry_delay(job['attempts']) if delay is None else delay
+            status, args = PENDING, (PENDING, now + delay, None, str(error))
+        else:
+            status, args = FAILED, (FAILED, 0, now, str(error))
+        self._write([('UPDATE jobs SET status = ?, not_before = ?, finished = ?, error = ?, lease_until = NULL '
+                      'WHERE id = ? AND worker = ?', args + (job['id'], job['worker']))])
+        return status
+
+    def retry_failed(self, run, kind=None) -> int:
+        """Give failed jobs a fresh set of attempts / Дать завершенным с ошибкой заданиям новые попытки"""
+        sql = ('UPDATE jobs SET status = ?, attempts = 0, not_before = 0, started = NULL, finished = NULL '
+               'WHERE run = ? AND status = ?')
+        args = (PENDING, run, FAILED)
+        if kind is not None:
+            sql += ' AND kind = ?'
+            args += (kind,)
+        return self._write([(sql, args)])[0]
+
+    def open_count(self, run, kinds=None, shard=None) -> int:
+        """Pending and running jobs / Ожидающие и выполняемые задания"""
+        sql = 'SELECT COUNT(*) FROM jobs WHERE run = ? AND status IN (?, ?)'
+        args = [run, PENDING, RUNNING]
+        if kinds is not None:
+            sql += f" AND kind IN ({', '.join('?' * len(kinds))})"
+            args += list(kinds)
+        if shard is not None:
+            sql += ' AND shard % ? = ?'
+            args += [shard[1], shard[0]]
+        return self.connection.execute(sql, args).fetchone()[0]
+
+    def next_wakeup(self, run) -> float:
+        """
+        Seconds until a waiting job becomes runnable, None when nothing waits /
+        Секунды до готовности ожидающего задания, None, если ждать нечего
+        """
+        row = self.connection.execute(
+            'SELECT MIN(CASE WHEN status = ? THEN not_before ELSE lease_until END) FROM jobs '
+            'WHERE run = ? AND status IN (?, ?)', (PENDING, run, PENDING, RUNNING)).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def jobs(self, run, kind=None, status=None) -> list:
+        sql, args = 'SELECT * FROM jobs WHERE run = ?', [run]
+        if kind is not None:
+            sql += ' AND kind = ?'
+            args.append(kind)
+        if status is not None:
+            sql += ' AND status = ?'
+            args.append(status)
+        return [self._job(row) for row in self.connection.execute(sql + ' ORDER BY id', args)]
+
+    def progress(self, run, kind=None) -> dict:
+        """
+        Counts per state, throughput and an ETA of a run /
+        Количество по состояниям, пропускная способность и оценка времени запуска
+        """
+        sql = 'SELECT status, COUNT(*), MIN(started), MAX(finished), SUM(finished - started) FROM jobs WHERE run = ?'
+        args = [run]
+        if kind is not None:
+            sql += ' AND kind = ?'
+            args.append(kind)
+        counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        first_start, last_finish, busy_seconds = None, None, 0.0
+        for status, count, started, finished, seconds in self.connection.execute(sql + ' GROUP BY status', args):
+            counts[status] = count
+            if started is not None:
+                first_start = started if first_start is None else min(first_start, started)
+            if status == DONE:
+                last_finish, busy_seconds = finished, seconds or 0.0
+
+        total = sum(counts.values())
+        elapsed = (last_finish - first_start) if counts[DONE] and last_finish and first_start else 0.0
+        # Under a second of work says nothing about throughput / Меньше секунды работы ничего не говорит
+        per_minute = counts[DONE] / elapsed * 60 if elapsed >= 1.0 else None
+        remaining = counts[PENDING] + counts[RUNNING]
+        return {
+            'run': run,
+            'kind': kind,
+            'total': total,
+            'counts': counts,
+            'elapsed_seconds': elapsed,
+            'jobs_per_minute': per_minute,
+            'mean_job_seconds': busy_seconds / counts[DONE] if counts[DONE] else None,
+            'eta_seconds': remaining / per_minute * 60 if per_minute else None
+        }
+
+
+def print_progress(progress, failures=()):
+    counts = progress['counts']
+    line = (f"{progress['run']}{' ' + progress['kind'] if progress['kind'] else ''}: "
+            f"{counts[DONE]}/{progress['total']} done, {counts[RUNNING]} running, "
+            f"{counts[PENDING]} pending, {counts[FAILED]} failed")
+    if progress['jobs_per_minute']:
+        line += f", {progress['jobs_per_minute']:.1f} jobs/min"
+    if progress['mean_job_seconds'] is not None:
+        line += f", {progress['mean_job_seconds']:.1f}s per job"
+    if progress['eta_seconds']:
+        line += f", ETA {progress['eta_seconds'] / 60:.1f} min"
+    print(line)
+    for job in failures:
+        print(f"  failed {job['kind']} {job['key']} after {job['attempts']} attempts: {job['error']}")
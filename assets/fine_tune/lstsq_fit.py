@@ -0,0 +1,168 @@
+import numpy as np
+
+from sine_model import NUMBER_OF_SINUSES, evaluate_sinusoids, pack_coefficients, unpack_coefficients
+
+
+def rfft_frequencies(y, number_of_sinuses=NUMBER_OF_SINUSES, spacing=1.0) -> np.ndarray:
+    """
+    Angular frequencies of the strongest rfft peaks, without the DC bin /
+    Угловые частоты самых сильных пиков rfft, без нулевой частоты
+
+    rfft returns each frequency once, so conjugate duplicates of fft can not
+    be picked twice; the mean is handled by the bias /
+    rfft возвращает каждую частоту один раз, поэтому сопряженные дубликаты fft
+    не выбираются дважды; среднее учитывается смещением
+    """
+    y = np.asarray(y, dtype=float)
+    spectrum = np.abs(np.fft.rfft(y - y.mean()))
+    spectrum[0] = -1.0
+    peaks = np.argsort(spectrum, kind='stable')[::-1][:number_of_sinuses]
+    return 2 * np.pi * np.fft.rfftfreq(len(y), d=spacing)[peaks]
+
+
+def design_matrix(x, frequencies) -> np.ndarray:
+    """[sin(w x), cos(w x)] per frequency and a column of ones / [sin(w x), cos(w x)] и столбец единиц"""
+    angles = np.asarray(x, dtype=float).reshape(-1, 1) * np.asarray(frequencies, dtype=float)
+    return np.hstack([np.sin(angles), np.cos(angles), np.ones((angles.shape[0], 1))])
+
+
+def _to_linear(kernel, bias):
+    # A sin(w x + p) = A cos(p) sin(w x) + A sin(p) cos(w x)
+    kernel = np.asarray(kernel, dtype=float)
+    amplitudes, phases = kernel[:, 0], kernel[:, 2]
+    return np.concatenate([amplitudes * np.cos(phases), amplitudes * np.sin(phases), [float(bias)]])
+
+
+def _from_linear(coefficients, frequencies):
+    K = len(frequencies)
+    sin_part, cos_part, bias = coefficients[:K], coefficients[K:2 * K], coefficients[-1]
+    kernel = np.column_stack([np.hypot(sin_part, cos_part), frequencies, np.arctan2(cos_part, sin_part)])
+    return kernel.astype(np.float32), np.float32(bias)
+
+
+def solve_linear(x, y, frequencies, prior_kernel=None, prior_bias=0.0, ridge=0.0):
+    """
+    Amplitudes, phases and bias for fixed frequencies by linear least squares /
+    Амплитуды, фазы и смещение при фиксированных частотах линейным МНК
+
+    With ridge > 0 the solution minimizes mean((A c - y)^2) + ridge * |c - c0|^2
+    where c0 comes from prior_kernel/prior_bias (zero by default), which keeps
+    short windows close to the previous model /
+    При ridge > 0 минимизируется mean((A c - y)^2) + ridge * |c - c0|^2, где c0
+    берется из prior_kernel/prior_bias (по умолчанию ноль), что удерживает
+    короткие окна рядом с предыдущей моделью
+
+    Returns kernel (K, 3) and bias in the SinLayer layout /
+    Возвращает kernel (K, 3) и bias в формате SinLayer
+    """
+    frequencies = np.asarray(frequencies, dtype=float)
+    A = design_matrix(x, frequencies)
+    y = np.asarray(y, dtype=float).ravel()
+
+    if ridge > 0:
+        if prior_kernel is None:
+            prior = np.zeros(A.shape[1])
+        else:
+            prior = _to_linear(prior_kernel, prior_bias)
+        # Stack sqrt(ridge * n) * I below A / Добавить sqrt(ridge * n) * I под A
+        scale = np.sqrt(ridge * len(y))
+        A = np.vstack([A, scale * np.eye(A.shape[1])])
+        y = np.concatenate([y, scale * prior])
+
+    coefficients = np.linalg.lstsq(A, y, rcond=None)[0]
+    return _from_linear(coefficients, frequencies)
+
+
+def _residuals(coefficients, x, y):
+    return evaluate_sinusoids(coefficients, x, dtype=np.float64) - y
+
+
+def _jacobian(coefficients, x, y):
+    kernel, _ = unpack_coefficients(coefficients)
+    angles = x[:, None] * kernel[:, 1] + kernel[:, 2]
+    sin, cos = np.sin(angles), np.cos(angles)
+    # Columns in kernel order (A, w, p) per sinusoid, then bias /
+    # Столбцы в порядке kernel (A, w, p) для каждой синусоиды, затем смещение
+    jacobian = np.empty((len(x), kernel.shape[0], 3))
+    jacobian[:, :, 0] = sin
+    jacobian[:, :, 1] = kernel[:, 0] * x[:, None] * cos
+    jacobian[:, :, 2] = kernel[:, 0] * cos
+    return np.hstack([jacobian.reshape(len(x), -1), np.ones((len(x), 1))])
+
+
+def _levenberg_marquardt(coefficients, x, y, steps, damping=1e-3):
+    # Plain NumPy fallback when SciPy is not installed / Запасной вариант NumPy без SciPy
+    cost = np.sum(_residuals(coefficients, x, y) ** 2)
+    for _ in range(steps):
+        residuals = _residuals(coefficients, x, y)
+        J = _jacobian(coefficients, x, y)
+        JTJ = J.T @ J
+        gradient = J.T @ residuals
+        while damping < 1e10:
+            step = np.linalg.solve(JTJ + damping * np.diag(np.diag(JTJ) + 1e-12), -gradient)
+            candidate = coefficients + step
+            candidate_cost = np.sum(_residuals(candidate, x, y) ** 2)
+            if candidate_cost < cost:
+                coefficients, cost = candidate, candidate_cost
+                damping = max(damping / 10, 1e-12)
+                break
+            damping *= 10
+        else:
+            break
+    return coefficients
+
+
+def refine(x, y, kernel, bias, steps=5):
+    """
+    Refine frequencies (and all other coefficients) by a few
+    Levenberg-Marquardt steps; SciPy is used when available /
+    Уточнить частоты (и остальные коэффициенты) несколькими шагами
+    Левенберга-Марквардта; при наличии используется SciPy
+    """
+    x = np.asarray(x, dtype=float).ravel()
+    y = np.asarray(y, dtype=float).ravel()
+    start = pack_coefficients(kernel, bias).astype(float)
+    try:
+        from scipy.optimize import least_squares
+    except ImportError:
+        coefficients = _levenberg_marquardt(start, x, y, steps)
+    else:
+        coefficients = least_squares(_residuals, start, jac=_jacobian, args=(x, y), method='lm',
+                                     max_nfev=steps * (len(start) + 1)).x
+    new_kernel, new_bias = unpack_coefficients(coefficients.astype(np.float32))
+    return new_kernel, np.float32(new_bias)
+
+
+def fit_sinusoids(x, y, number_of_sinuses=NUMBER_OF_SINUSES, refine_steps=0):
+    """
+    Fit a SinLayer from scratch: rfft peaks -> linear least squares ->
+    optional LM refinement of the frequencies /
+    Подобрать SinLayer с нуля: пики rfft -> линейный МНК -> необязательное
+    уточнение частот методом ЛМ
+
+    x is expected to be evenly spaced as in the notebook training data /
+    x должен быть равномерным, как в обучающих данных ноутбука
+    """
+    x = np.asarray(x, dtype=float).ravel()
+    spacing = (x[-1] - x[0]) / (len(x) - 1) if len(x) > 1 else 1.0
+    frequencies = rfft_frequencies(y, number_of_sinuses, spacing)
+    kernel, bias = solve_linear(x, y, frequencies)
+    if refine_steps:
+        kernel, bias = refine(x, y, kernel, bias, refine_steps)
+        # Final exact solve for the refined frequencies / Точное решение для уточненных частот
+        kernel, bias = solve_linear(x, y, kernel[:, 1])
+    return kernel, bias
+
+
+def fine_tune_sinusoids(x, y, kernel, bias, ridge=0.01, refine_steps=0):
+    """
+    Fine-tune an existing SinLayer on a short window: frequencies are kept and
+    amplitudes, phases and bias are re-solved with a ridge toward the old ones /
+    Дообучить существующий SinLayer на коротком окне: частоты сохраняются, а
+    амплитуды, фазы и смещение решаются заново с регуляризацией к старым
+    """
+    kernel = np.asarray(kernel, dtype=float)
+    new_kernel, new_bias = solve_linear(x, y, kernel[:, 1], kernel, bias, ridge)
+    if refine_steps:
+        new_kernel, new_bias = refine(x, y, new_kernel, new_bias, refine_steps)
+    return new_kernel, new_bias
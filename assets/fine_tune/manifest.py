@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from day_index import days_since_zero_date
+
+MANIFEST_FILE = 'model_manifest.json'
+MANIFEST_VERSION = 1
+
+# Sources whose changes alter the trained models, including the modules that
+# read the training data / Исходники, влияющие на обученные модели, включая
+# модули чтения данных обучения
+CODE_FILES = ['fine_tune.py', 'sine_model.py', 'sin_trainer.py', 'batch_trainer.py', 'lstsq_fit.py',
+              'city_csv.py', 'day_index.py', 'weather_store.py']
+
+
+def hash_bytes(*chunks) -> str:
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_json(value) -> str:
+    return hash_bytes(json.dumps(value, sort_keys=True).encode('utf-8'))
+
+
+def file_hash(path, block_size=1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def code_version(code_files=None) -> str:
+    """
+    Hash of the training code, line endings ignored /
+    Хеш кода обучения без учета окончаний строк
+    """
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    chunks = []
+    for name in CODE_FILES if code_files is None else code_files:
+        with open(os.path.join(base_dir, name), 'rb') as f:
+            chunks.append(name.encode('utf-8') + b'\0' + f.read().replace(b'\r\n', b'\n'))
+    return hash_bytes(*chunks)
+
+
+def data_slice_hash(city_file, column, start_date, end_date, store_dir=None) -> str:
+    """
+    Hash of the (day, value) rows a job trains on / Хеш строк (день, значение) задания
+    """
+    if store_dir is not None:
+        from weather_store import open_city
+
+        city_store = open_city(store_dir, os.path.basename(city_file).replace('.csv', ''))
+        if column not in city_store.meta['columns']:
+            return hash_bytes(b'missing')
+        days, values = city_store.get(column, days_since_zero_date(start_date),
+                                      days_since_zero_date(end_date))
+    else:
+        import pandas as pd
+
+        df = pd.read_csv(city_file)
+        if column not in df.columns:
+            return hash_bytes(b'missing')
+        all_days = days_since_zero_date(df['date'])
+        rows = (all_days >= days_since_zero_date(start_date)) & (all_days <= days_since_zero_date(end_date))
+        days, values = all_days[rows], pd.to_numeric(df[column][rows], errors='coerce').values
+
+    return hash_bytes(np.ascontiguousarray(days, dtype=np.int32).tobytes(),
+                      np.ascontiguousarray(values, dtype=np.float32).tobytes())
+
+
+def load_manifest(path):
+    """Manifest dict, empty when missing or unreadable / Манифест, пустой если файла нет"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {'version': MANIFEST_VERSION, 'models': {}}
+
+
+def save_manifest(path, manifest):
+    # Per process, fleet workers save the manifest concurrently /
+    # Свой для каждого процесса, процессы парка сохраняют манифест одновременно
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def manifest_entry(manifest, model_file):
+    return manifest['models'].get(model_file)
+
+
+def is_unchanged(manifest, model_file, hashes, output_paths) -> bool:
+    """
+    Same input hashes as the last successful update and outputs still present /
+    Те же хеши входов, что при последнем успешном обновлении, и результаты на месте
+    """
+    entry = manifest_entry(manifest, model_file)
+    if entry is None or entry.get('hashes') != hashes:
+        return False
+    return all(os.path.exists(path) and os.path.getsize(path) > 0 for path in output_paths)
+
+
+def record_update(manifest, model_file, city, parameter, hashes, updated_date=None):
+    manifest['models'][model_file] = {
+        'city': city,
+        'parameter': parameter,
+        'hashes': hashes,
+        'updated_date': updated_date
+    }
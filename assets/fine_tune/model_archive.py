@@ -0,0 +1,306 @@
+import hashlib
+import json
+import os
+import shutil
+import struct
+import zipfile
+import zlib
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Compressed members of staged files, by content hash / Сжатые файлы по хешу содержимого
+MEMBER_DIR = os.path.join(BASE_DIR, 'package_members')
+# Files of the last full package; the next delta is taken against it /
+# Файлы последнего полного пакета; следующая дельта строится относительно него
+PACKAGE_MANIFEST = os.path.join(BASE_DIR, 'package_manifest.json')
+DELTA_MANIFEST = 'manifest.json'
+COMPRESS_LEVEL = 6
+
+# Fixed entry time 1980-01-01 00:00 and mode 0644 / Фиксированные время 1980-01-01 00:00 и права 0644
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+_DOS_TIME = 0
+_DOS_DATE = (1 << 5) | 1
+_EXTERNAL_ATTR = 0o100644 << 16
+_UTF8_FLAG = 0x800
+_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+_CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+_END_RECORD = struct.Struct('<IHHHHIIH')
+_MAX_ENTRIES = 0xFFFF
+_MAX_OFFSET = 0xFFFFFFFF
+
+
+def _write_atomic(path, data: bytes):
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def file_digest(path, block_size=1 << 20):
+    """(sha256, crc32, size) of a file in one pass / (sha256, crc32, размер) файла за один проход"""
+    digest, crc, size = hashlib.sha256(), 0, 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+            crc = zlib.crc32(block, crc)
+            size += len(block)
+    return digest.hexdigest(), crc, size
+
+
+class MemberStore:
+    """
+    Raw-deflate payloads of files keyed by content hash. Files are staged as
+    each job saves them, so packaging only copies compressed bytes /
+    Сжатые raw-deflate данные файлов по хешу содержимого. Файлы добавляются
+    по мере сохранения заданиями, поэтому упаковка только копирует сжатые байты
+    """
+
+    def __init__(self, store_dir=MEMBER_DIR) -> None:
+        self.store_dir = store_dir
+
+    def payload_path(self, sha256):
+        return os.path.join(self.store_dir, sha256[:2], f'{sha256}.deflate')
+
+    def stage(self, path) -> dict:
+        """
+        Compress a file unless its content is already stored /
+        Сжать файл, если его содержимое еще не сохранено
+
+        Returns {sha256, crc, size, compressed_size} / Возвращает {sha256, crc, size, compressed_size}
+        """
+        sha256, crc, size = file_digest(path)
+        payload_path = self.payload_path(sha256)
+        if not os.path.exists(payload_path):
+            os.makedirs(os.path.dirname(payload_path), exist_ok=True)
+            compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+            tmp_path = f'{payload_path}.tmp-{os.getpid()}'
+            with open(path, 'rb') as source, open(tmp_path, 'wb') as target:
+                for block in iter(lambda: source.read(1 << 20), b''):
+                    target.write(compressor.compress(block))
+                target.write(compressor.flush())
+            os.replace(tmp_path, payload_path)
+        return {'sha256': sha256, 'crc': crc, 'size': size,
+                'compressed_size': os.path.getsize(payload_path)}
+
+    def stage_bytes(self, data: bytes) -> dict:
+        sha256 = hashlib.sha256(data).hexdigest()
+        payload_path = self.payload_path(sha256)
+        if not os.path.exists(payload_path):
+            os.makedirs(os.path.dirname(payload_path), exist_ok=True)
+            compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+            _write_atomic(payload_path, compressor.compress(data) + compressor.flush())
+        return {'sha256': sha256, 'crc': zlib.crc32(data), 'size': len(data),
+                'compressed_size': os.path.getsize(payload_path)}
+
+    def prune(self, keep):
+        """Delete payloads whose hash is not in keep / Удалить данные с хешем не из keep"""
+        removed = 0
+        if not os.path.exists(self.store_dir):
+            return removed
+        for prefix in os.listdir(self.store_dir):
+            prefix_dir = os.path.join(self.store_dir, prefix)
+            for name in os.listdir(prefix_dir):
+                if name.split('.', 1)[0] not in keep:
+                    os.remove(os.path.join(prefix_dir, name))
+                    removed += 1
+        return removed
+
+
+def stage_files(paths, store_dir=MEMBER_DIR):
+    """Stage the files a job wrote / Добавить файлы, записанные заданием"""
+    store = MemberStore(store_dir)
+    return [store.stage(path) for path in paths if path is not None and os.path.exists(path)]
+
+
+def directory_files(directory):
+    """Sorted (archive name, path) of all files below directory / Отсортированные (имя в архиве, путь)"""
+    files = []
+    for root, dirs, names in os.walk(directory):
+        dirs.sort()
+        for name in names:
+            path = os.path.join(root, name)
+            files.append((os.path.relpath(path, directory).replace(os.sep, '/'), path))
+    return sorted(files)
+
+
+def write_zip(archive_path, members, store):
+    """
+    Write a deterministic zip of (name, member) pairs in the given order by
+    copying staged payloads: fixed times and modes, no extra fields /
+    Записать детерминированный zip из пар (имя, член) в заданном порядке,
+    копируя сжатые данные: фиксированные время и права, без доп. полей
+    """
+    total = sum(member['compressed_size'] + 30 + len(name.encode('utf-8')) for name, member in members)
+    if len(members) >= _MAX_ENTRIES or total >= _MAX_OFFSET or \
+            any(member['size'] >= _MAX_OFFSET for _, member in members):
+        return _write_zip64(archive_path, members, store)
+
+    tmp_path = f'{archive_path}.tmp-{os.getpid()}'
+    central = []
+    with open(tmp_path, 'wb') as f:
+        for name, member in members:
+            encoded = name.encode('utf-8')
+            offset = f.tell()
+            f.write(_LOCAL_HEADER.pack(0x04034b50, 20, _UTF8_FLAG, zipfile.ZIP_DEFLATED, _DOS_TIME, _DOS_DATE,
+                                       member['crc'], member['compressed_size'], member['size'],
+                                       len(encoded), 0))
+            f.write(encoded)
+            with open(store.payload_path(member['sha256']), 'rb') as payload:
+                shutil.copyfileobj(payload, f)
+            central.append(_CENTRAL_HEADER.pack(0x02014b50, (3 << 8) | 20, 20, _UTF8_FLAG, zipfile.ZIP_DEFLATED,
+                                                _DOS_TIME, _DOS_DATE, member['crc'], member['compressed_size'],
+                                                member['size'], len(encoded), 0, 0, 0, 0, _EXTERNAL_ATTR,
+                                                offset) + encoded)
+        central_offset = f.tell()
+        central_data = b''.join(central)
+        f.write(central_data)
+        f.write(_END_RECORD.pack(0x06054b50, 0, 0, len(central), len(central), len(central_data),
+                                 central_offset, 0))
+    os.replace(tmp_path, archive_path)
+    return archive_path
+
+
+def _write_zip64(archive_path, members, store):
+    """
+    Archives beyond the classic zip limits, still deterministic but
+    recompressed by zipfile /
+    Архивы сверх ограничений классического zip, тоже детерминированные, но
+    заново сжатые zipfile
+    """
+    tmp_path = f'{archive_path}.tmp-{os.getpid()}'
+    with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True,
+                         compresslevel=COMPRESS_LEVEL) as archive:
+        for name, member in members:
+            info = zipfile.ZipInfo(name, ZIP_DATE_TIME)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = _EXTERNAL_ATTR
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            with open(store.payload_path(member['sha256']), 'rb') as payload, \
+                    archive.open(info, 'w', force_zip64=True) as target:
+                for block in iter(lambda: payload.read(1 << 20), b''):
+                    target.write(decompressor.decompress(block))
+                target.write(decompressor.flush())
+    os.replace(tmp_path, archive_path)
+    return archive_path
+
+
+def write_archive(archive_path, directory, store=None):
+    """
+    Deterministic zip of a directory; files staged earlier are not
+    compressed again / Детерминированный zip директории; ранее добавленные
+    файлы не сжимаются повторно
+
+    Returns {archive name: member} / Возвращает {имя в архиве: член}
+    """
+    store = MemberStore() if store is None else store
+    members = [(name, store.stage(path)) for name, path in directory_files(directory)]
+    write_zip(archive_path, members, store)
+    return dict(members)
+
+
+def load_package_manifest(path=PACKAGE_MANIFEST):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'version': None, 'files': {}}
+
+
+def package_version(files) -> str:
+    """Content hash of a package listing / Хеш содержимого списка файлов пакета"""
+    return hashlib.sha256(json.dumps(files, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def write_delta(archives, store, manifest_path=PACKAGE_MANIFEST, output_dir=BASE_DIR):
+    """
+    Zip of only the files that changed since the last package plus a manifest
+    with the base and new versions, the full file list and removed files;
+    the package manifest is then advanced to the new version /
+    Zip только с файлами, изменившимися с последнего пакета, и манифестом с
+    базовой и новой версиями, полным списком файлов и удаленными файлами;
+    затем манифест пакета переводится на новую версию
+
+    archives is {archive name: {name in archive: member}} /
+    archives - {имя архива: {имя в архиве: член}}
+
+    Returns the delta path, or None when nothing changed /
+    Возвращает путь дельты или None, если ничего не изменилось
+    """
+    members = {f'{archive_name}/{name}': member
+               for archive_name, archive_members in archives.items()
+               for name, member in archive_members.items()}
+    files = {name: {'sha256': member['sha256'], 'bytes': member['size']} for name, member in members.items()}
+    version = package_version(files)
+
+    previous = load_package_manifest(manifest_path)
+    if previous.get('version') == version:
+        return None
+    changed = sorted(name for name, file in files.items()
+                     if previous['files'].get(name, {}).get('sha256') != file['sha256'])
+    manifest = {
+        'version': version,
+        'base': previous.get('version'),
+        'files': files,
+        'changed': changed,
+        'removed': sorted(set(previous['files']) - set(files))
+    }
+    manifest_data = json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8')
+
+    delta_path = os.path.join(output_dir, f"model_delta_{(previous.get('version') or 'full')[:12]}_{version[:12]}.zip")
+    write_zip(delta_path, [(DELTA_MANIFEST, store.stage_bytes(manifest_data))] +
+              [(name, members[name]) for name in changed], store)
+    _write_atomic(manifest_path, json.dumps({'version': version, 'files': files}, indent=2,
+                                            sort_keys=True).encode('utf-8'))
+    print(f"Delta of {len(changed)} changed and {len(manifest['removed'])} removed files "
+          f"written to {delta_path}")
+    return delta_path
+
+
+def package_directories(directories, store_dir=MEMBER_DIR, manifest_path=PACKAGE_MANIFEST, output_dir=BASE_DIR):
+    """
+    Full deterministic archive of every {archive name: directory}, a delta
+    against the last package, and pruning of payloads no longer packaged /
+    Полный детерминированный архив каждой {имя архива: директория}, дельта
+    относительно последнего пакета и удаление больше не упакованных данных
+
+    Returns ([archive paths], delta path or None) / Возвращает ([пути архивов], путь дельты или None)
+    """
+    import instrumentation
+
+    store = MemberStore(store_dir)
+    recorder = instrumentation.recorder()
+    archives, archive_paths = {}, []
+    for archive_name, directory in directories.items():
+        archive_path = os.path.join(output_dir, f'{archive_name}.zip')
+        with recorder.stage('archive'):
+            archives[archive_name] = write_archive(archive_path, directory, store)
+        recorder.artifact(archive_path, 'archive')
+        archive_paths.append(archive_path)
+
+    with recorder.stage('delta'):
+        delta_path = write_delta(archives, store, manifest_path, output_dir)
+    if delta_path is not None:
+        recorder.artifact(delta_path, 'delta')
+
+    store.prune({member['sha256'] for members in archives.values() for member in members.values()})
+    return archive_paths, delta_path
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Deterministic archives and a delta of updated models / "
+                                                 "Детерминированные архивы и дельта обновленных моделей")
+    parser.add_argument('--model-dir', default=os.path.join(BASE_DIR, 'model_updated'))
+    parser.add_argument('--info-dir', default=os.path.join(BASE_DIR, 'model_info_updated'))
+    parser.add_argument('--keras-dir', default=os.path.join(BASE_DIR, 'model_keras_updated'))
+    parser.add_argument('--manifest', default=PACKAGE_MANIFEST)
+    parser.add_argument('--output-dir', default=BASE_DIR)
+    args = parser.parse_args(argv)
+
+    package_directories({os.path.basename(os.path.normpath(directory)): directory
+                         for directory in (args.model_dir, args.info_dir, args.keras_dir)},
+                        manifest_path=args.manifest, output_dir=args.output_dir)
+
+
+if __name__ == "__main__":
+    main()
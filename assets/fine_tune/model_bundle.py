@@ -0,0 +1,282 @@
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from city_csv import CSV_COLUMNS
+from day_index import ZERO_DATE, days_since_zero_date
+from sine_model import NUMBER_OF_SINUSES
+
+# File layout / Формат файла:
+#   header (HEADER_SIZE bytes): magic, version, header size, record count,
+#   number of sinuses, record size; then `count` fixed-size records sorted by key
+#   заголовок (HEADER_SIZE байт): magic, версия, размер заголовка, число записей,
+#   число синусоид, размер записи; затем `count` записей фиксированного размера,
+#   отсортированных по ключу
+MAGIC = b'SINB'
+VERSION = 1
+HEADER_SIZE = 64
+_HEADER = struct.Struct('<4sHHIII')
+KEY_SEPARATOR = '/'
+BUNDLE_FILE = 'model_bundle.bin'
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def record_dtype(number_of_sinuses=NUMBER_OF_SINUSES) -> np.dtype:
+    """Fixed little-endian record of one model / Запись одной модели фиксированного размера"""
+    return np.dtype([
+        ('key', 'S80'),
+        ('city', 'S48'),
+        ('parameter', 'S24'),
+        ('coefficients', '<f4', (number_of_sinuses * 3 + 1,)),
+        ('mean', '<f8'),
+        ('std_dev', '<f8'),
+        ('denoised_length', '<i4'),
+        # Last day of training data since ZERO_DATE, -1 if unknown /
+        # Последний день данных обучения от ZERO_DATE, -1 если неизвестен
+        ('data_end_day', '<i4'),
+    ])
+
+
+def model_key(city, parameter) -> bytes:
+    return f'{city}{KEY_SEPARATOR}{parameter}'.encode('utf-8')
+
+
+def split_model_name(stem, city=None):
+    """
+    (city, parameter) of a model file name like 'New York_wind_speed_max';
+    city names may contain spaces and parameters contain underscores /
+    (город, параметр) из имени файла модели вида 'New York_wind_speed_max';
+    названия городов могут содержать пробелы, а параметры - подчеркивания
+    """
+    if city and stem.startswith(city + '_'):
+        return city, stem[len(city) + 1:]
+    for column in CSV_COLUMNS[1:]:
+        if stem.endswith('_' + column):
+            return stem[:-len(column) - 1], column
+    city, _, parameter = stem.partition('_')
+    return city, parameter
+
+
+def _fixed_bytes(dtype, field, value: bytes, city, parameter) -> bytes:
+    """
+    value if it fits the fixed-width field; numpy would cut it silently /
+    value, если помещается в поле фиксированной ширины; numpy обрезал бы молча
+    """
+    size = dtype[field].itemsize
+    if len(value) > size:
+        raise ValueError(f"Model {city} - {parameter}: {field} is {len(value)} bytes in UTF-8, "
+                         f"the bundle holds at most {size}")
+    return value
+
+
+def pack_records(models, number_of_sinuses=NUMBER_OF_SINUSES) -> np.ndarray:
+    """
+    Bundle records sorted by key / Записи пакета, отсортированные по ключу
+
+    models: iterable of dicts with 'city', 'parameter', 'coefficients', 'mean',
+    'std_dev', 'denoised_length' and optional 'data_end_date' /
+    models: последовательность словарей с 'city', 'parameter', 'coefficients',
+    'mean', 'std_dev', 'denoised_length' и необязательной 'data_end_date'
+    """
+    models = list(models)
+    dtype = record_dtype(number_of_sinuses)
+    records = np.zeros(len(models), dtype=dtype)
+    for record, model in zip(records, models):
+        city, parameter = model['city'], model['parameter']
+        record['key'] = _fixed_bytes(dtype, 'key', model_key(city, parameter), city, parameter)
+        record['city'] = _fixed_bytes(dtype, 'city', city.encode('utf-8'), city, parameter)
+        record['parameter'] = _fixed_bytes(dtype, 'parameter', parameter.encode('utf-8'), city, parameter)
+        record['coefficients'] = np.asarray(model['coefficients'], dtype=np.float32)
+        record['mean'] = model['mean']
+        record['std_dev'] = model['std_dev']
+        record['denoised_length'] = model['denoised_length']
+        end_date = model.get('data_end_date')
+        record['data_end_day'] = -1 if end_date is None else days_since_zero_date(end_date)
+
+    records = records[np.argsort(records['key'], kind='stable')]
+    if len(np.unique(records['key'])) != len(records):
+        raise ValueError("Duplicate (city, parameter) in bundle")
+    return records
+
+
+def write_bundle(path, models, number_of_sinuses=NUMBER_OF_SINUSES):
+    """
+    Write all models (see pack_records) into one bundle file atomically /
+    Атомарно записать все модели (см. pack_records) в один файл пакета
+    """
+    records = pack_records(models, number_of_sinuses)
+    dtype = records.dtype
+    header = _HEADER.pack(MAGIC, VERSION, HEADER_SIZE, len(records), number_of_sinuses, dtype.itemsize)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header.ljust(HEADER_SIZE, b'\0'))
+        f.write(records.tobytes())
+    os.replace(tmp_path, path)
+    return len(records)
+
+
+def collect_models(keras_dir, info_dir):
+    """
+    Coefficients and metadata of every .keras model with its info JSON /
+    Коэффициенты и метаданные каждой модели .keras с ее JSON информацией
+    """
+    from sine_model import read_keras_coefficients
+
+    models = []
+    for model_file in sorted(os.listdir(keras_dir)):
+        if not model_file.endswith('.keras'):
+            continue
+        stem = model_file[:-len('.keras')]
+        info_path = os.path.join(info_dir, f'{stem}_info.json')
+        try:
+            coefficients, constants = read_keras_coefficients(os.path.join(keras_dir, model_file))
+        except Exception as e:
+            print(f"Skipping {model_file}: {e}")
+            continue
+
+        info = {}
+        if os.path.exists(info_path):
+            with open(info_path, 'r') as f:
+                info = json.load(f)
+        # Info JSON wins over the constants baked into the model /
+        # JSON информации важнее констант внутри модели
+        constants.update({name: info[name] for name in ('mean', 'std_dev', 'denoised_length') if name in info})
+        if not {'mean', 'std_dev', 'denoised_length'} <= set(constants):
+            print(f"Skipping {model_file}: no normalization constants")
+            continue
+
+        city, parameter = split_model_name(stem, info.get('city'))
+        models.append({
+            'city': city,
+            'parameter': parameter,
+            'coefficients': coefficients,
+            'mean': constants['mean'],
+            'std_dev': constants['std_dev'],
+            'denoised_length': constants['denoised_length'],
+            'data_end_date': info.get('data_end_date')
+        })
+    return models
+
+
+def record_indices(records, cities, parameters) -> np.ndarray:
+    """
+    Record indices (C, P) for every city x parameter, -1 if missing /
+    Индексы записей (C, P) для каждой пары город x параметр, -1 если нет
+    """
+    keys = np.array([[model_key(city, parameter) for parameter in parameters] for city in cities],
+                    dtype=records.dtype['key']).reshape(len(cities), len(parameters))
+    positions = np.searchsorted(records['key'], keys)
+    safe = np.minimum(positions, max(len(records) - 1, 0))
+    found = (positions < len(records)) & (records['key'][safe] == keys)
+    return np.where(found, positions, -1)
+
+
+def build_bundle(keras_dir, info_dir, bundle_path):
+    """Pack a model directory into one bundle / Упаковать директорию моделей в один пакет"""
+    count = write_bundle(bundle_path, collect_models(keras_dir, info_dir))
+    print(f"Bundle with {count} models written to {bundle_path}")
+    return count
+
+
+class ModelBundle:
+    """
+    Read-only memory-mapped bundle; records are a NumPy view of the file /
+    Пакет только для чтения, отображенный в память; записи - представление NumPy файла
+    """
+
+    def __init__(self, path) -> None:
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, header_size, count, number_of_sinuses, record_size = \
+            _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a model bundle")
+        if version != VERSION:
+            raise ValueError(f"Unsupported bundle version {version} in {path}")
+
+        dtype = record_dtype(number_of_sinuses)
+        if dtype.itemsize != record_size:
+            raise ValueError(f"Record size {record_size} does not match version {version}")
+
+        self.version = version
+        self.number_of_sinuses = number_of_sinuses
+        self.records = np.frombuffer(self._mmap, dtype=dtype, count=count, offset=header_size)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __contains__(self, city_parameter) -> bool:
+        return self.find(*city_parameter) is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.records = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Views handed out are still alive, the map closes with them /
+            # Выданные представления еще живы, отображение закроется вместе с ними
+            pass
+
+    def keys(self):
+        return [(record['city'].decode('utf-8'), record['parameter'].decode('utf-8'))
+                for record in self.records]
+
+    def find(self, city, parameter):
+        """Record index or None, by binary search / Индекс записи или None, двоичным поиском"""
+        key = model_key(city, parameter)
+        index = int(np.searchsorted(self.records['key'], key))
+        if index < len(self.records) and self.records['key'][index] == key:
+            return index
+        return None
+
+    def indices(self, cities, parameters) -> np.ndarray:
+        """
+        Record indices (C, P) for every city x parameter, -1 if missing /
+        Индексы записей (C, P) для каждой пары город x параметр, -1 если нет
+        """
+        return record_indices(self.records, cities, parameters)
+
+    def get(self, city, parameter):
+        """Record (numpy.void view) of one model / Запись (представление numpy.void) одной модели"""
+        index = self.find(city, parameter)
+        if index is None:
+            raise KeyError(f"No model for {city} - {parameter}")
+        return self.records[index]
+
+    def coefficients(self, city, parameter) -> np.ndarray:
+        return self.get(city, parameter)['coefficients']
+
+    def data_end_date(self, city, parameter):
+        day = int(self.get(city, parameter)['data_end_day'])
+        return None if day < 0 else (ZERO_DATE + day).item()
+
+
+def open_bundle(path) -> ModelBundle:
+    return ModelBundle(path)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pack models into one bundle / Упаковать модели в один пакет")
+    parser.add_argument('--keras-dir', default=os.path.join(BASE_DIR, 'model_keras_updated'))
+    parser.add_argument('--info-dir', default=os.path.join(BASE_DIR, 'model_info_updated'))
+    parser.add_argument('--output', default=os.path.join(BASE_DIR, BUNDLE_FILE))
+    args = parser.parse_args(argv)
+
+    build_bundle(args.keras_dir, args.info_dir, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,53 +1,44 @@
-import requests
-import pandas as pd
-import time
-from datetime import datetime
 import json
+import os
 
-def get_weather_history(lat, lon, start_year=2025, end_year=2025):
-    base_url = "https://archive-api.open-meteo.com/v1/archive"
-
-    today = f"2025-04-08" #datetime.today().strftime("%Y-%m-%d")
-    dfs = []
-
-    for year in range(start_year, end_year + 1):
-        end_date = f"{year}-12-31"
-        if year == end_year:
-            end_date = today
-
-        params = {
-            "latitude": lat,
-            "longitude": lon,
-            "start_date": f"2025-03-08",
-            "end_date": end_date,
-            "daily": ["temperature_2m_mean", "relative_humidity_2m_mean", "wind_speed_10m_max"],
-            "timezone": "auto"
-        }
-        response = requests.get(base_url, params=params)
-
-        if response.status_code == 200:
-            data = response.json()
-            df = pd.DataFrame({
-                "date": data["daily"]["time"],
-                "temperature_avg": data["daily"]["temperature_2m_mean"],
-                "humidity_avg": data["daily"]["relative_humidity_2m_mean"],
-                "wind_speed_max": data["daily"]["wind_speed_10m_max"]
-            })
-            dfs.append(df)
-        else:
-            print(f"Error for {year}: {response.status_code}")
-
-    # Gộp tất cả dữ liệu lại thành một DataFrame
-    weather_df = pd.concat(dfs, ignore_index=True)
-    return weather_df
-
-with open('city_coords.json', 'r') as f:
-    city_coords = json.load(f)
-
-for city in city_coords:
-    latitude, longitude = city_coords[city]
-    weather_data = get_weather_history(latitude, longitude)
-    print(f"{city}: Latitude: {latitude}, Longitude: {longitude}")
-    time.sleep(0.2)
-    weather_data.to_csv(f"cities/{city}.csv", index=False)
+ASSETS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.path.join(ASSETS_DIR, 'response_cache')
 
+
+def refresh(data_dir=None, coords_path=None, end_date=None, cache_dir=CACHE_DIR, offline=False):
+    """
+    Fetch only the days after the last stored date of each or_cities/*.csv;
+    offline=True rebuilds the CSVs from the response cache without the API /
+    Загрузить только дни после последней сохраненной даты каждого or_cities/*.csv;
+    offline=True пересобирает CSV из кэша ответов без обращения к API
+    """
+    from downloader import rebuild_cities, refresh_cities
+    from response_cache import ResponseCache
+
+    with open(coords_path or os.path.join(ASSETS_DIR, 'city_coords.json'), 'r') as f:
+        city_coords = json.load(f)
+    data_dir = data_dir or os.path.join(ASSETS_DIR, 'or_cities')
+    cache = ResponseCache(cache_dir) if cache_dir else None
+
+    if offline:
+        return rebuild_cities(city_coords, cache, data_dir, end_date=end_date)
+    return refresh_cities(city_coords, data_dir, end_date, cache=cache)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Append new days to city CSVs / Дописать новые дни в CSV городов")
+    parser.add_argument('--data-dir', default=None)
+    parser.add_argument('--coords', default=None, help="city_coords.json path / путь к city_coords.json")
+    parser.add_argument('--end', default=None, help="last date, default today / последняя дата, по умолчанию сегодня")
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help="empty to disable / пусто, чтобы отключить")
+    parser.add_argument('--offline', action='store_true',
+                        help="rebuild CSVs from the cache only / пересобрать CSV только из кэша")
+    args = parser.parse_args(argv)
+
+    refresh(args.data_dir, args.coords, args.end, args.cache_dir, args.offline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+
+# Open-Meteo archive values of the last days may still be revised /
+# Значения архива Open-Meteo за последние дни еще могут уточняться
+REVISION_DAYS = 7
+# Lifetime of a response that covers revisable days / Время жизни ответа с уточняемыми днями
+RECENT_TTL_SECONDS = 24 * 3600
+
+OBJECTS_DIR = 'objects'
+REQUESTS_DIR = 'requests'
+
+
+def location(lat, lon):
+    """(lat, lon) as stored in request keys / (широта, долгота) как в ключах запросов"""
+    return f'{float(lat):.4f}', f'{float(lon):.4f}'
+
+
+def request_key(params, base_url) -> dict:
+    """
+    Canonical (url, lat, lon, variables, date range) of a request /
+    Каноническое представление (url, широта, долгота, переменные, даты) запроса
+    """
+    latitude, longitude = location(params['latitude'], params['longitude'])
+    return {
+        'url': base_url,
+        'latitude': latitude,
+        'longitude': longitude,
+        'daily': sorted(params['daily']),
+        'start_date': str(params['start_date']),
+        'end_date': str(params['end_date']),
+        'timezone': params.get('timezone')
+    }
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _key_hash(key) -> str:
+    return _digest(json.dumps(key, sort_keys=True).encode('utf-8'))
+
+
+def _write_atomic(path, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class ResponseCache:
+    """
+    On-disk cache of raw API responses. Bodies are gzip files named by the
+    hash of their content (objects/), requests point to them by the hash of
+    their canonical key (requests/) and record when they were fetched /
+    Дисковый кэш сырых ответов API. Тела хранятся в gzip файлах с именем по
+    хешу содержимого (objects/), запросы ссылаются на них по хешу
+    канонического ключа (requests/) и хранят время загрузки
+
+    A response whose end date was older than revision_days when fetched is
+    final and never expires; other responses expire after recent_ttl seconds /
+    Ответ, конечная дата которого на момент загрузки старше revision_days,
+    окончательный и не устаревает; остальные устаревают через recent_ttl секунд
+    """
+
+    def __init__(self, cache_dir, revision_days=REVISION_DAYS, recent_ttl=RECENT_TTL_SECONDS) -> None:
+        self.cache_dir = cache_dir
+        self.revision_days = revision_days
+        self.recent_ttl = recent_ttl
+
+    def _request_path(self, key_hash):
+        return os.path.join(self.cache_dir, REQUESTS_DIR, key_hash[:2], f'{key_hash}.json')
+
+    def _object_path(self, content_hash):
+        return os.path.join(self.cache_dir, OBJECTS_DIR, content_hash[:2], f'{content_hash}.json.gz')
+
+    def is_final(self, entry) -> bool:
+        fetched_date = datetime.fromtimestamp(entry['fetched_at']).date()
+        return date.fromisoformat(entry['key']['end_date']) <= fetched_date - timedelta(days=self.revision_days)
+
+    def is_fresh(self, entry, now=None) -> bool:
+        now = time.time() if now is None else now
+        return self.is_final(entry) or now - entry['fetched_at'] < self.recent_ttl
+
+    def lookup(self, params, base_url):
+        """Request entry or None / Запись запроса или None"""
+        try:
+            with open(self._request_path(_key_hash(request_key(params, base_url))), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load(self, entry) -> bytes:
+        """Raw response body of an entry / Сырое тело ответа записи"""
+        with gzip.open(self._object_path(entry['object']), 'rb') as f:
+            return f.read()
+
+    def get(self, params, base_url, allow_stale=False):
+        """
+        Parsed response, or None when missing or expired /
+        Разобранный ответ или None, если его нет или он устарел
+        """
+        entry = self.lookup(params, base_url)
+        if entry is None or not (allow_stale or self.is_fresh(entry)):
+            return None
+        try:
+            return json.loads(self.load(entry))
+        except (OSError, ValueError, EOFError):
+            return None
+
+    def put(self, params, base_url, body: bytes, fetched_at=None) -> dict:
+        """Store a raw response body / Сохранить сырое тело ответа"""
+        key = request_key(params, base_url)
+        content_hash = _digest(body)
+        object_path = self._object_path(content_hash)
+        if not os.path.exists(object_path):
+            # mtime=0 keeps the file bytes a function of the body /
+            # mtime=0 делает байты файла функцией только тела
+            _write_atomic(object_path, gzip.compress(body, mtime=0))
+        entry = {
+            'key': key,
+            'object': content_hash,
+            'bytes': len(body),
+            'fetched_at': time.time() if fetched_at is None else fetched_at
+        }
+        _write_atomic(self._request_path(_key_hash(key)), json.dumps(entry, sort_keys=True).encode('utf-8'))
+        return entry
+
+    def entries(self):
+        """All request entries / Все записи запросов"""
+        requests_dir = os.path.join(self.cache_dir, REQUESTS_DIR)
+        if not os.path.exists(requests_dir):
+            return
+        for prefix in sorted(os.listdir(requests_dir)):
+            for name in sorted(os.listdir(os.path.join(requests_dir, prefix))):
+                if name.endswith('.json'):
+                    try:
+                        with open(os.path.join(requests_dir, prefix, name), 'r') as f:
+                            yield json.load(f)
+                    except (OSError, ValueError):
+                        continue
+
+    def location_index(self, variables, base_url=None) -> dict:
+        """
+        {(lat, lon): entries holding all the variables, oldest fetch first} in
+        one pass over the cache /
+        {(широта, долгота): записи со всеми переменными, сначала самые ранние}
+        за один проход по кэшу
+        """
+        index = {}
+        for entry in self.entries():
+            key = entry['key']
+            if set(variables) <= set(key['daily']) and (base_url is None or key['url'] == base_url):
+                index.setdefault((key['latitude'], key['longitude']), []).append(entry)
+        for found in index.values():
+            found.sort(key=lambda entry: entry['fetched_at'])
+        return index
@@ -0,0 +1,170 @@
+import numpy as np
+import tensorflow as tf
+
+from sine_model import NUMBER_OF_SINUSES
+
+# Fine-tune windows are ~32 days; longer series need a larger trainer /
+# Окна дообучения ~32 дня; для длинных рядов нужен тренер побольше
+MAX_SAMPLES = 64
+
+
+class SinTrainer:
+    """
+    One compiled Adam training loop for a single SinLayer, reused for every job /
+    Один скомпилированный цикл обучения Adam для одного SinLayer, общий для всех заданий
+
+    The whole fit (shuffling, mini-batches, Keras-style validation split, early
+    stopping and restore of the best weights) runs inside one tf.function
+    with a fixed input signature: data is padded to max_samples and every
+    setting is a tensor argument, so the graph is traced once per process /
+    Весь fit (перемешивание, мини-батчи, разбиение на валидацию как в Keras,
+    ранняя остановка и восстановление лучших весов) выполняется в одной
+    tf.function с фиксированной сигнатурой: данные дополняются до max_samples,
+    а все настройки передаются тензорами, поэтому граф трассируется один раз
+    на процесс
+    """
+
+    def __init__(self, number_of_sinuses=NUMBER_OF_SINUSES, max_samples=MAX_SAMPLES,
+                 jit_compile=False, epsilon=1e-7) -> None:
+        self.number_of_sinuses = number_of_sinuses
+        self.max_samples = max_samples
+        self.epsilon = epsilon
+        self.trace_count = 0
+
+        self.kernel = tf.Variable(tf.zeros((number_of_sinuses, 3)), name="kernel")
+        self.bias = tf.Variable(0.0, name="bias")
+
+        scalar = tf.TensorSpec((), tf.float32)
+        count = tf.TensorSpec((), tf.int32)
+        series = tf.TensorSpec((max_samples,), tf.float32)
+        self._fit = tf.function(
+            self._fit_loop,
+            input_signature=[series, series, count, count, count, count, scalar,
+                             scalar, scalar, scalar, tf.TensorSpec((2,), tf.int32)],
+            jit_compile=jit_compile
+        )
+
+    @staticmethod
+    def _loss(kernel, bias, x, y, mask):
+        harmonics = kernel[:, 0] * tf.sin(x[:, None] * kernel[:, 1] + kernel[:, 2])
+        error = (tf.reduce_sum(harmonics, axis=-1) + bias - y) * mask
+        return tf.reduce_sum(tf.square(error)) / tf.maximum(tf.reduce_sum(mask), 1.0)
+
+    def _fit_loop(self, x, y, n, batch_size, epochs, patience, validation_split,
+                  learning_rate, beta_1, beta_2, seed):
+        # Python side effect: runs only while tracing / Выполняется только при трассировке
+        self.trace_count += 1
+
+        positions = tf.range(self.max_samples)
+        # Keras split: the last fraction of samples is validation /
+        # Разбиение Keras: последняя доля выборки - валидация
+        n_train = tf.cast(tf.cast(n, tf.float32) * (1.0 - validation_split), tf.int32)
+        train_mask = positions < n_train
+        val_mask = (positions >= n_train) & (positions < n)
+        monitor_mask = tf.cast(tf.where(n > n_train, val_mask, train_mask), tf.float32)
+        steps_per_epoch = (n_train + batch_size - 1) // batch_size
+
+        kernel = self.kernel.read_value()
+        bias = self.bias.read_value()
+        zeros_kernel = tf.zeros_like(kernel)
+        zero = tf.constant(0.0)
+
+        def train_step(step, order_rank, kernel, bias, m_kernel, v_kernel, m_bias, v_bias, t):
+            # Batch = rows whose shuffled rank falls into this step /
+            # Батч = строки, чей номер после перемешивания попадает в этот шаг
+            start = step * batch_size
+            in_batch = (order_rank >= start) & (order_rank < tf.minimum(start + batch_size, n_train))
+            with tf.GradientTape() as tape:
+                tape.watch([kernel, bias])
+                loss = self._loss(kernel, bias, x, y, tf.cast(in_batch, tf.float32))
+            grad_kernel, grad_bias = tape.gradient(loss, [kernel, bias])
+
+            t = t + 1.0
+            alpha = learning_rate * tf.sqrt(1.0 - tf.pow(beta_2, t)) / (1.0 - tf.pow(beta_1, t))
+            m_kernel = beta_1 * m_kernel + (1.0 - beta_1) * grad_kernel
+            v_kernel = beta_2 * v_kernel + (1.0 - beta_2) * tf.square(grad_kernel)
+            m_bias = beta_1 * m_bias + (1.0 - beta_1) * grad_bias
+            v_bias = beta_2 * v_bias + (1.0 - beta_2) * tf.square(grad_bias)
+            kernel = kernel - alpha * m_kernel / (tf.sqrt(v_kernel) + self.epsilon)
+            bias = bias - alpha * m_bias / (tf.sqrt(v_bias) + self.epsilon)
+            return kernel, bias, m_kernel, v_kernel, m_bias, v_bias, t
+
+        def epoch_body(epoch, wait, best_loss, best_kernel, best_bias, kernel, bias,
+                       m_kernel, v_kernel, m_bias, v_bias, t):
+            # Shuffle training rows only: padding and validation sort last /
+            # Перемешать только строки обучения: дополнение и валидация идут в конец
+            keys = tf.random.stateless_uniform((self.max_samples,), seed + tf.stack([epoch, 0]))
+            keys = tf.where(train_mask, keys, 2.0)
+            order_rank = tf.math.invert_permutation(tf.argsort(keys))
+
+            def step_body(step, kernel, bias, m_kernel, v_kernel, m_bias, v_bias, t):
+                return (step + 1,) + train_step(step, order_rank, kernel, bias,
+                                                m_kernel, v_kernel, m_bias, v_bias, t)
+
+            _, kernel, bias, m_kernel, v_kernel, m_bias, v_bias, t = tf.while_loop(
+                lambda step, *_: step < steps_per_epoch, step_body,
+                (tf.constant(0), kernel, bias, m_kernel, v_kernel, m_bias, v_bias, t)
+            )
+
+            loss = self._loss(kernel, bias, x, y, monitor_mask)
+            improved = loss < best_loss
+            best_loss = tf.where(improved, loss, best_loss)
+            best_kernel = tf.where(improved, kernel, best_kernel)
+            best_bias = tf.where(improved, bias, best_bias)
+            wait = tf.where(improved, 0, wait + 1)
+            return (epoch + 1, wait, best_loss, best_kernel, best_bias, kernel, bias,
+                    m_kernel, v_kernel, m_bias, v_bias, t)
+
+        epoch, _, best_loss, best_kernel, best_bias, *_ = tf.while_loop(
+            lambda epoch, wait, *_: (epoch < epochs) & (wait < patience), epoch_body,
+            (tf.constant(0), tf.constant(0), tf.constant(np.inf, tf.float32), kernel, bias,
+             kernel, bias, zeros_kernel, zeros_kernel, zero, zero, zero)
+        )
+        self.kernel.assign(best_kernel)
+        self.bias.assign(best_bias)
+        return best_loss, epoch
+
+    def fit(self, x, y, kernel, bias, epochs=50, batch_size=16, validation_split=0.2, patience=10,
+            learning_rate=0.0005, beta_1=0.9, beta_2=0.999, seed=0):
+        """
+        Train from (kernel, bias) on up to max_samples points /
+        Обучить от (kernel, bias) на не более чем max_samples точках
+
+        Returns (kernel, bias, best_loss, epochs_run) / Возвращает (kernel, bias, best_loss, epochs_run)
+        """
+        x = np.ravel(x).astype(np.float32)
+        y = np.ravel(y).astype(np.float32)
+        n = len(x)
+        if n > self.max_samples:
+            raise ValueError(f"{n} samples do not fit into a trainer built for {self.max_samples}")
+
+        padded_x = np.zeros(self.max_samples, dtype=np.float32)
+        padded_y = np.zeros(self.max_samples, dtype=np.float32)
+        padded_x[:n] = x
+        padded_y[:n] = y
+
+        self.kernel.assign(np.asarray(kernel, dtype=np.float32))
+        self.bias.assign(np.float32(bias))
+        best_loss, epochs_run = self._fit(
+            padded_x, padded_y, np.int32(n), np.int32(max(1, batch_size)), np.int32(epochs),
+            np.int32(patience), np.float32(validation_split), np.float32(learning_rate),
+            np.float32(beta_1), np.float32(beta_2), np.array([seed, 0], dtype=np.int32)
+        )
+        return self.kernel.numpy(), self.bias.numpy(), float(best_loss), int(epochs_run)
+
+
+_trainers = {}
+
+
+def get_trainer(number_of_sinuses=NUMBER_OF_SINUSES, samples=0, jit_compile=False):
+    """
+    Process-wide shared trainer for series of up to `samples` points; sizes are
+    rounded up to powers of two so only a few graphs ever exist /
+    Общий тренер процесса для рядов длиной до `samples` точек; размеры
+    округляются вверх до степени двойки, поэтому графов всегда немного
+    """
+    max_samples = max(MAX_SAMPLES, 1 << max(0, samples - 1).bit_length())
+    key = (number_of_sinuses, max_samples, jit_compile)
+    if key not in _trainers:
+        _trainers[key] = SinTrainer(number_of_sinuses, max_samples, jit_compile)
+    return _trainers[key]
@@ -0,0 +1,140 @@
+import io
+import json
+import re
+import zipfile
+
+import numpy as np
+
+NUMBER_OF_SINUSES = 4
+# kernel (K, 3) flattened + bias / kernel (K, 3) в виде вектора + смещение
+NUMBER_OF_COEFFICIENTS = NUMBER_OF_SINUSES * 3 + 1
+
+
+def history_length(denoised_length: int) -> int:
+    """
+    Rows of the training history behind a denoised series (the notebook uses a
+    window of len // 70) / Строк истории обучения за сглаженным рядом (в
+    ноутбуке окно len // 70)
+    """
+    count = denoised_length
+    while count - max(1, count // 70) + 1 < denoised_length:
+        count += 1
+    return count
+
+
+def pack_coefficients(kernel, bias) -> np.ndarray:
+    """SinLayer kernel/bias -> flat coefficient vector / kernel/bias SinLayer -> вектор коэффициентов"""
+    kernel = np.asarray(kernel, dtype=np.float32)
+    return np.append(kernel.reshape(-1), np.float32(bias)).astype(np.float32)
+
+
+def unpack_coefficients(coefficients):
+    """
+    Flat coefficient vector(s) (..., 3K + 1) -> kernel (..., K, 3), bias (...) /
+    Вектор(ы) коэффициентов (..., 3K + 1) -> kernel (..., K, 3), bias (...)
+    """
+    coefficients = np.asarray(coefficients)
+    kernel = coefficients[..., :-1].reshape(coefficients.shape[:-1] + (-1, 3))
+    return kernel, coefficients[..., -1]
+
+
+def evaluate_sinusoids(coefficients, days, dtype=np.float32) -> np.ndarray:
+    """
+    Evaluate SinLayer for any array of days without TensorFlow /
+    Вычислить SinLayer для любого массива дней без TensorFlow
+
+    sum_k kernel[k, 0] * sin(kernel[k, 1] * day + kernel[k, 2]) + bias
+
+    coefficients may be a single (3K + 1) vector or a stack (M, 3K + 1); the
+    result then has shape days.shape or (M,) + days.shape. float32 by default
+    to match the Keras/TFLite models /
+    coefficients - один вектор (3K + 1) или стопка (M, 3K + 1); результат имеет
+    форму days.shape или (M,) + days.shape. По умолчанию float32, как в моделях
+    Keras/TFLite
+    """
+    kernel, bias = unpack_coefficients(np.asarray(coefficients, dtype=dtype))
+    days = np.asarray(days, dtype=dtype)
+
+    # Broadcast days against harmonics: (..., D, 1) vs (..., 1, K) /
+    # Broadcast дней по гармоникам: (..., D, 1) и (..., 1, K)
+    lead = kernel.shape[:-2]
+    days_column = days.reshape((1,) * len(lead) + (-1, 1))
+    amplitudes = kernel[..., None, :, 0]
+    frequencies = kernel[..., None, :, 1]
+    phases = kernel[..., None, :, 2]
+
+    values = np.sum(amplitudes * np.sin(days_column * frequencies + phases), axis=-1)
+    values += bias[..., None]
+    return values.reshape(lead + days.shape)
+
+
+def evaluate_sinusoids_per_model(coefficients, days, dtype=np.float32) -> np.ndarray:
+    """
+    Evaluate a stack of models (..., 3K + 1) on their own days (..., D) /
+    Вычислить стопку моделей (..., 3K + 1) на собственных днях (..., D)
+    """
+    kernel, bias = unpack_coefficients(np.asarray(coefficients, dtype=dtype))
+    days = np.asarray(days, dtype=dtype)
+    harmonics = kernel[..., None, :, 0] * np.sin(days[..., None] * kernel[..., None, :, 1]
+                                                 + kernel[..., None, :, 2])
+    return np.sum(harmonics, axis=-1) + bias[..., None]
+
+
+def predict_enhanced(coefficients, relative_days, mean, std_dev, denoised_length,
+                     dtype=np.float32) -> np.ndarray:
+    """
+    Same as the enhanced model: DayAdjustmentLayer -> SinLayer -> DenormalizeLayer /
+    То же, что улучшенная модель: DayAdjustmentLayer -> SinLayer -> DenormalizeLayer
+    """
+    days = np.asarray(relative_days, dtype=dtype) + dtype(denoised_length)
+    return evaluate_sinusoids(coefficients, days, dtype) * dtype(std_dev) + dtype(mean)
+
+
+def read_keras_coefficients(model_path):
+    """
+    Read SinLayer coefficients and enhanced-model constants from a .keras
+    archive without importing TensorFlow /
+    Прочитать коэффициенты SinLayer и константы улучшенной модели из архива
+    .keras без импорта TensorFlow
+
+    Returns (coefficients, constants) where constants holds 'denoised_length',
+    'mean' and 'std_dev' when the file is an enhanced model /
+    Возвращает (coefficients, constants), где constants содержит
+    'denoised_length', 'mean' и 'std_dev', если файл - улучшенная модель
+    """
+    import h5py
+
+    with zipfile.ZipFile(model_path) as archive:
+        config = json.loads(archive.read('config.json'))
+        weights = archive.read('model.weights.h5')
+
+    constants = {}
+
+    def collect(layer_configs):
+        for layer in layer_configs:
+            layer_config = layer.get('config', {})
+            if layer.get('class_name') == 'DayAdjustmentLayer':
+                constants['denoised_length'] = layer_config['denoised_length']
+            elif layer.get('class_name') == 'DenormalizeLayer':
+                constants['mean'] = layer_config['mean']
+                constants['std_dev'] = layer_config['std_dev']
+            elif 'layers' in layer_config:
+                collect(layer_config['layers'])
+
+    collect(config['config']['layers'])
+
+    sin_vars = []
+    with h5py.File(io.BytesIO(weights), 'r') as f:
+        def visit(name, obj):
+            # Older Keras versions saved on Windows use backslashes /
+            # Старые версии Keras, сохраненные в Windows, используют обратный слеш
+            parts = re.split(r'[/\\]', name)
+            if not sin_vars and isinstance(obj, h5py.Group) and len(parts) >= 2 \
+                    and parts[-1] == 'vars' and parts[-2].startswith('sin_layer'):
+                sin_vars.append((obj['0'][()], obj['1'][()]))
+        f.visititems(visit)
+
+    if not sin_vars:
+        raise ValueError(f"No SinLayer weights found in {model_path}")
+    kernel, bias = sin_vars[0]
+    return pack_coefficients(kernel, bias), constants
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Flat imports of the fine_tune modules / Плоские импорты модулей fine_tune
+FINE_TUNE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if FINE_TUNE_DIR not in sys.path:
+    sys.path.insert(0, FINE_TUNE_DIR)
@@ -0,0 +1,75 @@
+from datetime import date, timedelta
+
+import numpy as np
+
+from backtest import ModelSet, compare_model_sets, overall_mae, regressions
+from model_bundle import pack_records
+from sine_model import NUMBER_OF_SINUSES
+from weather_store import build_city
+
+DAYS = 100
+GAP_DAY = 50
+HORIZONS = (1, 7, 30)
+# Model inputs are day - last training day + denoised_length: day + 20 /
+# Входы модели - день - последний день обучения + denoised_length: день + 20
+DENOISED_LENGTH = 50
+END_DATE = '2020-01-31'
+
+
+def truth(day):
+    return 10.0 + 2.0 * np.sin(0.1 * (day + 20))
+
+
+def model(city, mean):
+    coefficients = [1.0, 0.1, 0.0] + [0.0] * (3 * (NUMBER_OF_SINUSES - 1)) + [0.0]
+    return {'city': city, 'parameter': 'temperature_avg', 'coefficients': coefficients, 'mean': mean,
+            'std_dev': 2.0, 'denoised_length': DENOISED_LENGTH, 'data_end_date': END_DATE}
+
+
+def write_store(tmp_path):
+    for city in ('Hanoi', 'Paris'):
+        rows = ['date,temperature_avg']
+        for day in range(DAYS):
+            if city == 'Hanoi' and day == GAP_DAY:
+                continue
+            rows.append(f'{date(2020, 1, 1) + timedelta(days=day)},{float(truth(day))!r}')
+        csv_path = tmp_path / f'{city}.csv'
+        csv_path.write_text('\n'.join(rows) + '\n')
+        build_city(str(csv_path), str(tmp_path / 'store'))
+    return str(tmp_path / 'store')
+
+
+def test_backtest_scores_a_synthetic_set(tmp_path):
+    store_dir = write_store(tmp_path)
+    exact = ModelSet('exact', pack_records([model('Hanoi', 10.0), model('Paris', 10.0)]))
+    # Off by 0.5 everywhere and without Paris / Смещен на 0.5 везде и без Парижа
+    biased = ModelSet('biased', pack_records([model('Hanoi', 10.5)]))
+
+    report = compare_model_sets([exact, biased], store_dir, horizons=HORIZONS)
+    assert report['cities'] == ['Hanoi', 'Paris'] and report['parameters'] == ['temperature_avg']
+    assert report['origins']['count'] == DAYS - 1
+
+    metrics = report['metrics']
+    np.testing.assert_allclose(metrics['exact']['mae'], 0.0, atol=1e-4)
+    np.testing.assert_allclose(metrics['biased']['mae'][0, 0], 0.5, atol=1e-4)
+    np.testing.assert_allclose(metrics['biased']['bias'][0, 0], 0.5, atol=1e-4)
+    np.testing.assert_allclose(metrics['biased']['rmse'][0, 0], 0.5, atol=1e-4)
+    assert np.isnan(metrics['biased']['mae'][1]).all() and (metrics['biased']['count'][1] == 0).all()
+
+    # Origins whose target is past the history or on the missing day do not count /
+    # Точки, чья цель за пределами истории или в пропущенный день, не учитываются
+    expected = [DAYS - horizon - (1 if horizon <= GAP_DAY else 0) for horizon in HORIZONS]
+    assert metrics['exact']['count'][0, 0].tolist() == expected
+    assert metrics['exact']['count'][1, 0].tolist() == [DAYS - horizon for horizon in HORIZONS]
+
+    assert abs(overall_mae(report, 'biased') - 0.5) < 1e-4
+    assert [row[2] for row in regressions(report, 'exact', 'biased')] == list(HORIZONS)
+    assert regressions(report, 'biased', 'exact') == []
+
+
+def test_origins_follow_start_end_and_step(tmp_path):
+    store_dir = write_store(tmp_path)
+    exact = ModelSet('exact', pack_records([model('Hanoi', 10.0)]))
+    report = compare_model_sets([exact], store_dir, horizons=(1,), start='2020-02-01', end='2020-02-29', step=7)
+    assert report['origins'] == {'first': '2020-02-01', 'last': '2020-02-29', 'count': 5, 'step': 7}
+    assert report['cities'] == ['Hanoi']
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow')
+
+from batch_trainer import BatchedSinTrainer, model_batch_sizes, pad_batch
+from sine_model import NUMBER_OF_SINUSES
+
+
+def series(length, seed):
+    rng = np.random.default_rng(seed)
+    x = np.arange(length, dtype=np.float32)
+    return x, (np.sin(0.0172 * x) + rng.normal(0.0, 0.1, length)).astype(np.float32)
+
+
+def new_trainer(number_of_models):
+    trainer = BatchedSinTrainer(number_of_models)
+    kernels = np.tile([[0.5, 0.0172, 0.0]], (number_of_models, NUMBER_OF_SINUSES, 1))
+    trainer.reset(kernels, np.zeros(number_of_models))
+    return trainer
+
+
+def test_batch_sizes_follow_fine_tune_model():
+    _, _, mask = pad_batch(*zip(*(series(length, 0) for length in (10, 20, 40, 300))))
+    # min(16, len(X) // 2) per model / min(16, len(X) // 2) для каждой модели
+    assert model_batch_sizes(mask).tolist() == [5, 10, 16, 16]
+
+
+def test_each_model_takes_the_steps_of_its_own_batch_size():
+    lengths = (10, 40, 300)
+    X, Y, mask = pad_batch(*zip(*(series(length, seed) for seed, length in enumerate(lengths))))
+    trainer = new_trainer(len(lengths))
+    trainer.fit(X, Y, mask, epochs=3, batch_size=model_batch_sizes(mask), patience=100, seed=0)
+
+    # Keras: ceil(training samples / batch_size) steps per epoch /
+    # Keras: ceil(обучающие примеры / batch_size) шагов за эпоху
+    expected = [3 * int(np.ceil(int(length * 0.8) / size)) for length, size in zip(lengths, [5, 16, 16])]
+    assert trainer.steps.numpy().tolist() == expected
+
+
+def test_model_trains_the_same_alone_and_in_a_batch():
+    # Batches cover the whole training set, so the shuffle does not matter /
+    # Батчи покрывают всю обучающую выборку, поэтому перемешивание не важно
+    short, long = series(20, 1), series(30, 2)
+    alone = new_trainer(1)
+    X, Y, mask = pad_batch([short[0]], [short[1]])
+    alone.fit(X, Y, mask, epochs=5, batch_size=16, patience=100, seed=0)
+
+    together = new_trainer(2)
+    X, Y, mask = pad_batch([short[0], long[0]], [short[1], long[1]])
+    together.fit(X, Y, mask, epochs=5, batch_size=[16, 8], patience=100, seed=0)
+
+    np.testing.assert_allclose(together.get_weights()[0][0], alone.get_weights()[0][0], rtol=1e-5, atol=1e-6)
+    assert together.steps.numpy().tolist() == [5, 15]
@@ -0,0 +1,38 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow')
+
+from city_export import OUTPUT_NAMES, city_models, export_cities, run_city_model, run_single_model, \
+    verify_city_model
+from conftest import FINE_TUNE_DIR
+
+# Legacy models of the app and their shipped per-parameter TFLite files /
+# Старые модели приложения и их поставленные файлы TFLite по параметрам
+KERAS_DIR = os.path.join(FINE_TUNE_DIR, 'model_keras')
+TFLITE_DIR = os.path.join(FINE_TUNE_DIR, 'modelzz')
+CITY = 'Beijing'
+
+
+@pytest.mark.parametrize('stacked', [False, True])
+def test_city_model_matches_per_parameter_models(tmp_path, stacked):
+    tflite_path = export_cities(KERAS_DIR, str(tmp_path), [CITY], stacked)[CITY]
+    paths = city_models(KERAS_DIR)[CITY]
+
+    # Bit-exact against the same models converted one by one /
+    # Побитово равна тем же моделям, сконвертированным по одной
+    days = np.arange(-10, 400, dtype=np.float32)
+    differences = verify_city_model(tflite_path, paths, days)
+    assert set(differences) == {'temperature', 'humidity', 'wind'}
+
+    # And within float32 rounding of the shipped TFLite files, which an older
+    # converter produced / И в пределах округления float32 от поставленных
+    # файлов TFLite, созданных более старым конвертером
+    outputs = run_city_model(tflite_path, days)
+    for position, (parameter, name) in enumerate(OUTPUT_NAMES.items()):
+        with open(os.path.join(TFLITE_DIR, f'{CITY}_{parameter}.tflite'), 'rb') as f:
+            expected = run_single_model(f.read(), days)
+        actual = outputs['forecast'][:, position] if stacked else outputs[name].reshape(-1)
+        np.testing.assert_allclose(actual, expected, rtol=1e-5, atol=1e-4)
@@ -0,0 +1,157 @@
+import json
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from city_csv import CSV_COLUMNS, write_rows
+from downloader import (DAILY_VARIABLES, TokenBucket, create_session, download_cities, fetch_responses,
+                        refresh_city)
+
+
+def day_value(day, index):
+    """Deterministic value of a variable on a day / Детерминированное значение переменной за день"""
+    return round(day.toordinal() % 97 + index / 10, 1)
+
+
+class StubOpenMeteo(BaseHTTPRequestHandler):
+    """Open-Meteo-shaped archive API / API архива в формате Open-Meteo"""
+
+    def do_GET(self):
+        server = self.server
+        query = parse_qs(urlsplit(self.path).query)
+        server.requests.append(query)
+        if server.failures:
+            status = server.failures.pop(0)
+            self.send_response(status)
+            self.send_header('Retry-After', '0')
+            self.end_headers()
+            return
+
+        start = date.fromisoformat(query['start_date'][0])
+        end = date.fromisoformat(query['end_date'][0])
+        days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+        daily = {'time': [day.isoformat() for day in days]}
+        for index, variable in enumerate(query['daily']):
+            daily[variable] = [day_value(day, index) for day in days]
+        body = json.dumps({'latitude': float(query['latitude'][0]), 'longitude': float(query['longitude'][0]),
+                           'daily': daily}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubOpenMeteo)
+    server.requests = []
+    server.failures = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f'http://127.0.0.1:{server.server_address[1]}/v1/archive'
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_chunked_fetch_covers_range(stub_server):
+    with create_session(pool_size=1) as session:
+        responses = fetch_responses(session, 10.0, 20.0, '2020-01-01', '2020-03-15', stub_server.url,
+                                    max_days_per_request=30)
+
+    ranges = [(query['start_date'][0], query['end_date'][0]) for query in stub_server.requests]
+    assert ranges == [('2020-01-01', '2020-01-30'), ('2020-01-31', '2020-02-29'), ('2020-03-01', '2020-03-15')]
+    days = [day for data in responses for day in data['daily']['time']]
+    assert days[0] == '2020-01-01' and days[-1] == '2020-03-15' and len(days) == len(set(days)) == 75
+    assert set(stub_server.requests[0]['daily']) == set(DAILY_VARIABLES.values())
+
+
+def test_retries_throttled_and_failed_requests(stub_server):
+    stub_server.failures = [429, 503]
+    with create_session(pool_size=1, retries=3, backoff_factor=0) as session:
+        responses = fetch_responses(session, 10.0, 20.0, '2020-01-01', '2020-01-05', stub_server.url)
+
+    assert len(stub_server.requests) == 3
+    assert responses[0]['daily']['time'][-1] == '2020-01-05'
+
+
+class CountingLimiter:
+    def __init__(self):
+        self.tokens = 0
+
+    def acquire(self):
+        self.tokens += 1
+
+
+def test_every_retry_takes_a_rate_limiter_token(stub_server):
+    stub_server.failures = [429, 503]
+    limiter = CountingLimiter()
+    with create_session(pool_size=1, retries=3, backoff_factor=0, rate_limiter=limiter) as session:
+        fetch_responses(session, 10.0, 20.0, '2020-01-01', '2020-01-05', stub_server.url, rate_limiter=limiter)
+
+    assert len(stub_server.requests) == limiter.tokens == 3
+
+
+def test_retries_give_up(stub_server):
+    stub_server.failures = [500] * 5
+    with create_session(pool_size=1, retries=2, backoff_factor=0) as session:
+        with pytest.raises(Exception):
+            fetch_responses(session, 10.0, 20.0, '2020-01-01', '2020-01-05', stub_server.url)
+    assert len(stub_server.requests) == 3
+
+
+def test_refresh_replaces_overlapping_tail(stub_server, tmp_path):
+    csv_path = tmp_path / 'City.csv'
+    first = date(2020, 1, 1)
+    # Stale values in the stored days / Устаревшие значения в сохраненных днях
+    write_rows(str(csv_path), [[(first + timedelta(days=i)).isoformat(), -1.0, -1.0, -1.0] for i in range(10)])
+
+    with create_session(pool_size=1) as session:
+        written = refresh_city(session, str(csv_path), 10.0, 20.0, '2020-01-15', stub_server.url,
+                               overlap_days=3)
+
+    query = stub_server.requests[0]
+    assert (query['start_date'][0], query['end_date'][0]) == ('2020-01-08', '2020-01-15')
+    assert written == 8
+
+    lines = csv_path.read_text().splitlines()
+    assert lines[0] == ','.join(CSV_COLUMNS)
+    rows = [line.split(',') for line in lines[1:]]
+    assert [row[0] for row in rows] == [(first + timedelta(days=i)).isoformat() for i in range(15)]
+    # Rows before the overlap are kept, the overlap is overwritten /
+    # Строки до перекрытия сохранены, перекрытие перезаписано
+    assert all(row[1:] == ['-1.0'] * 3 for row in rows[:7])
+    order = {variable: index for index, variable in enumerate(query['daily'])}
+    for row in rows[7:]:
+        day = date.fromisoformat(row[0])
+        assert [float(value) for value in row[1:]] == \
+            [day_value(day, order[variable]) for variable in DAILY_VARIABLES.values()]
+
+
+def test_download_cities_writes_each_csv(stub_server, tmp_path):
+    results = download_cities({'A': [1.0, 2.0], 'B': [3.0, 4.0]}, str(tmp_path), '2020-01-01', '2020-01-31',
+                              stub_server.url, max_workers=2, requests_per_second=50.0)
+
+    assert sorted(results) == ['A', 'B']
+    for city in ('A', 'B'):
+        lines = (tmp_path / f'{city}.csv').read_text().splitlines()
+        assert lines[0] == ','.join(CSV_COLUMNS) and len(lines) == 32
+    assert len(stub_server.requests) == 2
+
+
+def test_token_bucket_rate():
+    bucket = TokenBucket(rate=20.0, capacity=1.0)
+    start = time.monotonic()
+    for _ in range(11):
+        bucket.acquire()
+    elapsed = time.monotonic() - start
+    # First token is free, the next ten take 10 / 20 s / Первый токен бесплатный, следующие десять - 0.5 с
+    assert 0.45 <= elapsed < 1.5
@@ -0,0 +1,82 @@
+import json
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow')
+
+import fine_tune
+from city_csv import write_rows
+from sine_model import history_length
+
+CITY = 'Testville'
+PARAMETER = 'temperature_avg'
+DENOISED_LENGTH = 280
+FIRST_DAY = date(2020, 1, 1)
+
+
+def temperatures(count):
+    return np.round(10 + 8 * np.sin(np.arange(count) / 58.0) + np.arange(count) % 7 / 10, 1)
+
+
+def write_city(path, values):
+    write_rows(str(path), [((FIRST_DAY + timedelta(days=i)).isoformat(), value, 60.0, 3.0)
+                           for i, value in enumerate(values)])
+
+
+def test_second_update_merges_only_the_days_after_the_stored_statistics(tmp_path, monkeypatch):
+    count = history_length(DENOISED_LENGTH)
+    values = temperatures(count + 120)
+    (tmp_path / 'data').mkdir()
+    (tmp_path / 'keras').mkdir()
+    (tmp_path / 'info').mkdir()
+    (tmp_path / 'info_updated').mkdir()
+    city_file = tmp_path / 'data' / f'{CITY}.csv'
+    (tmp_path / 'keras' / f'{CITY}_{PARAMETER}.keras').write_bytes(b'')
+    # Legacy info: mean/std_dev of the training history, no accumulators /
+    # Старая информация: mean/std_dev истории обучения, без накопителей
+    with open(tmp_path / 'info' / f'{CITY}_{PARAMETER}_info.json', 'w') as f:
+        json.dump({'mean': float(values[:count].mean()), 'std_dev': float(values[:count].std()),
+                   'denoised_length': DENOISED_LENGTH}, f)
+
+    loads = []
+    load = fine_tune.load_and_prepare_new_data
+
+    def recording_load(city_file, parameter, start_date, end_date, store_dir=None):
+        loads.append((np.datetime64(start_date, 'D').item(), np.datetime64(end_date, 'D').item()))
+        return load(city_file, parameter, start_date, end_date, store_dir)
+
+    monkeypatch.setattr(fine_tune, 'load_and_prepare_new_data', recording_load)
+
+    def run():
+        loads.clear()
+        [job] = fine_tune.collect_update_jobs(str(tmp_path / 'keras'), str(tmp_path / 'info'), str(tmp_path / 'data'),
+                                              statistics_dir=str(tmp_path / 'info_updated'))
+        _, _, model_info = fine_tune.prepare_fine_tune_data(
+            job['city_file'], job['parameter'], job['info_path'], statistics_path=job['statistics_path'])
+        with open(job['statistics_path'], 'w') as f:
+            json.dump(model_info, f)
+        return model_info
+
+    # First run seeds the accumulators from the whole history /
+    # Первый запуск восстанавливает накопители по всей истории
+    write_city(city_file, values[:count + 10])
+    first = run()
+    assert datetime(1900, 1, 1).date() in [start for start, _ in loads]
+    assert first['normalization']['end_date'] == (FIRST_DAY + timedelta(days=count + 9)).isoformat()
+
+    # Second run, 110 days later, reads the window and the gap before it only /
+    # Второй запуск через 110 дней читает только окно и промежуток перед ним
+    write_city(city_file, values)
+    second = run()
+    last_date = FIRST_DAY + timedelta(days=len(values) - 1)
+    window_start = last_date - timedelta(days=fine_tune.FINE_TUNE_WINDOW_DAYS)
+    assert sorted(loads) == [
+        (FIRST_DAY + timedelta(days=count + 10), window_start - timedelta(days=1)),
+        (window_start, last_date)
+    ]
+    assert second['normalization']['end_date'] == last_date.isoformat()
+    assert second['normalization']['count'] == len(values)
+    np.testing.assert_allclose(second['mean'], values.mean())
+    np.testing.assert_allclose(second['std_dev'], values.std())
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import os
+import threading
+
+from forecast_service import ForecastService
+from model_bundle import write_bundle
+from sine_model import NUMBER_OF_SINUSES
+
+
+def write_models(path, mean, mtime_ns):
+    """Two-city bundle with a given mean / Пакет из двух городов с заданным средним"""
+    coefficients = [0.0] * (NUMBER_OF_SINUSES * 3) + [0.5]
+    write_bundle(path, [
+        {'city': city, 'parameter': 'temperature_avg', 'coefficients': coefficients, 'mean': mean,
+         'std_dev': 2.0, 'denoised_length': 100, 'data_end_date': '2024-01-31'}
+        for city in ('Hanoi', 'Paris')
+    ])
+    # Explicit mtimes, a rebuild within the clock resolution is still seen /
+    # Явные mtime, пересборка в пределах разрешения часов все равно видна
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def request(service, bundle='bundle.bin'):
+    body = asyncio.run(service.forecast(bundle, ['Hanoi'], ['temperature_avg'], 0, 3))
+    return json.loads(body)['values'][0][0]
+
+
+def test_rebuilt_bundle_is_not_served_from_the_response_cache(tmp_path):
+    path = str(tmp_path / 'bundle.bin')
+    write_models(path, 10.0, 1_000_000_000)
+    service = ForecastService(str(tmp_path), 'bundle.bin')
+
+    assert request(service) == [11.0] * 3
+    assert request(service) == [11.0] * 3
+    assert service.stats['cache_hits'] == 1
+    _, old_engine = service.engine('bundle.bin')
+
+    write_models(path, 20.0, 2_000_000_000)
+    assert request(service) == [21.0] * 3
+    assert service.stats['computed'] == 2
+    # The replaced engine is closed / Замененный движок закрыт
+    assert old_engine.bundle.records is None
+
+
+def test_engine_in_use_is_closed_after_its_computation(tmp_path):
+    for name in ('a.bin', 'b.bin'):
+        write_models(str(tmp_path / name), 10.0, 1_000_000_000)
+    service = ForecastService(str(tmp_path), 'a.bin', max_models=1)
+
+    started, release = threading.Event(), threading.Event()
+    compute = service._compute
+
+    def blocking_compute(engine, key):
+        if key[0] == 'a.bin':
+            started.set()
+            release.wait(5)
+        return compute(engine, key)
+
+    service._compute = blocking_compute
+
+    async def scenario():
+        slow = asyncio.ensure_future(
+            service.forecast('a.bin', ['Hanoi'], ['temperature_avg'], 0, 3))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        _, engine_a = service.engine('a.bin')
+        # Loading b evicts a while a is still computing /
+        # Загрузка b вытесняет a, пока a еще вычисляется
+        await service.forecast('b.bin', ['Paris'], ['temperature_avg'], 0, 3)
+        assert engine_a.bundle.records is not None
+        release.set()
+        body = await slow
+        assert engine_a.bundle.records is None
+        return json.loads(body)['values'][0][0]
+
+    assert asyncio.run(scenario()) == [11.0] * 3
+
+
+def test_cancelled_request_does_not_strand_identical_requests(tmp_path):
+    write_models(str(tmp_path / 'bundle.bin'), 10.0, 1_000_000_000)
+    service = ForecastService(str(tmp_path), 'bundle.bin')
+
+    started, release = threading.Event(), threading.Event()
+    compute = service._compute
+
+    def blocking_compute(engine, key):
+        started.set()
+        release.wait(5)
+        return compute(engine, key)
+
+    service._compute = blocking_compute
+
+    async def scenario():
+        request = ('bundle.bin', ['Hanoi'], ['temperature_avg'], 0, 3)
+        leader = asyncio.ensure_future(service.forecast(*request))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        follower = asyncio.ensure_future(service.forecast(*request))
+        await asyncio.sleep(0)
+        assert service.stats['coalesced'] == 1
+
+        # The client of the first request goes away / Клиент первого запроса уходит
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        body = await asyncio.wait_for(follower, 5)
+        assert leader.cancelled()
+        assert not service._in_flight
+        return json.loads(body)['values'][0][0]
+
+    assert asyncio.run(scenario()) == [11.0] * 3
+    # The finished answer is cached / Готовый ответ закэширован
+    assert request(service) == [11.0] * 3
+    assert service.stats['cache_hits'] == 1
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from hyperparam_search import grid_trials, prepare_series, random_trials, time_series_folds
+
+
+def test_learning_rate_only_search_space():
+    # Adam betas default when the space leaves them out / Бета Adam по умолчанию, если их нет в пространстве
+    assert grid_trials({'learning_rate': [0.001, 0.01]}) == [{'learning_rate': 0.001}, {'learning_rate': 0.01}]
+    trials = random_trials({'learning_rate': (1e-4, 1e-1, 'log')}, 5, seed=0)
+    assert len(trials) == 5 and all(1e-4 <= trial['learning_rate'] <= 1e-1 for trial in trials)
+    # Still filtered when a beta is given / Фильтруются, если одна из бет задана
+    assert grid_trials({'beta_1': [0.9, 0.9999]}) == [{'beta_1': 0.9}]
+
+
+def test_time_series_folds_expand_and_do_not_overlap():
+    train_masks, val_masks = time_series_folds(100, 3)
+    assert [mask.sum() for mask in train_masks] == [25, 50, 75]
+    assert [mask.sum() for mask in val_masks] == [25, 25, 25]
+    for train_mask, val_mask in zip(train_masks, val_masks):
+        assert np.flatnonzero(train_mask).max() < np.flatnonzero(val_mask).min()
+
+
+def test_prepare_series_uses_population_statistics():
+    values = 10 + 5 * np.sin(np.arange(700) / 30)
+    series = prepare_series(values)
+    assert series['mean'] == pytest.approx(values.mean())
+    assert series['std_dev'] == pytest.approx(values.std())
+    assert series['denoised_length'] == 700 - 700 // 70 + 1
+
+
+def test_search_and_final_training_without_betas():
+    pytest.importorskip('tensorflow')
+    from hyperparam_search import HyperparameterSearch, initial_weights
+
+    x_data = np.arange(240, dtype=np.float64)
+    y_data = np.sin(x_data * 2 * np.pi / 60)
+    kernel, bias = initial_weights(y_data, 2)
+    trials = [{'learning_rate': 0.01}, {'learning_rate': 0.001}]
+    search = HyperparameterSearch(len(trials), cv_folds=2, number_of_sinuses=2, min_epochs=1, max_epochs=2,
+                                  seed=0)
+    best_params, best_mae, table = search.search(x_data, y_data, kernel, bias, trials)
+    assert best_params in trials and np.isfinite(best_mae) and len(table) == 2
+
+    new_kernel, new_bias, losses = search.train_final(x_data, y_data, kernel, bias, best_params, epochs=2)
+    assert np.shape(new_kernel) == np.shape(kernel) and len(losses) == 2
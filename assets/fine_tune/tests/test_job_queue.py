@@ -0,0 +1,112 @@
+import os
+import time
+
+import pytest
+
+from job_queue import FAILED, PENDING, RUNNING, JobQueue, retry_delay
+
+
+def new_queue(tmp_path, max_attempts=3):
+    queue = JobQueue(str(tmp_path / 'queue.sqlite'))
+    queue.add('run', 'city', {'Hanoi': {'models': []}}, max_attempts=max_attempts)
+    return queue
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(tmp_path):
+    with new_queue(tmp_path) as queue:
+        # A negative lease is already expired, as after a crash /
+        # Отрицательная аренда уже истекла, как после падения
+        crashed = queue.claim('run', 'a', lease_seconds=-1.0)
+        assert crashed['attempts'] == 1
+
+        job = queue.claim('run', 'b')
+        assert (job['key'], job['worker'], job['attempts']) == ('Hanoi', 'b', 2)
+        # The old worker can no longer write / Старый процесс больше не может писать
+        assert not queue.save_checkpoint(crashed, {'rows': 1})
+        assert not queue.complete(crashed)
+        assert queue.save_checkpoint(job, {'rows': 1})
+        assert queue.complete(job, {'Hanoi': 'updated'})
+        assert queue.claim('run', 'c') is None
+
+
+def test_expired_lease_without_attempts_left_fails(tmp_path):
+    with new_queue(tmp_path, max_attempts=1) as queue:
+        queue.claim('run', 'a', lease_seconds=-1.0)
+        assert queue.claim('run', 'b') is None
+        [job] = queue.jobs('run', status=FAILED)
+        assert job['error'] == 'lease expired'
+
+
+def test_failed_job_waits_for_its_backoff(tmp_path):
+    with new_queue(tmp_path) as queue:
+        job = queue.claim('run', 'a')
+        before = time.time()
+        assert queue.fail(job, 'timeout') == PENDING
+        [waiting] = queue.jobs('run', status=PENDING)
+        # The first retry waits 15-30 s / Первый повтор ждет 15-30 с
+        assert before + 15.0 <= waiting['not_before'] <= time.time() + 30.0
+        assert queue.claim('run', 'a') is None
+        assert 0.0 < queue.next_wakeup('run') <= 30.0
+
+    for attempt in range(1, 10):
+        longest = min(3600.0, 30.0 * 2 ** (attempt - 1))
+        assert longest / 2 <= retry_delay(attempt) <= longest
+
+
+def test_retry_failed_gives_fresh_attempts(tmp_path):
+    with new_queue(tmp_path, max_attempts=2) as queue:
+        assert queue.fail(queue.claim('run', 'a'), 'timeout', delay=0.0) == PENDING
+        job = queue.claim('run', 'a')
+        assert job['attempts'] == 2
+        assert queue.fail(job, 'timeout', delay=0.0) == FAILED
+        assert queue.claim('run', 'a') is None
+
+        assert queue.retry_failed('run', kind='package') == 0
+        assert queue.retry_failed('run') == 1
+        job = queue.claim('run', 'b')
+        assert (job['status'], job['attempts']) == (RUNNING, 1)
+
+
+def test_fleet_skips_models_the_manifest_records_as_unchanged(tmp_path, monkeypatch):
+    pytest.importorskip('tensorflow')
+    import fine_tune
+    from fleet import DEFAULT_SETTINGS, run_city_job
+
+    for name in ('old.keras', 'old.json'):
+        (tmp_path / name).write_text('weights')
+    (tmp_path / 'Hanoi.csv').write_text('date,temperature_avg\n2024-01-01,20.5\n2024-01-02,21.0\n')
+    model_job = {'city': 'Hanoi', 'parameter': 'temperature', 'city_file': str(tmp_path / 'Hanoi.csv'),
+                 'model_file': 'Hanoi_temperature_avg.keras', 'info_file': 'Hanoi_temperature_avg.json',
+                 'model_path': str(tmp_path / 'old.keras'), 'info_path': str(tmp_path / 'old.json')}
+    settings = dict(DEFAULT_SETTINGS, refresh=False, store_dir=str(tmp_path / 'store'),
+                    data_dir=str(tmp_path), new_model_dir=str(tmp_path / 'tflite'),
+                    new_info_dir=str(tmp_path / 'info'), new_keras_dir=str(tmp_path / 'keras'),
+                    manifest_path=str(tmp_path / 'manifest.json'))
+
+    trained = []
+
+    def fake_fine_tune_model(city_file, parameter, *args, **kwargs):
+        trained.append(parameter)
+        return object(), {}
+
+    def fake_save(model, info, *paths):
+        for path in filter(None, paths):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write('model')
+
+    monkeypatch.setattr(fine_tune, 'fine_tune_model', fake_fine_tune_model)
+    monkeypatch.setattr(fine_tune, 'save_model_artifacts', fake_save)
+    # Outputs are never complete, only the manifest can skip /
+    # Результаты никогда не готовы, пропустить может только манифест
+    monkeypatch.setattr(fine_tune, 'is_job_complete', lambda *args: False)
+
+    with JobQueue(str(tmp_path / 'queue.sqlite')) as queue:
+        queue.add('run1', 'city', {'Hanoi': {'coords': None, 'models': [model_job]}})
+        assert run_city_job(queue, queue.claim('run1', 'a'), settings) == {model_job['model_file']: 'updated'}
+        queue.add('run2', 'city', {'Hanoi': {'coords': None, 'models': [model_job]}})
+        assert run_city_job(queue, queue.claim('run2', 'a'), settings) == {model_job['model_file']: 'unchanged'}
+        queue.add('run3', 'city', {'Hanoi': {'coords': None, 'models': [model_job]}})
+        forced = dict(settings, force=True)
+        assert run_city_job(queue, queue.claim('run3', 'a'), forced) == {model_job['model_file']: 'updated'}
+    assert trained == ['temperature'] * 2
@@ -0,0 +1,62 @@
+import numpy as np
+
+from lstsq_fit import fine_tune_sinusoids, fit_sinusoids, refine, solve_linear
+from sine_model import evaluate_sinusoids, pack_coefficients
+
+N = 730
+# Frequencies on rfft bins of N days, phases in (-pi, pi] /
+# Частоты на бинах rfft для N дней, фазы в (-pi, pi]
+KERNEL = np.array([[3.0, 2 * np.pi * 2 / N, 0.5],
+                   [1.5, 2 * np.pi * 5 / N, -1.2],
+                   [0.8, 2 * np.pi * 30 / N, 2.0],
+                   [0.4, 2 * np.pi * 100 / N, -2.5]])
+BIAS = 0.7
+
+
+def signal(x, kernel=KERNEL, bias=BIAS):
+    return evaluate_sinusoids(pack_coefficients(kernel, bias), x, dtype=np.float64)
+
+
+def by_frequency(kernel):
+    return kernel[np.argsort(kernel[:, 1])]
+
+
+def test_fit_sinusoids_recovers_known_coefficients():
+    x = np.arange(N, dtype=float)
+    kernel, bias = fit_sinusoids(x, signal(x))
+    np.testing.assert_allclose(by_frequency(kernel), KERNEL, rtol=1e-4, atol=1e-5)
+    assert abs(bias - BIAS) < 1e-5
+
+
+def test_solve_linear_recovers_amplitudes_and_phases_of_uneven_samples():
+    x = np.sort(np.random.default_rng(0).uniform(0, N, 200))
+    kernel, bias = solve_linear(x, signal(x), KERNEL[:, 1])
+    np.testing.assert_allclose(kernel, KERNEL, rtol=1e-4, atol=1e-5)
+    assert abs(bias - BIAS) < 1e-5
+
+
+def test_ridge_pulls_toward_the_previous_model():
+    x = np.arange(60, dtype=float)
+    shifted = KERNEL * [1.2, 1.0, 1.0]
+    y = signal(x, shifted, BIAS + 1.0)
+
+    free, free_bias = fine_tune_sinusoids(x, y, KERNEL, BIAS, ridge=0.0)
+    np.testing.assert_allclose(signal(x, free, free_bias), y, atol=1e-3)
+    held, held_bias = fine_tune_sinusoids(x, y, KERNEL, BIAS, ridge=1e6)
+    np.testing.assert_allclose(held, KERNEL, atol=1e-3)
+    assert abs(held_bias - BIAS) < 1e-3
+    # Frequencies are kept either way / Частоты сохраняются в любом случае
+    np.testing.assert_array_equal(free[:, 1], KERNEL[:, 1].astype(np.float32))
+
+
+def test_refine_moves_an_off_bin_frequency_to_the_truth():
+    x = np.arange(N, dtype=float)
+    kernel = KERNEL[:1].copy()
+    kernel[0, 1] = 2 * np.pi / 300
+    y = signal(x, kernel, BIAS)
+
+    start = kernel.copy()
+    start[0, 1] *= 1.02
+    refined, refined_bias = refine(x, y, *solve_linear(x, y, start[:, 1]), steps=20)
+    assert abs(refined[0, 1] - kernel[0, 1]) < 1e-6
+    np.testing.assert_allclose(signal(x, refined, refined_bias), y, atol=1e-3)
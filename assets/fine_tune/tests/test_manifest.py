@@ -0,0 +1,32 @@
+import ast
+import os
+
+from conftest import FINE_TUNE_DIR
+from manifest import CODE_FILES
+
+# Modules imported by fine_tune.py that do not change what a model learns /
+# Модули, импортируемые fine_tune.py, которые не влияют на обучение модели
+NOT_TRAINING = {'instrumentation', 'manifest', 'model_bundle', 'model_archive', 'city_export'}
+
+
+def local_imports(name) -> set:
+    with open(os.path.join(FINE_TUNE_DIR, f'{name}.py'), 'rb') as f:
+        tree = ast.parse(f.read())
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module.split('.')[0])
+    return {name for name in names if os.path.exists(os.path.join(FINE_TUNE_DIR, f'{name}.py'))}
+
+
+def test_code_files_cover_the_training_path():
+    training, pending = set(), ['fine_tune']
+    while pending:
+        name = pending.pop()
+        if name in training or name in NOT_TRAINING:
+            continue
+        training.add(name)
+        pending.extend(local_imports(name))
+    assert {f'{name}.py' for name in training} <= set(CODE_FILES)
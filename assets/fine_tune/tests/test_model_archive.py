@@ -0,0 +1,67 @@
+import json
+import os
+import zipfile
+
+from model_archive import DELTA_MANIFEST, MemberStore, write_archive, write_delta
+
+
+def write_files(directory, files):
+    for name, data in files.items():
+        path = os.path.join(directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+
+def read_zip(path):
+    with zipfile.ZipFile(path) as archive:
+        return {name: archive.read(name) for name in archive.namelist()}
+
+
+def apply_delta(files, delta_path):
+    """Package files after a delta, as a client applies it / Файлы пакета после применения дельты"""
+    delta = read_zip(delta_path)
+    manifest = json.loads(delta.pop(DELTA_MANIFEST))
+    files = {name: data for name, data in files.items() if name not in manifest['removed']}
+    files.update(delta)
+    assert sorted(files) == sorted(manifest['files'])
+    return files
+
+
+def test_archives_are_byte_identical_across_runs(tmp_path):
+    write_files(tmp_path / 'models', {'Hanoi.tflite': b'\x00' * 1000, 'info/Hanoi.json': b'{"mean": 1}'})
+    first = tmp_path / 'first.zip'
+    write_archive(str(first), str(tmp_path / 'models'), MemberStore(str(tmp_path / 'store')))
+
+    # Another store and newer file times / Другое хранилище и более новое время файлов
+    os.utime(tmp_path / 'models' / 'Hanoi.tflite', (2_000_000_000, 2_000_000_000))
+    second = tmp_path / 'second.zip'
+    write_archive(str(second), str(tmp_path / 'models'), MemberStore(str(tmp_path / 'other_store')))
+
+    assert first.read_bytes() == second.read_bytes()
+    assert read_zip(first) == {'Hanoi.tflite': b'\x00' * 1000, 'info/Hanoi.json': b'{"mean": 1}'}
+
+
+def test_delta_holds_only_changes_and_applies_on_the_base(tmp_path):
+    store = MemberStore(str(tmp_path / 'store'))
+    manifest_path = str(tmp_path / 'package_manifest.json')
+    models = tmp_path / 'models'
+    write_files(models, {'Hanoi.tflite': b'hanoi 1', 'Paris.tflite': b'paris 1', 'Rome.tflite': b'rome 1'})
+    base_delta = write_delta({'model': write_archive(str(tmp_path / 'model.zip'), str(models), store)},
+                             store, manifest_path, str(tmp_path))
+    base = apply_delta({}, base_delta)
+
+    write_files(models, {'Paris.tflite': b'paris 2', 'Oslo.tflite': b'oslo 1'})
+    os.remove(models / 'Rome.tflite')
+    delta_path = write_delta({'model': write_archive(str(tmp_path / 'model.zip'), str(models), store)},
+                             store, manifest_path, str(tmp_path))
+
+    delta = read_zip(delta_path)
+    assert sorted(delta) == sorted([DELTA_MANIFEST, 'model/Oslo.tflite', 'model/Paris.tflite'])
+    assert json.loads(delta[DELTA_MANIFEST])['removed'] == ['model/Rome.tflite']
+    full = read_zip(tmp_path / 'model.zip')
+    assert apply_delta(base, delta_path) == {f'model/{name}': data for name, data in full.items()}
+
+    # Nothing changed, no delta / Ничего не изменилось, дельты нет
+    assert write_delta({'model': write_archive(str(tmp_path / 'model.zip'), str(models), store)},
+                       store, manifest_path, str(tmp_path)) is None
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from model_bundle import open_bundle, pack_records, record_dtype, write_bundle
+from sine_model import NUMBER_OF_SINUSES
+
+
+def model(city, parameter, mean=10.0, data_end_date='2024-01-31'):
+    return {'city': city, 'parameter': parameter,
+            'coefficients': np.arange(NUMBER_OF_SINUSES * 3 + 1, dtype=np.float32) / 10,
+            'mean': mean, 'std_dev': 2.0, 'denoised_length': 1500, 'data_end_date': data_end_date}
+
+
+def test_write_and_read_round_trip(tmp_path):
+    models = [model('Paris', 'wind_speed_max', 3.0), model('New York', 'temperature_avg', 12.0),
+              model('Hà Nội', 'humidity_avg', 80.0, None)]
+    path = str(tmp_path / 'bundle.bin')
+    assert write_bundle(path, models) == 3
+
+    with open_bundle(path) as bundle:
+        assert len(bundle) == 3
+        # Records are sorted by key for binary search / Записи отсортированы по ключу для двоичного поиска
+        assert list(bundle.records['key']) == sorted(bundle.records['key'])
+        assert set(bundle.keys()) == {(m['city'], m['parameter']) for m in models}
+        assert ('Hà Nội', 'humidity_avg') in bundle
+        assert ('Hanoi', 'humidity_avg') not in bundle
+
+        record = bundle.get('New York', 'temperature_avg')
+        assert record['mean'] == 12.0 and record['denoised_length'] == 1500
+        np.testing.assert_array_equal(bundle.coefficients('Paris', 'wind_speed_max'), models[0]['coefficients'])
+        assert str(bundle.data_end_date('Paris', 'wind_speed_max')) == '2024-01-31'
+        assert bundle.data_end_date('Hà Nội', 'humidity_avg') is None
+        with pytest.raises(KeyError):
+            bundle.get('Paris', 'humidity_avg')
+
+        indices = bundle.indices(['Paris', 'Nowhere'], ['wind_speed_max', 'temperature_avg'])
+        assert indices[0, 0] == bundle.find('Paris', 'wind_speed_max')
+        assert (indices[0, 1], indices[1, 0], indices[1, 1]) == (-1, -1, -1)
+
+
+def test_over_long_names_are_rejected():
+    city_size = record_dtype()['city'].itemsize
+    # Multi-byte names are measured in UTF-8 bytes / Многобайтовые имена считаются в байтах UTF-8
+    long_city = 'Ж' * (city_size // 2 + 1)
+    with pytest.raises(ValueError, match=long_city):
+        pack_records([model(long_city, 'temperature_avg')])
+    with pytest.raises(ValueError, match='parameter'):
+        pack_records([model('Paris', 'x' * (record_dtype()['parameter'].itemsize + 1))])
+
+    # Names at the limit fit exactly / Имена на границе помещаются точно
+    city = 'Ж' * (city_size // 2)
+    records = pack_records([model(city, 'temperature_avg')])
+    assert records['city'][0].decode('utf-8') == city
@@ -0,0 +1,60 @@
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+
+from response_cache import OBJECTS_DIR, RECENT_TTL_SECONDS, REVISION_DAYS, ResponseCache
+
+URL = 'https://archive-api.open-meteo.com/v1/archive'
+DAY = 24 * 3600
+
+
+def params(lat, end_date):
+    return {'latitude': lat, 'longitude': 105.85, 'daily': ['temperature_2m_mean'],
+            'start_date': '2024-01-01', 'end_date': end_date, 'timezone': 'auto'}
+
+
+def body(value):
+    return json.dumps({'daily': {'time': ['2024-01-01'], 'temperature_2m_mean': [value]}}).encode('utf-8')
+
+
+def noon(day):
+    return datetime.combine(day, datetime.min.time()).timestamp() + DAY / 2
+
+
+def test_final_response_never_expires(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    fetched_at = noon(date(2024, 3, 1))
+    entry = cache.put(params(21.0, '2024-02-01'), URL, body(1.0), fetched_at=fetched_at)
+
+    assert cache.is_final(entry)
+    assert cache.is_fresh(entry, now=fetched_at + 10 * 365 * DAY)
+    # Stored a long time ago and still served / Сохранен давно и все еще отдается
+    assert cache.get(params(21.0, '2024-02-01'), URL) == json.loads(body(1.0))
+
+
+def test_recent_response_expires_after_the_ttl(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    end = date(2024, 3, 1)
+    fetched_at = noon(end + timedelta(days=REVISION_DAYS - 1))
+    entry = cache.put(params(21.0, end.isoformat()), URL, body(1.0), fetched_at=fetched_at)
+
+    assert not cache.is_final(entry)
+    assert cache.is_fresh(entry, now=fetched_at + RECENT_TTL_SECONDS - 1)
+    assert not cache.is_fresh(entry, now=fetched_at + RECENT_TTL_SECONDS + 1)
+    # Expired, but offline rebuilds may still use it /
+    # Устарел, но пересборка без сети еще может его использовать
+    assert cache.get(params(21.0, end.isoformat()), URL) is None
+    assert cache.get(params(21.0, end.isoformat()), URL, allow_stale=True) == json.loads(body(1.0))
+
+
+def test_identical_bodies_share_one_object(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    first = cache.put(params(21.0, '2024-02-01'), URL, body(1.0), fetched_at=time.time())
+    second = cache.put(params(48.85, '2024-02-01'), URL, body(1.0), fetched_at=time.time())
+    other = cache.put(params(48.85, '2024-02-02'), URL, body(2.0), fetched_at=time.time())
+
+    assert first['object'] == second['object'] != other['object']
+    objects = [name for _, _, names in os.walk(tmp_path / OBJECTS_DIR) for name in names]
+    assert sorted(objects) == sorted({f"{first['object']}.json.gz", f"{other['object']}.json.gz"})
+    assert len(list(cache.entries())) == 3
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow')
+
+from sin_trainer import MAX_SAMPLES, SinTrainer, get_trainer
+from sine_model import NUMBER_OF_SINUSES, evaluate_sinusoids, pack_coefficients
+
+KERNEL = np.tile([[0.5, 0.0172, 0.0]], (NUMBER_OF_SINUSES, 1)).astype(np.float32)
+
+
+def series(length):
+    x = np.arange(length, dtype=np.float32)
+    return x, 2.0 * np.sin(0.0172 * x) + 0.3
+
+
+def test_one_trace_for_every_size_and_setting():
+    trainer = SinTrainer(max_samples=MAX_SAMPLES)
+    for length, batch_size, epochs in ((8, 4, 3), (20, 10, 5), (32, 16, 2), (MAX_SAMPLES, 16, 4)):
+        trainer.fit(*series(length), KERNEL, 0.0, epochs=epochs, batch_size=batch_size, patience=100)
+    trainer.fit(*series(20), KERNEL, 0.0, learning_rate=0.01, beta_1=0.8, seed=3)
+    assert trainer.trace_count == 1
+
+
+def test_shared_trainers_are_bucketed_by_size():
+    assert get_trainer(samples=10) is get_trainer(samples=MAX_SAMPLES)
+    large = get_trainer(samples=MAX_SAMPLES + 1)
+    assert large.max_samples == 2 * MAX_SAMPLES and large is get_trainer(samples=2 * MAX_SAMPLES)
+    with pytest.raises(ValueError):
+        get_trainer(samples=10).fit(*series(MAX_SAMPLES + 1), KERNEL, 0.0)
+
+
+def test_fit_reduces_the_loss_and_is_seeded():
+    x, y = series(32)
+    trainer = SinTrainer()
+    # Validation loss of the starting weights / Потеря на валидации начальных весов
+    start_loss = np.mean((evaluate_sinusoids(pack_coefficients(KERNEL, 0.0), x) - y)[int(32 * 0.8):] ** 2)
+    kernel, bias, best_loss, epochs_run = trainer.fit(x, y, KERNEL, 0.0, batch_size=16, learning_rate=0.01)
+    assert best_loss < start_loss and 1 <= epochs_run <= 50
+
+    again = trainer.fit(x, y, KERNEL, 0.0, batch_size=16, learning_rate=0.01)
+    np.testing.assert_array_equal(again[0], kernel)
+    assert again[1] == bias
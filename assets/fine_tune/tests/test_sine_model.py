@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from sine_model import (NUMBER_OF_SINUSES, evaluate_sinusoids, evaluate_sinusoids_per_model, pack_coefficients,
+                        unpack_coefficients)
+
+KERNEL = np.array([[2.0, 0.0172, 0.3], [0.5, 0.0344, -1.0], [0.25, 0.2, 2.0], [0.1, 1.5, 0.0]], dtype=np.float32)
+BIAS = np.float32(0.75)
+
+
+def test_pack_round_trip():
+    kernel, bias = unpack_coefficients(pack_coefficients(KERNEL, BIAS))
+    np.testing.assert_array_equal(kernel, KERNEL)
+    assert bias == BIAS
+
+
+def test_numpy_evaluator_matches_sin_layer():
+    pytest.importorskip('tensorflow')
+    from fine_tune import SinLayer
+
+    layer = SinLayer(NUMBER_OF_SINUSES)
+    layer.build((None, 1))
+    layer.set_weights([KERNEL, BIAS])
+    days = np.arange(-400, 400, 7, dtype=np.float32)
+
+    expected = layer(days[:, None]).numpy()[:, 0]
+    np.testing.assert_allclose(evaluate_sinusoids(pack_coefficients(KERNEL, BIAS), days), expected,
+                               rtol=1e-5, atol=1e-5)
+
+
+def test_stacked_models_match_one_at_a_time():
+    coefficients = np.stack([pack_coefficients(KERNEL * scale, BIAS + scale) for scale in (0.5, 1.0, 2.0)])
+    days = np.arange(30, dtype=np.float32).reshape(5, 6)
+
+    stacked = evaluate_sinusoids(coefficients, days)
+    assert stacked.shape == (3, 5, 6)
+    for i, model in enumerate(coefficients):
+        np.testing.assert_array_equal(stacked[i], evaluate_sinusoids(model, days))
+
+    per_model = evaluate_sinusoids_per_model(coefficients, days[:3])
+    for i, model in enumerate(coefficients):
+        np.testing.assert_allclose(per_model[i], evaluate_sinusoids(model, days[i]), rtol=1e-6)
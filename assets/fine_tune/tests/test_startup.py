@@ -0,0 +1,140 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+
+import pytest
+
+from check_startup import BUDGET_SECONDS
+from conftest import FINE_TUNE_DIR
+from downloader import ARCHIVE_URL, DAILY_VARIABLES
+from model_bundle import write_bundle
+from response_cache import ResponseCache
+from sine_model import NUMBER_OF_SINUSES
+
+CITIES = {'Hanoi': [21.0285, 105.8542], 'Paris': [48.8566, 2.3522]}
+FIRST_DAY, LAST_DAY = date(2023, 11, 1), date(2024, 2, 29)
+HEAVY = ('tensorflow', 'keras')
+ASSETS_DIR = os.path.dirname(FINE_TUNE_DIR)
+
+# Runs one cli.py command in a fresh interpreter and reports what it imported /
+# Выполняет одну команду cli.py в новом интерпретаторе и сообщает, что она импортировала
+RUNNER = """
+import json, sys
+sys.path.insert(0, sys.argv[1])
+import cli
+cli.main(sys.argv[2:])
+print(json.dumps(sorted(name for name in sys.modules if '.' not in name)))
+"""
+
+
+# Runs one cli.py command with its first file-system step replaced by a stub
+# that prints the paths it got / Выполняет одну команду cli.py, заменив ее
+# первый шаг с файлами заглушкой, которая печатает полученные пути
+PATHS_RUNNER = """
+import importlib, json, sys
+sys.path.insert(0, sys.argv[1])
+import cli
+
+class Stop(Exception):
+    pass
+
+def stub(*paths):
+    print(json.dumps(paths))
+    raise Stop
+
+module = importlib.import_module(cli.COMMANDS[sys.argv[2]][0])
+for name in ('build_store', 'JobQueue'):
+    if hasattr(module, name):
+        setattr(module, name, stub)
+import weather_store
+weather_store.build_store = stub
+try:
+    cli.main(sys.argv[2:])
+except Stop:
+    pass
+"""
+
+
+@pytest.fixture(scope='module')
+def workspace(tmp_path_factory):
+    """Bundle, coordinates and cached API responses / Пакет, координаты и кэш ответов API"""
+    work_dir = tmp_path_factory.mktemp('startup')
+    coefficients = [0.5, 0.0172, 0.0] * NUMBER_OF_SINUSES + [0.1]
+    write_bundle(str(work_dir / 'bundle.bin'), [
+        {'city': city, 'parameter': parameter, 'coefficients': coefficients, 'mean': 10.0, 'std_dev': 2.0,
+         'denoised_length': 1500, 'data_end_date': '2023-12-31'}
+        for city in CITIES for parameter in DAILY_VARIABLES
+    ])
+    with open(work_dir / 'city_coords.json', 'w') as f:
+        json.dump(CITIES, f)
+
+    days = [(FIRST_DAY + timedelta(days=i)).isoformat() for i in range((LAST_DAY - FIRST_DAY).days + 1)]
+    cache = ResponseCache(str(work_dir / 'cache'))
+    for lat, lon in CITIES.values():
+        daily = {'time': days}
+        for index, variable in enumerate(DAILY_VARIABLES.values()):
+            daily[variable] = [round(10 + index + i % 9 / 3, 1) for i in range(len(days))]
+        params = {'latitude': lat, 'longitude': lon, 'start_date': FIRST_DAY.isoformat(),
+                  'end_date': LAST_DAY.isoformat(), 'daily': list(DAILY_VARIABLES.values()), 'timezone': 'auto'}
+        cache.put(params, ARCHIVE_URL, json.dumps({'daily': daily}).encode('utf-8'))
+    return work_dir
+
+
+def run_cli(*argv):
+    """(seconds, stdout lines, imported top-level modules) / (секунды, строки вывода, модули)"""
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', RUNNER, FINE_TUNE_DIR, *argv], cwd=FINE_TUNE_DIR,
+                               check=True, capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    lines = completed.stdout.splitlines()
+    return seconds, lines[:-1], set(json.loads(lines[-1]))
+
+
+def best_run(*argv, repeat=3):
+    """Best-of-repeat, as check_startup measures / Лучшее из повторов, как в check_startup"""
+    return min((run_cli(*argv) for _ in range(repeat)), key=lambda run: run[0])
+
+
+def test_forecast_from_a_bundle(workspace):
+    seconds, lines, modules = best_run('forecast', '--bundle', str(workspace / 'bundle.bin'),
+                                       '--city', 'Hanoi', '--city', 'Paris', '--json')
+    values = json.loads(lines[-1])['values']
+    assert len(values) == 2 and len(values[0]) == len(DAILY_VARIABLES) and len(values[0][0]) == 7
+    assert not modules & set(HEAVY)
+    assert seconds < BUDGET_SECONDS
+
+
+def test_data_commands_on_cached_responses_and_csv(workspace):
+    data_dir = workspace / 'or_cities'
+    seconds, _, modules = best_run('refresh', '--offline', '--coords', str(workspace / 'city_coords.json'),
+                                   '--cache-dir', str(workspace / 'cache'), '--data-dir', str(data_dir))
+    with open(data_dir / 'Hanoi.csv') as f:
+        assert len(f.readlines()) == (LAST_DAY - FIRST_DAY).days + 2
+    assert not modules & set(HEAVY)
+    assert seconds < BUDGET_SECONDS
+
+    # Backtest of the bundle against the rebuilt CSVs / Бэктест пакета по пересобранным CSV
+    seconds, lines, modules = best_run('backtest', '--models', f"bundle={workspace / 'bundle.bin'}",
+                                       '--data-dir', str(data_dir), '--store-dir', str(workspace / 'store'),
+                                       '--horizons', '1,7', '--start', '2024-01-01', '--end', '2024-02-15')
+    assert any('Hanoi' in line for line in lines)
+    assert not modules & set(HEAVY)
+    assert seconds < BUDGET_SECONDS
+
+
+@pytest.mark.parametrize('argv, expected', [
+    (['fine-tune'], [os.path.join(ASSETS_DIR, 'or_cities'), os.path.join(ASSETS_DIR, 'weather_store')]),
+    (['train'], [os.path.join(ASSETS_DIR, 'or_cities'), os.path.join(ASSETS_DIR, 'weather_store')]),
+    (['backtest', '--models', f"base={os.path.join(FINE_TUNE_DIR, 'model_keras')}"],
+     [os.path.join(ASSETS_DIR, 'or_cities'), os.path.join(ASSETS_DIR, 'weather_store')]),
+    (['fleet', 'status'], [os.path.join(FINE_TUNE_DIR, 'fleet_queue.sqlite')]),
+])
+def test_default_paths_do_not_depend_on_the_current_directory(tmp_path, argv, expected):
+    completed = subprocess.run([sys.executable, '-c', PATHS_RUNNER, FINE_TUNE_DIR, *argv], cwd=str(tmp_path),
+                               check=True, capture_output=True, text=True)
+    assert json.loads(completed.stdout.splitlines()[-1]) == expected
+    # Nothing was created next to the caller / Рядом с вызывающим ничего не создано
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,45 @@
+import numpy as np
+
+from day_index import days_since_zero_date
+from weather_store import build_city, is_stale, open_city
+
+ROWS = ['date,temperature_avg,humidity_avg',
+        '2020-01-03,3.5,30',
+        '2020-01-01,1.5,10',
+        '2020-01-02,2.5,20',
+        '2020-01-05,5.5,50']
+
+
+def write_csv(path, rows=ROWS):
+    path.write_text('\n'.join(rows) + '\n')
+    return str(path)
+
+
+def test_get_slices_an_inclusive_day_range(tmp_path):
+    build_city(write_csv(tmp_path / 'Hanoi.csv'), str(tmp_path / 'store'))
+    city = open_city(str(tmp_path / 'store'), 'Hanoi')
+
+    # Rows come back sorted by day / Строки возвращаются отсортированными по дням
+    days, values = city.get('temperature_avg')
+    assert days.tolist() == [0, 1, 2, 4] and values.tolist() == [1.5, 2.5, 3.5, 5.5]
+    assert city.last_day() == days_since_zero_date(['2020-01-05'])[0]
+
+    days, values = city.get('humidity_avg', 1, 4)
+    assert days.tolist() == [1, 2, 4] and values.tolist() == [20.0, 30.0, 50.0]
+    # A missing day inside the range is skipped, not filled /
+    # Пропущенный день внутри диапазона пропускается, а не заполняется
+    assert city.get('temperature_avg', 3, 3)[0].size == 0
+    assert city.get('temperature_avg', 2, None)[1].tolist() == [3.5, 5.5]
+    assert isinstance(values, np.memmap)
+
+
+def test_store_is_stale_after_the_csv_changes(tmp_path):
+    csv_path = write_csv(tmp_path / 'Hanoi.csv')
+    assert is_stale(csv_path, str(tmp_path / 'store'))
+    build_city(csv_path, str(tmp_path / 'store'))
+    assert not is_stale(csv_path, str(tmp_path / 'store'))
+
+    write_csv(tmp_path / 'Hanoi.csv', ROWS + ['2020-01-06,6.5,60'])
+    assert is_stale(csv_path, str(tmp_path / 'store'))
+    build_city(csv_path, str(tmp_path / 'store'))
+    assert open_city(str(tmp_path / 'store'), 'Hanoi').get('temperature_avg', 5)[1].tolist() == [6.5]
@@ -0,0 +1,144 @@
+import json
+import os
+
+import numpy as np
+
+from city_csv import CSV_COLUMNS
+from day_index import days_since_zero_date
+
+# Float columns stored per city / Колонки float, хранимые для каждого города
+VALUE_COLUMNS = CSV_COLUMNS[1:]
+DAYS_FILE = 'days.npy'
+META_FILE = 'meta.json'
+
+
+def _source_signature(csv_path):
+    stat = os.stat(csv_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _save_array(path, array):
+    tmp_path = path + '.tmp.npy'
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+def build_city(csv_path, store_dir, city=None):
+    """
+    Convert one city CSV into int32 day-index + float32 value columns /
+    Преобразовать CSV города в колонки int32 индекса дня и float32 значений
+    """
+    import pandas as pd
+
+    if city is None:
+        city = os.path.basename(csv_path).replace('.csv', '')
+    city_dir = os.path.join(store_dir, city)
+    os.makedirs(city_dir, exist_ok=True)
+
+    df = pd.read_csv(csv_path)
+    all_days = days_since_zero_date(df['date'])
+    order = np.argsort(all_days, kind='stable')
+    days = all_days[order].astype(np.int32)
+
+    # Meta is written last so a half-built city is seen as stale /
+    # Meta записывается последней, поэтому недостроенный город считается устаревшим
+    meta_path = os.path.join(city_dir, META_FILE)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    _save_array(os.path.join(city_dir, DAYS_FILE), days)
+    columns = []
+    for column in VALUE_COLUMNS:
+        if column in df.columns:
+            values = pd.to_numeric(df[column], errors='coerce').values.astype(np.float32)[order]
+            _save_array(os.path.join(city_dir, f'{column}.npy'), values)
+            columns.append(column)
+
+    meta = {
+        'city': city,
+        'columns': columns,
+        'rows': int(len(days)),
+        'source': _source_signature(csv_path)
+    }
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+    return city_dir
+
+
+def is_stale(csv_path, store_dir, city=None):
+    """Whether the stored city is missing or older than its CSV / Устарел ли сохраненный город"""
+    if city is None:
+        city = os.path.basename(csv_path).replace('.csv', '')
+    meta_path = os.path.join(store_dir, city, META_FILE)
+    if not os.path.exists(meta_path):
+        return True
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+    return meta.get('source') != _source_signature(csv_path)
+
+
+def build_store(csv_dir, store_dir, force=False):
+    """
+    Build (or refresh stale cities of) the store from all CSVs in csv_dir /
+    Построить хранилище (или обновить устаревшие города) из всех CSV в csv_dir
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    rebuilt = []
+    for file_name in sorted(os.listdir(csv_dir)):
+        if not file_name.endswith('.csv'):
+            continue
+        csv_path = os.path.join(csv_dir, file_name)
+        if force or is_stale(csv_path, store_dir):
+            build_city(csv_path, store_dir)
+            rebuilt.append(file_name.replace('.csv', ''))
+    if rebuilt:
+        print(f"Weather store updated for {len(rebuilt)} cities in {store_dir}")
+    return rebuilt
+
+
+class CityStore:
+    """
+    Memory-mapped columns of one city / Колонки одного города, отображенные в память
+    """
+
+    def __init__(self, store_dir, city) -> None:
+        self.city = city
+        self.city_dir = os.path.join(store_dir, city)
+        with open(os.path.join(self.city_dir, META_FILE), 'r') as f:
+            self.meta = json.load(f)
+        self.days: np.ndarray = np.load(os.path.join(self.city_dir, DAYS_FILE), mmap_mode='r')
+        self._columns = {}
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def column(self, name) -> np.ndarray:
+        if name not in self._columns:
+            if name not in self.meta['columns']:
+                raise KeyError(f"Column {name} not found in store for {self.city}")
+            self._columns[name] = np.load(os.path.join(self.city_dir, f'{name}.npy'), mmap_mode='r')
+        return self._columns[name]
+
+    def last_day(self):
+        return int(self.days[-1]) if len(self.days) else None
+
+    def day_range(self, start_day, end_day) -> slice:
+        """Row slice for start_day <= day <= end_day / Срез строк для start_day <= day <= end_day"""
+        start = int(np.searchsorted(self.days, start_day, side='left'))
+        end = int(np.searchsorted(self.days, end_day, side='right'))
+        return slice(start, end)
+
+    def get(self, name, start_day=None, end_day=None):
+        """
+        Day indices and values of one column within a day range, without copying /
+        Индексы дней и значения одной колонки в диапазоне дней, без копирования
+        """
+        rows = self.day_range(
+            self.days[0] if start_day is None else start_day,
+            self.days[-1] if end_day is None else end_day
+        ) if len(self.days) else slice(0, 0)
+        return self.days[rows], self.column(name)[rows]
+
+
+def open_city(store_dir, city) -> CityStore:
+    return CityStore(store_dir, city)
@@ -1,53 +1,62 @@
-import requests
-import pandas as pd
-import time
-from datetime import datetime
 import json
-
-def get_weather_history(lat, lon, start_year=2020, end_year=2025):
-    base_url = "https://archive-api.open-meteo.com/v1/archive"
-
-    today = f"2025-05-29" #datetime.today().strftime("%Y-%m-%d")
-    dfs = []
-
-    for year in range(start_year, end_year + 1):
-        end_date = f"{year}-12-31"
-        if year == end_year:
-            end_date = today
-
-        params = {
-            "latitude": lat,
-            "longitude": lon,
-            "start_date": f"{year}-01-01",
-            "end_date": end_date,
-            "daily": ["temperature_2m_mean", "relative_humidity_2m_mean", "wind_speed_10m_max"],
-            "timezone": "auto"
-        }
-        response = requests.get(base_url, params=params)
-
-        if response.status_code == 200:
-            data = response.json()
-            df = pd.DataFrame({
-                "date": data["daily"]["time"],
-                "temperature_avg": data["daily"]["temperature_2m_mean"],
-                "humidity_avg": data["daily"]["relative_humidity_2m_mean"],
-                "wind_speed_max": data["daily"]["wind_speed_10m_max"]
-            })
-            dfs.append(df)
-        else:
-            print(f"Error for {year}: {response.status_code}")
-
-    # Gộp tất cả dữ liệu lại thành một DataFrame
-    weather_df = pd.concat(dfs, ignore_index=True)
-    return weather_df
-
-with open('city_coords.json', 'r') as f:
-    city_coords = json.load(f)
-
-for city in city_coords:
-    latitude, longitude = city_coords[city]
-    weather_data = get_weather_history(latitude, longitude)
-    print(f"{city}: Latitude: {latitude}, Longitude: {longitude}")
-    time.sleep(0.2)
-    weather_data.to_csv(f"or_cities/{city}.csv", index=False)
-
+import os
+import sys
+
+ASSETS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ASSETS_DIR, 'fine_tune'))
+
+START_DATE = "2020-01-01"
+END_DATE = "2025-05-29"  # datetime.today().strftime("%Y-%m-%d")
+# Raw API responses for offline rebuilds / Сырые ответы API для пересборки без сети
+CACHE_DIR = os.path.join(ASSETS_DIR, 'response_cache')
+
+
+def fetch(start_date=START_DATE, end_date=END_DATE, output_dir=None, coords_path=None,
+          max_workers=4, requests_per_second=5.0, cache_dir=CACHE_DIR, offline=False):
+    """
+    Download the whole range of every city into or_cities; offline=True
+    rebuilds the CSVs from the response cache without the API /
+    Загрузить весь диапазон каждого города в or_cities; offline=True
+    пересобирает CSV из кэша ответов без обращения к API
+
+    Paths default to the assets directory, not the current one /
+    Пути по умолчанию берутся от директории assets, а не от текущей
+    """
+    from downloader import download_cities, rebuild_cities
+    from response_cache import ResponseCache
+
+    with open(coords_path or os.path.join(ASSETS_DIR, 'city_coords.json'), 'r') as f:
+        city_coords = json.load(f)
+    output_dir = output_dir or os.path.join(ASSETS_DIR, 'or_cities')
+    cache = ResponseCache(cache_dir) if cache_dir else None
+
+    if offline:
+        return rebuild_cities(city_coords, cache, output_dir, start_date, end_date)
+
+    # Whole 2020-2025 range per city in one request, several cities at a time /
+    # Весь диапазон 2020-2025 одним запросом на город, несколько городов параллельно
+    return download_cities(city_coords, output_dir, start_date, end_date, max_workers=max_workers,
+                           requests_per_second=requests_per_second, cache=cache)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Download city history / Загрузить историю городов")
+    parser.add_argument('--start', default=START_DATE)
+    parser.add_argument('--end', default=END_DATE)
+    parser.add_argument('--output-dir', default=None)
+    parser.add_argument('--coords', default=None, help="city_coords.json path / путь к city_coords.json")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests-per-second', type=float, default=5.0)
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help="empty to disable / пусто, чтобы отключить")
+    parser.add_argument('--offline', action='store_true',
+                        help="rebuild CSVs from the cache only / пересобрать CSV только из кэша")
+    args = parser.parse_args(argv)
+
+    fetch(args.start, args.end, args.output_dir, args.coords, args.workers, args.requests_per_second,
+          args.cache_dir, args.offline)
+
+
+if __name__ == "__main__":
+    main()